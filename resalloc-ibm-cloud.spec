@@ -16,6 +16,7 @@ Source0:        %{url}/archive/refs/tags/%{name}-%{version}.tar.gz
 BuildArch:      noarch
 
 Requires:       resalloc-helpers
+Recommends:     python3-orjson
 BuildRequires:  python3-devel
 BuildRequires:  pyproject-rpm-macros
 
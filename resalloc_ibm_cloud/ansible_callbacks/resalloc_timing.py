@@ -0,0 +1,93 @@
+"""
+Ansible callback plugin recording the per-task and per-host durations and
+results of the provisioning playbook into a JSON file.  Enabled by
+resalloc_ibm_cloud.helpers.run_playbook(), not meant to be imported.
+"""
+
+# pylint: disable=protected-access
+
+import json
+import os
+import tempfile
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = """
+    name: resalloc_timing
+    type: aggregate
+    short_description: Record task timing into $RESALLOC_IBM_CLOUD_TIMING_FILE
+    requirements:
+      - enable in configuration
+"""
+
+
+class CallbackModule(CallbackBase):
+    """
+    Write {"duration": seconds, "tasks": [{"name", "path", "duration",
+    "hosts": {host: {"status", "duration"}}}, ...]} when the playbook ends.
+    """
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = "aggregate"
+    CALLBACK_NAME = "resalloc_timing"
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.output = os.environ.get("RESALLOC_IBM_CLOUD_TIMING_FILE")
+        self.start = time.time()
+        self.tasks = {}
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.tasks[task._uuid] = {
+            "name": task.get_name(),
+            "path": task.get_path(),
+            "start": time.time(),
+            "hosts": {},
+        }
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.v2_playbook_on_task_start(task, False)
+
+    def _record(self, result, status):
+        task = self.tasks.get(result._task._uuid)
+        if task is None:
+            return
+        task["hosts"][result._host.get_name()] = {
+            "status": status,
+            "duration": round(time.time() - task["start"], 3),
+        }
+
+    def v2_runner_on_ok(self, result):
+        self._record(result, "changed" if result._result.get("changed") else "ok")
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result, "ignored" if ignore_errors else "failed")
+
+    def v2_runner_on_skipped(self, result):
+        self._record(result, "skipped")
+
+    def v2_runner_on_unreachable(self, result):
+        self._record(result, "unreachable")
+
+    def v2_playbook_on_stats(self, stats):
+        if not self.output:
+            return
+        tasks = []
+        for task in self.tasks.values():
+            durations = [host["duration"] for host in task["hosts"].values()]
+            tasks.append({
+                "name": task["name"],
+                "path": task["path"],
+                "duration": max(durations, default=0),
+                "hosts": task["hosts"],
+            })
+        data = {"duration": round(time.time() - self.start, 3), "tasks": tasks}
+
+        directory = os.path.dirname(os.path.abspath(self.output))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+            json.dump(data, tmp, indent=1)
+        os.replace(tmp_path, self.output)
@@ -0,0 +1,175 @@
+"""
+Python API for the resalloc-ibm-cloud functionality.  Unlike the command-line
+utilities, this doesn't parse sys.argv, print to stdout or exit.  The cloud
+objects keep their authenticated clients, so one process can run many
+operations (even concurrently, in threads) without re-authenticating.
+
+    cloud = VPCCloud(api_key, region="us-east")
+    result = cloud.create("copr_builder_1", playbook=..., image_uuid=..., ...)
+    print(result.ip_address)
+"""
+
+from argparse import Namespace
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from resalloc_ibm_cloud.argparsers import powervs_arg_parser, vm_arg_parser
+from resalloc_ibm_cloud.deadline import deadline_scope
+from resalloc_ibm_cloud.exceptions import ResallocIBMCloudException
+from resalloc_ibm_cloud.hedging import HedgingPolicy
+from resalloc_ibm_cloud.helpers import get_region_service
+from resalloc_ibm_cloud.ibm_cloud_list_vms import list_pool_resources
+from resalloc_ibm_cloud.ibm_cloud_vm import create_vm, delete_vm
+from resalloc_ibm_cloud.powervs.client import PowerVSClient
+from resalloc_ibm_cloud.powervs.credentials import create_powervs_credentials
+from resalloc_ibm_cloud.powervs.powervs_list_vms import (
+    list_pool_resources as powervs_list_pool_resources,
+)
+from resalloc_ibm_cloud.powervs.powervs_vm import PowerVSVMManager, start_vm
+from resalloc_ibm_cloud.state import default_state_dir
+
+
+@dataclass
+class CreateResult:
+    """Result of the create() call"""
+
+    name: str
+    ip_address: str
+
+
+@dataclass
+class DeleteResult:
+    """Result of the delete() call"""
+
+    name: str
+
+
+@dataclass
+class PoolListing:
+    """Result of the list_pool() call"""
+
+    pool_id: str
+    names: set[str]
+
+
+def _options(parser_factory: Callable, global_args: list[str], subcommand: str,
+             positional: list[str], options: dict) -> Namespace:
+    """
+    Construct the options namespace exactly as the command-line utility would,
+    so the defaults, types and choices are the same.  Keyword OPTIONS map to
+    the --long-options; True means a flag, lists mean multiple values, and
+    lists of tuples mean a repeated option.
+    """
+    argv = ["--token-file", "-"] + global_args + [subcommand] + positional
+    for key, value in options.items():
+        if value is None or value is False:
+            continue
+        flag = "--" + key.replace("_", "-")
+        if value is True:
+            argv.append(flag)
+        elif isinstance(value, (list, tuple, set)):
+            items = list(value)
+            if items and isinstance(items[0], (list, tuple)):
+                for item in items:
+                    argv += [flag] + [str(v) for v in item]
+            else:
+                argv += [flag] + [str(v) for v in items]
+        else:
+            argv += [flag, str(value)]
+
+    try:
+        return parser_factory().parse_args(argv)
+    except SystemExit as exc:
+        raise ResallocIBMCloudException(f"Invalid options: {argv}") from exc
+
+
+class VPCCloud:
+    """
+    Operations on VPC instances within one IBM Cloud region
+    """
+
+    def __init__(self, api_key: str, region: str, state_dir: Optional[str] = None,
+                 hedging: Optional[HedgingPolicy] = None):
+        self.region = region
+        self.state_dir = state_dir or default_state_dir()
+        self.service = get_region_service(api_key, region, hedging)
+
+    def _options(self, subcommand: str, name: str, options: dict) -> Namespace:
+        return _options(vm_arg_parser,
+                        ["--region", self.region, "--state-dir", self.state_dir],
+                        subcommand, [name], options)
+
+    def create(self, name: str, *, playbook: str, image_uuid: str, vpc_id: str,
+               security_group_id: str, ssh_key_id: str, instance_type: str,
+               subnets_ids: list[str], **options: Any) -> CreateResult:
+        """
+        Start and provision the VM NAME.  The OPTIONS are the optional
+        "resalloc-ibm-cloud-vm create" options, e.g. tags=["app:copr"].
+        """
+        options.update(playbook=playbook, image_uuid=image_uuid, vpc_id=vpc_id,
+                       security_group_id=security_group_id, ssh_key_id=ssh_key_id,
+                       instance_type=instance_type, subnets_ids=subnets_ids)
+        opts = self._options("create", name, options)
+        with deadline_scope(opts.deadline):
+            return CreateResult(name=name, ip_address=create_vm(self.service, opts))
+
+    def delete(self, name: str) -> DeleteResult:
+        """
+        Delete the VM NAME, including its resources
+        """
+        opts = self._options("delete", name, {})
+        with deadline_scope(opts.deadline):
+            delete_vm(self.service, opts)
+        return DeleteResult(name=name)
+
+    def list_pool(self, pool_id: str) -> PoolListing:
+        """
+        List the resalloc names of the resources in the pool
+        """
+        return PoolListing(pool_id=pool_id,
+                           names=list_pool_resources(self.service, pool_id))
+
+
+class PowerVSCloud:
+    """
+    Operations on instances within one PowerVS workspace
+    """
+
+    def __init__(self, api_key: str, crn: str, state_dir: Optional[str] = None,
+                 hedging: Optional[HedgingPolicy] = None):
+        self.crn = crn
+        self.state_dir = state_dir or default_state_dir()
+        self.client = PowerVSClient(create_powervs_credentials(api_key, crn), hedging)
+        self.vm_manager = PowerVSVMManager(self.client)
+
+    def _options(self, subcommand: str, name: str, options: dict) -> Namespace:
+        return _options(powervs_arg_parser,
+                        ["--crn", self.crn, "--state-dir", self.state_dir],
+                        subcommand, [name], options)
+
+    def create(self, name: str, *, playbook: str, image_uuid: str,
+               ssh_key_name: str, processors: float, ram: float,
+               **options: Any) -> CreateResult:
+        """
+        Start and provision the instance NAME.  The OPTIONS are the optional
+        "resalloc-ibm-cloud-powervs-vm create" options, e.g. storage_pool="x".
+        """
+        options.update(playbook=playbook, image_uuid=image_uuid,
+                       ssh_key_name=ssh_key_name, processors=processors, ram=ram)
+        opts = self._options("create", name, options)
+        with deadline_scope(opts.deadline):
+            return CreateResult(name=name, ip_address=start_vm(self.vm_manager, opts))
+
+    def delete(self, name: str) -> DeleteResult:
+        """
+        Delete the instance NAME, including its volumes
+        """
+        self.vm_manager.delete_vm(name)
+        return DeleteResult(name=name)
+
+    def list_pool(self, pool_id: str) -> PoolListing:
+        """
+        List the resalloc names of the resources in the pool
+        """
+        return PoolListing(pool_id=pool_id,
+                           names=powervs_list_pool_resources(self.client, pool_id))
@@ -5,6 +5,13 @@ ArgumentParser getters on one place, this simplifies generating manual pages.
 import argparse
 import sys
 
+from resalloc_ibm_cloud.constants import (
+    DEFAULT_READY_WHEN,
+    WATCH_MAX_INTERVAL,
+    WATCH_MIN_INTERVAL,
+)
+from resalloc_ibm_cloud.state import default_state_dir
+
 if 313 > sys.version_info.major * 100 + sys.version_info.minor:
     DEPRECATED_OPTION = {}
 else:
@@ -25,25 +32,70 @@ def _default_arg_parser(prog=None):
         "--token-file", help="Path to IBM cloud token file", required=True
     )
     parser.add_argument("--log-level", default="info")
+    parser.add_argument(
+        "--state-dir",
+        default=default_state_dir(),
+        help=(
+            "Directory for the local state files (caches, statistics) shared "
+            "by concurrently running utilities, default: "
+            "$XDG_CACHE_HOME/resalloc-ibm-cloud"
+        ),
+    )
+    parser.add_argument(
+        "--hedge-requests",
+        action="store_true",
+        help=(
+            "When a GET request to the IBM Cloud API takes longer than usual "
+            "(see the latency statistics in --state-dir), send it once more "
+            "and use the first response"
+        ),
+    )
     return parser
 
 
-def _default_arg_parser_vpc(prog=None):
+def _default_arg_parser_vpc(prog=None, multiple_regions=False):
     parser = _default_arg_parser(prog=prog)
-    parser.add_argument(
+    region_help = "default IBM Cloud zone. e.g. jp-tok, us-east, us-west, ..."
+    region_kwargs = {}
+    if multiple_regions:
+        region_help = (
+            "Space separated list of IBM Cloud regions, e.g. jp-tok us-east. "
+            "The regions are queried concurrently."
+        )
+        region_kwargs["nargs"] = "+"
+
+    region_group = parser
+    if multiple_regions:
+        # the listing of no region makes no sense
+        region_group = parser.add_mutually_exclusive_group(required=True)
+    region_group.add_argument(
         "--zone",
-        help="default IBM Cloud zone. e.g. jp-tok, us-east, us-west, ...",
+        help=region_help,
         dest="region",
+        **region_kwargs,
         **DEPRECATED_OPTION,
     )
-    parser.add_argument(
+    region_group.add_argument(
         "--region",
-        help="default IBM Cloud zone. e.g. jp-tok, us-east, us-west, ...",
+        help=region_help,
+        **region_kwargs,
     )
     return parser
 
-def _default_arg_parser_powervs(prog=None):
+def _default_arg_parser_powervs(prog=None, multiple_crns=False):
     parser = _default_arg_parser(prog=prog)
+    if multiple_crns:
+        parser.add_argument(
+            "--crn",
+            help=(
+                "Space separated list of CRNs of the PowerVS instances "
+                "(workspaces).  The workspaces are queried concurrently."
+            ),
+            nargs="+",
+            required=True,
+        )
+        return parser
+
     parser.add_argument(
         "--crn",
         help="CRN of the PowerVS instance, used to get credentials",
@@ -52,16 +104,115 @@ def _default_arg_parser_powervs(prog=None):
     return parser
 
 
-def _add_common_create_args(parser_create):
+def _add_print_origin_argument(parser):
+    """
+    Add the --print-origin and --format arguments to a list parser
+    """
+    parser.add_argument(
+        "--print-origin",
+        action="store_true",
+        help=(
+            "Append the region (or CRN) the resource was found in to every "
+            "printed line, useful when multiple end-points are queried"
+        ),
+    )
+    parser.add_argument(
+        "--format",
+        choices=["text", "jsonl"],
+        default="text",
+        help=(
+            "Output format, 'text' prints names (one per line), 'jsonl' "
+            "prints one JSON record per cloud resource (type, ID, name, "
+            "status, creation time, zone, owning instance), default "
+            "%(default)s"
+        ),
+    )
+    return parser
+
+
+def _add_watch_arguments(parser):
+    """
+    Add the --watch related arguments to a list parser
+    """
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help=(
+            "Keep running, and print only the changes: '+NAME' for new "
+            "resources, '-NAME' for removed ones and '~NAME STATUS' when "
+            "the status changes"
+        ),
+    )
+    parser.add_argument(
+        "--watch-min-interval",
+        type=float,
+        default=WATCH_MIN_INTERVAL,
+        help=(
+            "Refresh interval (seconds) used after a change, default "
+            "%(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--watch-max-interval",
+        type=float,
+        default=WATCH_MAX_INTERVAL,
+        help=(
+            "The refresh interval doubles up to this value (seconds) while "
+            "nothing changes, default %(default)s"
+        ),
+    )
+    return parser
+
+
+def _add_common_create_args(parser_create, with_name=True):
     """
     Add arguments common to all create commands
     """
-    parser_create.add_argument("name")
+    if with_name:
+        parser_create.add_argument("name")
     parser_create.add_argument("--playbook", help="Path to playbook", required=True)
     parser_create.add_argument("--image-uuid", required=True, help="UUID of the image to use")
+    _add_deadline_argument(parser_create)
+    parser_create.add_argument(
+        "--baked-playbook",
+        help=(
+            "Playbook to run instead of --playbook when the --image-uuid was "
+            "baked (see the bake command) from the current --playbook "
+            "content, e.g. only the per-instance configuration.  By default "
+            "the provisioning of such instances is skipped."
+        ),
+    )
     return parser_create
 
 
+def _add_deadline_argument(parser):
+    """
+    Add the --deadline argument to a parser
+    """
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help=(
+            "Time budget (seconds) of the whole command; every wait, retry "
+            "and subprocess is limited by what is left of it.  The last "
+            "quarter is reserved for removing the resources allocated by a "
+            "failed (or SIGTERM-interrupted) command.  Unlimited by default."
+        ),
+    )
+    return parser
+
+
+def _add_bake_args(parser_bake):
+    """
+    Add arguments specific to the bake commands
+    """
+    parser_bake.add_argument(
+        "--image-name", required=True,
+        help="Name of the image captured from the provisioned instance",
+    )
+    return parser_bake
+
+
 def _add_tags_argument(parser):
     """
     Add tags argument to a parser
@@ -75,22 +226,35 @@ def _add_tags_argument(parser):
     return parser
 
 
-def vm_arg_parser():
+def _add_vpc_create_args(parser_create, with_name=True):
     """
-    Parser for the resalloc-ibm-cloud-vm utility.
+    Add arguments for commands starting VPC instances
     """
-    parser = _default_arg_parser_vpc(prog=_pfx("vm"))
-
-    subparsers = parser.add_subparsers(dest="subparser")
-    subparsers.required = True
-    parser_create = subparsers.add_parser(
-        "create", help="Create an instance in IBM Cloud"
-    )
-    _add_common_create_args(parser_create)
+    _add_common_create_args(parser_create, with_name=with_name)
     parser_create.add_argument("--vpc-id", required=True)
     parser_create.add_argument("--security-group-id", required=True)
     parser_create.add_argument("--ssh-key-id", required=True)
     parser_create.add_argument("--instance-type", help="e.g. cz2-2x4", required=True)
+    parser_create.add_argument(
+        "--fallback-instance-types",
+        nargs="+",
+        metavar="INSTANCE_TYPE",
+        help=(
+            "Space separated list of profiles to try (in the given order) when "
+            "no zone has capacity for the --instance-type"
+        ),
+    )
+    parser_create.add_argument(
+        "--failover-timeout",
+        type=int,
+        default=300,
+        help=(
+            "When the zone is out of capacity (or we are over quota), the "
+            "instance creation is immediately retried in the next --subnets-ids "
+            "candidate, or with a --fallback-instance-types profile.  Stop "
+            "trying after this many seconds, default: %(default)s"
+        ),
+    )
 
     f_ip_group = parser_create.add_mutually_exclusive_group()
 
@@ -128,10 +292,35 @@ def vm_arg_parser():
         "--resource-group-id", help="Resource group id, get it from `$ ibmcloud resources`"
     )
     _add_tags_argument(parser_create)
+    return parser_create
+
+
+def vm_arg_parser():
+    """
+    Parser for the resalloc-ibm-cloud-vm utility.
+    """
+    parser = _default_arg_parser_vpc(prog=_pfx("vm"))
+
+    subparsers = parser.add_subparsers(dest="subparser")
+    subparsers.required = True
+    parser_create = subparsers.add_parser(
+        "create", help="Create an instance in IBM Cloud"
+    )
+    _add_vpc_create_args(parser_create)
+
+    parser_bake = subparsers.add_parser(
+        "bake", help=(
+            "Start a temporary instance from --image-uuid, provision it with "
+            "--playbook and capture it as a new custom image --image-name"
+        )
+    )
+    _add_bake_args(_add_vpc_create_args(parser_bake, with_name=False))
+
     parser_delete = subparsers.add_parser(
         "delete", help="Delete instance by it's name from IBM Cloud"
     )
     parser_delete.add_argument("name")
+    _add_deadline_argument(parser_delete)
     subparsers.add_parser(
         "delete-free-floating-ips", help="Clean all IPs without an assigned VM"
     )
@@ -142,8 +331,9 @@ def _list_arg_parser(prog=None):
     """
     Parser for listing utilities
     """
-    parser = _default_arg_parser_vpc(prog=prog)
+    parser = _default_arg_parser_vpc(prog=prog, multiple_regions=True)
     parser.add_argument("--pool")
+    _add_print_origin_argument(parser)
     return parser
 
 def list_deleting_vms_parser():
@@ -152,26 +342,21 @@ def list_deleting_vms_parser():
 
 def list_vms_parser():
     """ parser for listing deleting vms """
-    return _list_arg_parser(prog=_pfx("list-vms"))
+    return _add_watch_arguments(_list_arg_parser(prog=_pfx("list-vms")))
 
 def list_deleting_volumes_parser():
     """ parser for listing vms """
-    return _default_arg_parser_vpc(prog=_pfx("list-deleting-volumes"))
+    parser = _default_arg_parser_vpc(prog=_pfx("list-deleting-volumes"),
+                                     multiple_regions=True)
+    _add_print_origin_argument(parser)
+    return parser
 
 
-def powervs_arg_parser():
+def _add_powervs_create_args(parser_create, with_name=True):
     """
-    Parser for the resalloc-ibm-cloud-powervs-vm utility.
+    Add arguments for commands starting PowerVS instances
     """
-    parser = _default_arg_parser_powervs(prog=_pfx("powervs-vm"))
-
-    subparsers = parser.add_subparsers(dest="subparser")
-    subparsers.required = True
-    
-    parser_create = subparsers.add_parser(
-        "create", help="Create a PowerVS instance in IBM Cloud"
-    )
-    _add_common_create_args(parser_create)
+    _add_common_create_args(parser_create, with_name=with_name)
     parser_create.add_argument(
         "--ssh-key-name", required=True, help="Name of the SSH key to use for the instance"
     )
@@ -188,7 +373,11 @@ def powervs_arg_parser():
         "--ram", type=float, required=True, help="RAM memory in GB"
     )
     parser_create.add_argument(
-        "--network-id", type=str, nargs="+", help="ID of the network to attach to the instance"
+        "--network-id", type=str, nargs="+",
+        help=(
+            "ID of the network to attach to the instance, 'ID1|ID2' picks the "
+            "network with the most available IP addresses"
+        ),
     )
     parser_create.add_argument(
         "--storage-type",
@@ -200,7 +389,10 @@ def powervs_arg_parser():
         "--volumes",
         type=str,
         nargs="+",
-        help="Additional volumes to attach in format 'name:size_gb:type'"
+        help=(
+            "Additional volumes to attach in format 'name:size_gb:type', the "
+            "'{name}' string in the volume name is replaced with the instance name"
+        ),
     )
     _add_tags_argument(parser_create)
     parser_create.add_argument(
@@ -212,18 +404,134 @@ def powervs_arg_parser():
     parser_create.add_argument(
         "--no-rmc",
         action="store_true",
-        help="Do not wait for Resource Monitoring and Control to be ready"
+        help=(
+            "Do not wait for Resource Monitoring and Control to be ready, "
+            "shortcut for --ready-when=active+ssh"
+        ),
+    )
+    parser_create.add_argument(
+        "--ready-when",
+        default=DEFAULT_READY_WHEN,
+        help=(
+            "Comma separated alternatives of '+' separated signals (active, "
+            "rmc, ssh); the instance is considered ready once all the signals "
+            "of any alternative are satisfied, default: %(default)s"
+        ),
     )
     parser_create.add_argument(
         "--storage-pool",
         type=str,
-        help="Storage pool to create the volumes and VMs in (if not specified, default is used)",
+        help=(
+            "Storage pool to create the volumes and VMs in (if not specified, "
+            "the pool of --storage-type with the most free space is used)"
+        ),
     )
+    _add_standby_args(parser_create)
+    _add_volume_pool_args(parser_create)
+    return parser_create
+
+
+def _add_standby_args(parser):
+    """
+    Add the warm standby pool arguments to a parser
+    """
+    parser.add_argument(
+        "--standby-prefix",
+        help=(
+            "Name prefix for the pre-started (warm standby) instances.  The "
+            "create command first tries to claim (rename) one of the standby "
+            "instances, and then replenishes the standby set in background.  "
+            "Must not start with the resalloc pool ID."
+        ),
+    )
+    parser.add_argument(
+        "--standby-count",
+        type=int,
+        default=1,
+        help="Number of warm standby instances to keep, default: %(default)s",
+    )
+    return parser
+
+
+def _add_volume_pool_args(parser):
+    """
+    Add the data volume re-use pool arguments to a parser
+    """
+    parser.add_argument(
+        "--volume-pool-prefix",
+        help=(
+            "Name prefix for the pooled data volumes.  If specified, the "
+            "delete command moves the detached data volumes into the pool "
+            "instead of deleting them, and the create command re-uses a "
+            "pooled volume of the same size, type and storage pool if "
+            "available.  Must not start with the resalloc pool ID."
+        ),
+    )
+    parser.add_argument(
+        "--volume-pool-size",
+        type=int,
+        default=2,
+        help=(
+            "Number of pooled volumes to keep for each storage pool, size and "
+            "type combination, default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--volume-pool-wipe-command",
+        help=(
+            "Command executed (over SSH, as root) on the instance being "
+            "deleted before its volumes are moved to the pool, e.g. "
+            "'wipefs -a /dev/sdb'; the volumes are deleted if it fails.  "
+            "Required with --volume-pool-prefix."
+        ),
+    )
+    return parser
+
+
+def powervs_arg_parser():
+    """
+    Parser for the resalloc-ibm-cloud-powervs-vm utility.
+    """
+    parser = _default_arg_parser_powervs(prog=_pfx("powervs-vm"))
+
+    subparsers = parser.add_subparsers(dest="subparser")
+    subparsers.required = True
+    
+    parser_create = subparsers.add_parser(
+        "create", help="Create a PowerVS instance in IBM Cloud"
+    )
+    _add_powervs_create_args(parser_create)
+
+    parser_prewarm = subparsers.add_parser(
+        "prewarm", help=(
+            "Start and provision PowerVS instances in advance so there are "
+            "--standby-count instances prefixed with --standby-prefix"
+        )
+    )
+    _add_powervs_create_args(parser_prewarm, with_name=False)
+
+    parser_bake = subparsers.add_parser(
+        "bake", help=(
+            "Start a temporary instance from --image-uuid, provision it with "
+            "--playbook and capture it as a new image --image-name"
+        )
+    )
+    _add_bake_args(_add_powervs_create_args(parser_bake, with_name=False))
 
     parser_delete = subparsers.add_parser(
         "delete", help="Delete PowerVS instance by its name from IBM Cloud"
     )
     parser_delete.add_argument("name")
+    _add_deadline_argument(parser_delete)
+    _add_volume_pool_args(parser_delete)
+
+    parser_trim = subparsers.add_parser(
+        "trim-volume-pool", help=(
+            "Delete the pooled data volumes exceeding --volume-pool-size, "
+            "done automatically in background after delete"
+        )
+    )
+    _add_volume_pool_args(parser_trim)
     
     return parser
 
@@ -232,12 +540,15 @@ def powervs_list_vms_parser():
     """
     Parser for listing PowerVS VMs
     """
-    parser = _default_arg_parser_powervs(prog=_pfx("powervs-list-vms"))
+    parser = _default_arg_parser_powervs(prog=_pfx("powervs-list-vms"),
+                                         multiple_crns=True)
     parser.add_argument(
         "--pool",
         help="Pool ID prefix to filter instances",
         required=True,
     )
+    _add_print_origin_argument(parser)
+    _add_watch_arguments(parser)
     return parser
 
 
@@ -245,5 +556,51 @@ def powervs_list_deleting_vms_parser():
     """
     Parser for listing deleting PowerVS VMs
     """
-    parser = _default_arg_parser_powervs(prog=_pfx("powervs-list-deleting-vms"))
+    parser = _default_arg_parser_powervs(prog=_pfx("powervs-list-deleting-vms"),
+                                         multiple_crns=True)
+    _add_print_origin_argument(parser)
     return parser
+
+
+def _action_argv(action, options):
+    """
+    Command-line arguments that make the argparse ACTION store the value the
+    OPTIONS namespace has for it
+    """
+    # pylint: disable=protected-access
+    value = getattr(options, action.dest, None)
+    if value is None or isinstance(action, argparse._HelpAction):
+        return []
+    if not action.option_strings:
+        return [str(item) for item in value] if isinstance(value, list) else [str(value)]
+    if "--" + action.dest.replace("_", "-") not in action.option_strings:
+        # alias of another option, e.g. the deprecated --zone
+        return []
+
+    flag = action.option_strings[-1]
+    if action.nargs == 0:
+        return [flag] if value is True else []
+    if isinstance(action, argparse._AppendAction):
+        return [arg for item in value for arg in [flag] + [str(v) for v in item]]
+    if isinstance(value, list):
+        return [flag] + [str(item) for item in value]
+    return [flag, str(value)]
+
+
+def options_argv(parser, subcommand, options):
+    """
+    Return the command-line arguments that make the PARSER (one of the
+    parsers above) run the SUBCOMMAND with the parsed OPTIONS, e.g. the
+    options of a different subcommand.  Options the SUBCOMMAND doesn't
+    accept are dropped.
+    """
+    # pylint: disable=protected-access
+    argv = []
+    for action in parser._actions:
+        if not isinstance(action, argparse._SubParsersAction):
+            argv += _action_argv(action, options)
+            continue
+        argv.append(subcommand)
+        for sub_action in action.choices[subcommand]._actions:
+            argv += _action_argv(sub_action, options)
+    return argv
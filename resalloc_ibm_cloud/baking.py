@@ -0,0 +1,86 @@
+"""
+Images with the provisioning playbook already applied, "baked" by the bake
+commands.  Instances started from such an image don't need to repeat the
+(slow) provisioning; as long as the playbook content hasn't changed since the
+image was baked, the create commands skip the --playbook, or run the lighter
+--baked-playbook instead.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from resalloc_ibm_cloud.state import StateFile
+
+log = logging.getLogger(__name__)
+
+
+def playbook_hash(playbook_path: str) -> str:
+    """
+    SHA-256 of all the files in the playbook directory (roles, templates,
+    variable files, ...), so changing any of them invalidates the images
+    baked with the previous content.  Hidden files and directories are
+    ignored.
+    """
+    top = os.path.dirname(os.path.abspath(playbook_path))
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(top):
+        dirs[:] = sorted(name for name in dirs if not name.startswith("."))
+        for filename in sorted(files):
+            if filename.startswith("."):
+                continue
+            path = os.path.join(root, filename)
+            digest.update(os.path.relpath(path, top).encode("utf-8") + b"\0")
+            with open(path, "rb") as fd:
+                digest.update(hashlib.sha256(fd.read()).digest())
+    return digest.hexdigest()
+
+
+class BakedImages:
+    """
+    Image ID -> playbook content hash mapping of the images baked in a region
+    or workspace NAME, kept in a local state file.
+    """
+
+    def __init__(self, state_dir: str, name: str):
+        self.state = StateFile(state_dir, f"baked-images-{name}")
+
+    def record(self, image_id: str, playbook_path: str, content_hash: str) -> None:
+        """
+        Remember that IMAGE_ID was provisioned by PLAYBOOK_PATH, having the
+        CONTENT_HASH (see playbook_hash()).
+        """
+        with self.state.update() as data:
+            data[image_id] = {
+                "playbook": os.path.abspath(playbook_path),
+                "hash": content_hash,
+                "timestamp": time.time(),
+            }
+
+    def provisioning_playbook(self, opts: Any) -> Optional[str]:
+        """
+        Return the playbook to run on an instance started from
+        opts.image_uuid; opts.playbook for stock images, or images baked from
+        a different playbook content, opts.baked_playbook (None = skip the
+        provisioning) for images baked from the current content.  The bake
+        commands always run the full opts.playbook.
+        """
+        if opts.subparser == "bake":
+            return opts.playbook
+
+        baked = self.state.read().get(opts.image_uuid)
+        if not baked:
+            return opts.playbook
+        if baked["hash"] != playbook_hash(opts.playbook):
+            log.warning("Image %s was baked from a different content of %s, "
+                        "running the full playbook", opts.image_uuid, opts.playbook)
+            return opts.playbook
+
+        if opts.baked_playbook:
+            log.info("Image %s is baked, running %s instead of %s",
+                     opts.image_uuid, opts.baked_playbook, opts.playbook)
+            return opts.baked_playbook
+        log.info("Image %s is baked, skipping the provisioning", opts.image_uuid)
+        return None
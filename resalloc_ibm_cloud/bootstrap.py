@@ -0,0 +1,55 @@
+"""
+Overlapped start-up of the utilities.  Right after the API key is read, the
+IAM token exchange and the TLS connection to the API end-point are started in
+background threads, while the main thread continues with the offline work
+(argument checks, local state files).  The first API request then only waits
+for whatever is still in flight, instead of doing both in sequence.
+"""
+
+import logging
+import threading
+
+from resalloc_ibm_cloud.deadline import current_deadline
+from resalloc_ibm_cloud.transport import get_transport
+
+log = logging.getLogger(__name__)
+
+
+class Bootstrap:
+    """
+    Fetch the token of the AUTHENTICATOR, and pre-connect to the URLS, in
+    background threads
+    """
+
+    def __init__(self, authenticator, urls: list[str]) -> None:
+        self.authenticator = authenticator
+        self._token_ready = threading.Event()
+        self._error = None
+        threading.Thread(target=self._fetch_token, daemon=True).start()
+        transport = get_transport()
+        if hasattr(transport, "preconnect"):
+            for url in urls:
+                threading.Thread(target=transport.preconnect, args=(url,),
+                                 daemon=True).start()
+
+    def _fetch_token(self) -> None:
+        try:
+            self.authenticator.token_manager.get_token()
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self._error = exc
+            # the token manager would keep the other callers waiting for the
+            # failed request
+            self.authenticator.token_manager.request_time = 0
+        finally:
+            self._token_ready.set()
+
+    def token(self) -> str:
+        """
+        The bearer token, once the background exchange finishes.  Raise the
+        exception of the failed exchange (once, the next call retries).
+        """
+        self._token_ready.wait(current_deadline().timeout())
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+        return self.authenticator.token_manager.get_token()
@@ -0,0 +1,58 @@
+"""
+TTL-cached catalog of the resources (images, profiles, keys, ...) available in
+a region or workspace.  The create commands validate their options against it
+before anything is allocated.
+"""
+
+import logging
+import time
+from typing import Callable, Optional
+
+from resalloc_ibm_cloud.constants import CATALOG_CACHE_TTL
+from resalloc_ibm_cloud.state import StateFile
+
+log = logging.getLogger(__name__)
+
+
+class Catalog:
+    """
+    FETCHERS is a {kind: function} dictionary; each function downloads the
+    current {key: info_dict} mapping of the KIND of resources (e.g. image ID ->
+    {"status": "available"}).  The mappings are cached in a local state file
+    for CATALOG_CACHE_TTL seconds.
+    """
+
+    def __init__(self, state_dir: str, name: str,
+                 fetchers: dict[str, Callable[[], dict]]):
+        self.state = StateFile(state_dir, f"catalog-{name}")
+        self.fetchers = fetchers
+        self._cache = None
+        self._refreshed = set()
+
+    def _refresh(self, kind: str) -> dict:
+        log.debug("Refreshing the %s catalog", kind)
+        entries = self.fetchers[kind]()
+        self._refreshed.add(kind)
+        with self.state.update() as data:
+            data[kind] = {"entries": entries, "timestamp": time.time()}
+        self._cache[kind] = data[kind]
+        return entries
+
+    def find(self, kind: str, key: str) -> Optional[dict]:
+        """
+        Return the info dictionary about the KIND resource identified by KEY,
+        or None if there's no such resource.  Stale catalog, or a missing key
+        (the resource might have been created recently), triggers a refresh.
+        """
+        if self._cache is None:
+            self._cache = self.state.read()
+
+        cached = self._cache.get(kind)
+        if not cached or time.time() - cached["timestamp"] > CATALOG_CACHE_TTL:
+            entries = self._refresh(kind)
+        else:
+            entries = cached["entries"]
+
+        if key not in entries and kind not in self._refreshed:
+            entries = self._refresh(kind)
+        return entries.get(key)
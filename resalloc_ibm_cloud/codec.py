@@ -0,0 +1,42 @@
+"""
+Decoding of the API responses.  The (large) listings are decoded by orjson if
+it is installed (several times faster than the standard json module), and
+transferred compressed with any encoding urllib3 can decode here (gzip and
+deflate, br and zstd if the brotli and zstandard modules are available).
+"""
+
+import json
+from typing import Any, Union
+
+import requests
+from urllib3.util import make_headers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The Accept-Encoding header value for the API requests
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+# The JSON decoder in use
+BACKEND = "orjson" if orjson else "json"
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """
+    Decode the JSON DATA, raise ValueError (json.JSONDecodeError) on invalid
+    input
+    """
+    if orjson:
+        return orjson.loads(data)  # pylint: disable=no-member
+    return json.loads(data)
+
+
+def response_json(response: requests.Response) -> Any:
+    """
+    Decode the JSON body of the RESPONSE, None if the body is empty
+    """
+    if not response.content:
+        return None
+    return loads(response.content)
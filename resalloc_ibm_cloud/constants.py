@@ -1,2 +1,78 @@
 # Using the highest value possible
 LIMIT = 100
+
+# How long (seconds) we trust the cached numbers of available IPs in subnets
+SUBNET_CACHE_TTL = 300
+# How long (seconds) we trust the cached PowerVS storage pool capacity and
+# network IP availability
+POWERVS_CAPACITY_CACHE_TTL = 300
+# How long (seconds) we trust the cached catalog of images, profiles, keys,
+# etc. used for the preflight checks of the create commands
+CATALOG_CACHE_TTL = 3600
+# Recent instance-creation failures in a zone are forgotten with this
+# half-life (seconds)
+ZONE_FAILURE_HALF_LIFE = 1800
+
+# VPC API error codes meaning that the instance can not be started in the zone
+# right now, but it might work elsewhere (or with a different profile)
+CAPACITY_ERROR_CODES = {
+    "insufficient_capacity",
+    "instance_profile_not_available",
+    "over_quota",
+    "quota_exceeded",
+}
+
+# For how long (seconds) the SSH master connection opened for provisioning
+# outlives us if we fail to close it
+SSH_CONTROL_PERSIST = 600
+
+# Number of the slowest playbook tasks reported after provisioning
+PLAYBOOK_TIMING_SUMMARY = 5
+
+# Number of the most recent per-instance playbook timing files kept in the
+# state directory, the older ones are removed
+PLAYBOOK_TIMING_KEEP = 200
+
+# Maximum number of characters of the (JSON) request/response payloads printed
+# to logs
+LOG_PAYLOAD_LIMIT = 8192
+
+# The PowerVS instance is ready when any of these (comma separated)
+# combinations of signals is satisfied, see --ready-when
+DEFAULT_READY_WHEN = "active+rmc,active+ssh"
+
+# The list-vms --watch refresh interval (seconds) starts at the minimum, and
+# backs off up to the maximum while nothing changes
+WATCH_MIN_INTERVAL = 10
+WATCH_MAX_INTERVAL = 120
+
+# (connect, read) timeout (seconds) of the IBM Cloud API requests
+REQUEST_TIMEOUT = (10, 120)
+# Connections kept open per API host, for the concurrently running threads
+HTTP_POOL_SIZE = 32
+# Maximum number of the concurrently running independent queries (listings
+# of different collections) of one end-point
+QUERY_CONCURRENCY = 4
+
+# With --hedge-requests, a GET request taking longer than the HEDGE_PERCENTILE
+# latency of its end-point is repeated (hedged).  The end-point needs at least
+# HEDGE_MIN_SAMPLES recent latency samples, and at most HEDGE_SAMPLES of them
+# are kept.  At most HEDGE_BUDGET (fraction) of the requests may be hedged.
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_SAMPLES = 200
+HEDGE_BUDGET = 0.1
+
+# The last share of the --deadline budget is reserved for the cleanup of the
+# resources allocated by the failed (or interrupted) command
+DEADLINE_CLEANUP_SHARE = 0.25
+
+# The user tags are attached in batches of at most TAGGING_BATCH_SIZE
+# resources.  The create command lets the concurrently created resources join
+# the batch for TAGGING_LINGER seconds, and gives up attaching (retrying) after
+# TAGGING_FLUSH_DEADLINE seconds.  The results of the failed attachments are
+# kept for TAGGING_FAILED_TTL seconds.
+TAGGING_BATCH_SIZE = 100
+TAGGING_LINGER = 5
+TAGGING_FLUSH_DEADLINE = 120
+TAGGING_FAILED_TTL = 86400
@@ -0,0 +1,133 @@
+"""
+End-to-end time budget (the --deadline option) of one command.  Every poll,
+probe, retry and subprocess draws its timeout from the remaining budget, so
+the command finishes before resalloc gives up and kills it.  The last part of
+the budget is reserved for the cleanup of the already allocated resources, and
+SIGTERM interrupts the command so the cleanup runs.
+"""
+
+import logging
+import math
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from resalloc_ibm_cloud.constants import DEADLINE_CLEANUP_SHARE
+from resalloc_ibm_cloud.exceptions import DeadlineExceededException
+
+log = logging.getLogger(__name__)
+
+
+class Deadline:
+    """
+    Time BUDGET (seconds, None = unlimited) started at the object creation.
+    The last DEADLINE_CLEANUP_SHARE of the budget is only available inside
+    the cleanup() context.
+    """
+
+    def __init__(self, budget: Optional[float] = None):
+        self.end = None if budget is None else time.monotonic() + budget
+        self.reserve = 0 if budget is None else budget * DEADLINE_CLEANUP_SHARE
+        self.terminated = False
+        # number of the threads in the cleanup() context
+        self._cleanups = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cleaning(self) -> bool:
+        """True if some thread is in the cleanup() context"""
+        return self._cleanups > 0
+
+    def remaining(self) -> float:
+        """Seconds left, math.inf if unlimited"""
+        if self.cleaning:
+            end = self.end
+        elif self.terminated:
+            return 0
+        else:
+            end = None if self.end is None else self.end - self.reserve
+        if end is None:
+            return math.inf
+        return max(end - time.monotonic(), 0)
+
+    def timeout(self, seconds: Optional[float] = None) -> Optional[float]:
+        """
+        Return SECONDS limited by the remaining budget (None if both are
+        unlimited).  Raise DeadlineExceededException if the budget is spent.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceededException(
+                "Terminated" if self.terminated else "Deadline exceeded")
+        if seconds is None:
+            return None if math.isinf(remaining) else remaining
+        return min(seconds, remaining)
+
+    def request_timeout(self, timeout: tuple) -> tuple:
+        """The (connect, read) requests TIMEOUT limited by the budget"""
+        return tuple(self.timeout(seconds) for seconds in timeout)
+
+    def sleep(self, seconds: float) -> None:
+        """time.sleep(), raise DeadlineExceededException if the budget is spent"""
+        time.sleep(self.timeout(seconds))
+
+    @contextmanager
+    def cleanup(self):
+        """
+        Give the code in this context the reserved part of the budget
+        """
+        with self._lock:
+            self._cleanups += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._cleanups -= 1
+
+
+_local = threading.local()
+_process = Deadline()
+
+
+def current_deadline() -> Deadline:
+    """
+    The Deadline of this thread (see deadline_scope()), or of the whole
+    process (see install_deadline())
+    """
+    return getattr(_local, "deadline", None) or _process
+
+
+@contextmanager
+def deadline_scope(budget: Optional[float]):
+    """
+    Run the code in this context (in this thread) with its own BUDGET
+    """
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = Deadline(budget)
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = previous
+
+
+def _on_sigterm(signum, _frame):
+    if _process.cleaning:
+        log.warning("Signal %s received during the cleanup, ignored", signum)
+        return
+    log.error("Signal %s received, cleaning up", signum)
+    _process.terminated = True
+    raise DeadlineExceededException("Terminated")
+
+
+def install_deadline(budget: Optional[float]) -> Deadline:
+    """
+    Start the process-wide BUDGET, and make SIGTERM interrupt the main
+    thread with DeadlineExceededException (so the cleanup runs).  Call from
+    the main thread.
+    """
+    global _process  # pylint: disable=global-statement
+    _process = Deadline(budget)
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    return _process
@@ -11,3 +11,19 @@ class PowerVSNotFoundException(PowerVSException):
 
 class PowerVSInvalidNameException(PowerVSException):
     """Exception raised when a PowerVS resource name is invalid."""
+
+
+class PowerVSCapacityException(PowerVSException):
+    """Exception raised when no storage pool or network can fit the request."""
+
+
+class PowerVSPreflightException(PowerVSException):
+    """Exception raised when the requested image, key, etc. is invalid."""
+
+
+class DeadlineExceededException(ResallocIBMCloudException):
+    """Exception raised when the --deadline budget is spent, or on SIGTERM."""
+
+
+class TaggingException(ResallocIBMCloudException):
+    """Exception raised when the user tags can not be attached."""
@@ -0,0 +1,230 @@
+"""
+Hedged GET requests.  Some (mostly listing and polling) GET requests take many
+seconds at the tail, even though a repeated request is answered quickly.  So
+when a GET request takes longer than the recently observed HEDGE_PERCENTILE
+latency of its end-point, a second (hedge) request is sent, and the first
+response wins.  Only the idempotent GET requests are hedged, and at most
+HEDGE_BUDGET of the requests.  The observed latencies are kept in a local
+state file, so our short-lived utilities benefit from the statistics gathered
+by the previous runs.
+"""
+
+import atexit
+import logging
+import queue
+import re
+import threading
+import time
+from typing import Callable, Optional
+
+import requests
+
+from resalloc_ibm_cloud.constants import (
+    HEDGE_BUDGET,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+    HEDGE_SAMPLES,
+)
+from resalloc_ibm_cloud.state import StateFile
+
+log = logging.getLogger(__name__)
+
+# URL path items containing a digit, at least 8 characters long, are IDs
+_ID_RE = re.compile(r"/(?=[^/]*\d)[^/]{8,}")
+
+
+def endpoint_key(method: str, url: str) -> str:
+    """
+    Latency statistics key for the request.  Resource IDs in the URL are
+    replaced with "{id}", so e.g. polling of different instances shares the
+    statistics.
+    """
+    url = url.split("://", 1)[-1].split("?", 1)[0]
+    return method + " " + _ID_RE.sub("/{id}", url)
+
+
+class _Race:
+    """
+    Concurrently sent attempts of one request.  The first finished attempt
+    is picked by wait(); responses of the attempts finishing later are
+    closed.
+    """
+
+    def __init__(self, policy: "HedgingPolicy", key: str,
+                 send: Callable[[], requests.Response]):
+        self.policy = policy
+        self.key = key
+        self.send = send
+        self.lock = threading.Lock()
+        self.results = queue.Queue()
+        self.started = 0
+        self.decided = False
+
+    def start(self) -> None:
+        """Send one more attempt, in a background thread"""
+        with self.lock:
+            self.started += 1
+            attempt = self.started
+        threading.Thread(target=self._run, args=(attempt,), daemon=True).start()
+
+    def _run(self, attempt: int) -> None:
+        start = time.monotonic()
+        response, error = None, None
+        try:
+            response = self.send()
+            self.policy.record(self.key, time.monotonic() - start)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            error = exc
+        with self.lock:
+            if not self.decided:
+                self.results.put((attempt, response, error))
+                return
+        if response is not None:
+            response.close()
+
+    def wait(self, timeout: Optional[float] = None):
+        """
+        Return (attempt, response, exception) of the next finished attempt,
+        or None after TIMEOUT seconds
+        """
+        try:
+            return self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def decide(self) -> None:
+        """Stop accepting results, close the responses already received"""
+        with self.lock:
+            self.decided = True
+        while not self.results.empty():
+            _, response, _ = self.results.get()
+            if response is not None:
+                response.close()
+
+
+class HedgingPolicy:
+    """
+    Hedging policy shared by the VPCClient and PowerVSClient objects (and
+    threads) of one process
+    """
+
+    def __init__(self, state_dir: str):
+        self.state = StateFile(state_dir, "request-latency")
+        self.lock = threading.Lock()
+        # endpoint key -> list of recent latencies (seconds)
+        self.samples = None
+        # the counters saved by the previous processes
+        self.saved_counters = {}
+        self.new_samples = {}
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        atexit.register(self.save)
+
+    def threshold(self, key: str) -> Optional[float]:
+        """
+        The HEDGE_PERCENTILE latency of the end-point KEY, None if we don't
+        have enough samples yet
+        """
+        with self.lock:
+            if self.samples is None:
+                data = self.state.read()
+                self.samples = data.get("samples", {})
+                self.saved_counters = data.get("counters", {})
+            samples = sorted(self.samples.get(key, []))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, len(samples) * HEDGE_PERCENTILE // 100)]
+
+    def record(self, key: str, latency: float) -> None:
+        """Add the observed LATENCY of the end-point KEY"""
+        with self.lock:
+            for samples in self.samples, self.new_samples:
+                latencies = samples.setdefault(key, [])
+                latencies.append(latency)
+                del latencies[:-HEDGE_SAMPLES]
+
+    def _take_budget(self) -> bool:
+        """
+        At most HEDGE_BUDGET of all the GET requests are hedged.  The short
+        living utilities send only a few requests each, so the budget counts
+        with the requests of the previous processes, too.
+        """
+        with self.lock:
+            hedged = self.saved_counters.get("hedged", 0) + self.hedged
+            requests_sent = self.saved_counters.get("requests", 0) + self.requests
+            if hedged + 1 > HEDGE_BUDGET * requests_sent:
+                return False
+            self.hedged += 1
+            return True
+
+    def send(self, method: str, url: str,
+             send: Callable[[], requests.Response]) -> requests.Response:
+        """
+        Perform the request by calling SEND().  GET requests are hedged (SEND
+        is called once more, concurrently) when they take too long.
+        """
+        if method != "GET":
+            return send()
+
+        key = endpoint_key(method, url)
+        threshold = self.threshold(key)
+        with self.lock:
+            self.requests += 1
+
+        race = _Race(self, key, send)
+        race.start()
+        result = race.wait(threshold)
+        if result is None:
+            if self._take_budget():
+                log.debug("Hedging %s after %.2fs", key, threshold)
+                race.start()
+            result = race.wait()
+            if result[2] is not None and race.started > 1:
+                # the other attempt may still succeed
+                result = race.wait()
+        race.decide()
+
+        attempt, response, error = result
+        if error is not None:
+            raise error
+        if attempt > 1:
+            with self.lock:
+                self.hedge_wins += 1
+        return response
+
+    def save(self) -> None:
+        """
+        Store the newly observed latencies, and the hedging counters, to the
+        state file
+        """
+        with self.lock:
+            new_samples, self.new_samples = self.new_samples, {}
+            counters = {"requests": self.requests, "hedged": self.hedged,
+                        "hedge_wins": self.hedge_wins}
+            self.requests = self.hedged = self.hedge_wins = 0
+        if not new_samples:
+            return
+
+        if counters["hedged"]:
+            log.info("Hedged %s out of %s GET requests, the hedge won %s times",
+                     counters["hedged"], counters["requests"], counters["hedge_wins"])
+        try:
+            with self.state.update() as data:
+                samples = data.setdefault("samples", {})
+                for key, latencies in new_samples.items():
+                    samples[key] = (samples.get(key, []) + latencies)[-HEDGE_SAMPLES:]
+                totals = data.setdefault("counters", {})
+                for name, value in counters.items():
+                    totals[name] = totals.get(name, 0) + value
+        except OSError:
+            log.exception("Can not store the request latencies")
+
+
+def hedging_policy(opts) -> Optional[HedgingPolicy]:
+    """
+    The HedgingPolicy for the --hedge-requests option, or None
+    """
+    if not getattr(opts, "hedge_requests", False):
+        return None
+    return HedgingPolicy(opts.state_dir)
@@ -1,37 +1,126 @@
+import json
 import logging
+import os
+import shutil
 import subprocess
 import datetime
+import tempfile
 from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+import socket
 import sys
+from typing import Optional
 
-from ibm_vpc import VpcV1
-from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
+from resalloc_ibm_cloud.bootstrap import Bootstrap
+from resalloc_ibm_cloud.constants import (
+    LOG_PAYLOAD_LIMIT,
+    PLAYBOOK_TIMING_KEEP,
+    PLAYBOOK_TIMING_SUMMARY,
+    QUERY_CONCURRENCY,
+    SSH_CONTROL_PERSIST,
+)
+from resalloc_ibm_cloud.deadline import current_deadline
+from resalloc_ibm_cloud.hedging import HedgingPolicy, hedging_policy
+from resalloc_ibm_cloud.transport import iam_authenticator
+from resalloc_ibm_cloud.vpc_client import VPCClient
 
-def get_service(opts: Namespace):
+log = logging.getLogger(__name__)
+
+
+def get_api_key(token_file: str) -> str:
     """
-    Taking command-line argument options, load the IBM Cloud token file and
-    perform authentication against given IBM Cloud end-point.  We expect that
-    the token file is a shell file that defines $IBMCLOUD_API_KEY variable
-    inside.  Use techniques like:
+    Load the IBM Cloud token file and return the API key.  We expect that the
+    token file is a shell file that defines $IBMCLOUD_API_KEY variable inside.
+    Use techniques like:
 
         echo -n "Please enter your IBM Cloud key: "
         read -sr IBMCLOUD_API_KEY
         echo
+    """
+    cmd = f"source {token_file} ; echo $IBMCLOUD_API_KEY"
+    output = subprocess.check_output(cmd, shell=True)
+    return output.decode("utf-8").strip().rsplit("\n", maxsplit=1)[-1]
+
+
+def get_region_service(api_key: str, region: str,
+                       hedging: Optional[HedgingPolicy] = None):
+    """
+    Perform authentication against the IBM Cloud end-point for REGION, and
+    return the VPC service object (VpcV1 compatible, see VPCClient).  Each call
+    creates a separate authenticator, so each service object maintains its own
+    token.  The token exchange and the connection to the end-point start in
+    background.  GET requests are hedged according to the HEDGING policy.
+    """
+    authenticator = iam_authenticator(api_key)
+    now = datetime.datetime.now()
+    service = VPCClient(now.strftime("%Y-%m-%d"), authenticator=authenticator,
+                        hedging=hedging)
+    service.set_service_url(f"https://{region}.iaas.cloud.ibm.com/v1")
+    service.bootstrap = Bootstrap(authenticator, [service.service_url])
+    return service
+
+
+def get_service(opts: Namespace):
+    """
+    Taking command-line argument options, load the IBM Cloud token file and
+    perform authentication against given IBM Cloud end-point.  See
+    get_api_key() for the token file format.
 
     Input options:
         opts.token_file -> file to read and process with shell
         opts.region     -> zone in IBM Cloud, e.g. 'jp-tok'
     """
+    return get_region_service(get_api_key(opts.token_file), opts.region,
+                              hedging_policy(opts))
 
-    cmd = f"source {opts.token_file} ; echo $IBMCLOUD_API_KEY"
-    output = subprocess.check_output(cmd, shell=True)
-    token = output.decode("utf-8").strip().rsplit("\n", maxsplit=1)[-1]
-    authenticator = IAMAuthenticator(token)
-    now = datetime.datetime.now()
-    service = VpcV1(now.strftime("%Y-%m-%d"), authenticator=authenticator)
-    service.set_service_url(f"https://{opts.region}.iaas.cloud.ibm.com/v1")
-    return service
+
+def run_concurrently(function, arguments: list,
+                     max_workers: Optional[int] = None) -> list:
+    """
+    Call FUNCTION for every item in ARGUMENTS, each call in its own thread
+    (at most MAX_WORKERS threads at a time, if specified).  Return the list
+    of results in the same order as ARGUMENTS.  The first raised exception
+    (if any) is re-raised.
+    """
+    if len(arguments) <= 1:
+        return [function(argument) for argument in arguments]
+
+    workers = min(len(arguments), max_workers or len(arguments))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, arguments))
+
+
+def run_queries(*queries) -> list:
+    """
+    Call the independent QUERIES (argument-less callables, e.g. listings of
+    different resource collections) concurrently, on at most
+    QUERY_CONCURRENCY threads, so it takes as long as the slowest of them.
+    Return the list of results in the same order as QUERIES.
+    """
+    return run_concurrently(lambda query: query(), list(queries),
+                            max_workers=QUERY_CONCURRENCY)
+
+
+def print_listing(lines: list[tuple[str, str]], print_origin: bool) -> None:
+    """
+    Print the (line, origin) pairs gathered by list utilities from (possibly)
+    multiple end-points to stdout.  Duplicate lines are printed only once.
+    """
+    printed = set()
+    for line, origin in lines:
+        if print_origin:
+            line = f"{line} {origin}"
+        if line in printed:
+            continue
+        printed.add(line)
+        # The only stdout output comes here!
+        print(line)
 
 
 def wait_for_ssh(floating_ip, timeout=240):
@@ -40,29 +129,282 @@ def wait_for_ssh(floating_ip, timeout=240):
     
     Args:
         floating_ip: The floating IP address to check
-        timeout: Maximum time to wait in seconds (default is 240)
+        timeout: Maximum time to wait in seconds (default is 240), limited
+            by the --deadline budget
     """
+    timeout = current_deadline().timeout(timeout)
     cmd = [
         "resalloc-wait-for-ssh",
         "--log",
         "debug",
         "--timeout",
-        str(timeout),
+        str(max(int(timeout), 1)),
         floating_ip,
     ]
     subprocess.check_call(cmd, stdout=sys.stderr)
 
 
-def run_playbook(host: str, playbook_path: str) -> None:
+def ssh_banner_received(host: str, port: int = 22, timeout: float = 5) -> bool:
+    """
+    Check that the SSH server on HOST responds with the SSH protocol banner.
+    This is a quick, single-shot check (unlike wait_for_ssh).
+
+    Args:
+        host: IP address or hostname of the instance
+        port: SSH port
+        timeout: Connection (and read) timeout in seconds
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            return sock.recv(256).startswith(b"SSH-")
+    except OSError:
+        return False
+
+
+def playbook_remote_user(playbook_path: str) -> Optional[str]:
+    """
+    The remote user ansible-playbook connects as: the remote_user of the first
+    play in PLAYBOOK_PATH setting it, or $ANSIBLE_REMOTE_USER.  None if not
+    set (or the playbook can not be parsed, PyYAML is optional), so ssh picks
+    the user from its configuration, the same way it does for ansible.
+
+    Args:
+        playbook_path: Path to the Ansible playbook
+    """
+    plays = None
+    if yaml:
+        try:
+            with open(playbook_path, "r", encoding="utf-8") as fd:
+                plays = yaml.safe_load(fd)
+        except (OSError, yaml.YAMLError) as exc:
+            log.debug("Can not parse %s: %s", playbook_path, exc)
+    for play in plays if isinstance(plays, list) else []:
+        user = play.get("remote_user") if isinstance(play, dict) else None
+        if isinstance(user, str) and "{{" not in user:
+            return user
+    return os.environ.get("ANSIBLE_REMOTE_USER") or None
+
+
+def _ssh_host_key_options() -> list[str]:
+    """
+    The operator's ssh configuration decides about the host key checking,
+    unless it is turned off for ansible (then ansible turns it off for its
+    ssh connections too)
+    """
+    checking = os.environ.get("ANSIBLE_HOST_KEY_CHECKING", "")
+    if checking.lower() in ["0", "false", "no", "off", "n", "f"]:
+        return ["-o", "StrictHostKeyChecking=no"]
+    return []
+
+
+@contextmanager
+def ssh_master(host: str, user: Optional[str] = None):
+    """
+    Open a persistent SSH master connection to HOST, and yield the ControlPath
+    other SSH clients (ansible-playbook) can multiplex their sessions through,
+    without the expensive key exchange.  Yield None if the master connection
+    can not be opened.  The connection is closed on exit.
+
+    Args:
+        host: IP address or hostname of the instance
+        user: Remote user, the ssh configuration decides by default
+    """
+    # short directory name, the UNIX socket path length is limited
+    control_dir = tempfile.mkdtemp(prefix="ribm-ssh-")
+    control_path = os.path.join(control_dir, "%r@%h:%p")
+    options = ["-o", f"ControlPath={control_path}"]
+    destination = f"{user}@{host}" if user else host
+    cmd = ["ssh", "-o", "ControlMaster=yes",
+           "-o", f"ControlPersist={SSH_CONTROL_PERSIST}",
+           *_ssh_host_key_options(),
+           "-o", "BatchMode=yes", "-o", "ConnectTimeout=30",
+           "-fN", *options, destination]
+    opened = False
+    try:
+        try:
+            subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=sys.stderr,
+                           check=True, timeout=current_deadline().timeout(60))
+            opened = True
+        except (OSError, subprocess.SubprocessError):
+            log.warning("Can not open SSH master connection to %s", destination)
+        yield control_path if opened else None
+    finally:
+        if opened:
+            subprocess.run(["ssh", "-O", "exit", *options, destination],
+                           stdin=subprocess.DEVNULL, stdout=sys.stderr,
+                           stderr=subprocess.DEVNULL, check=False)
+        shutil.rmtree(control_dir, ignore_errors=True)
+
+
+def _append_env(env: dict, name: str, value: str, separator: str) -> None:
+    env[name] = separator.join(filter(None, [env.get(name), value]))
+
+
+def playbook_environment(control_path: str = None, timing_file: str = None) -> dict:
+    """
+    Environment for ansible-playbook re-using the SSH master connection at
+    CONTROL_PATH (see ssh_master()), with pipelining enabled (one SSH session
+    per task instead of several).  With TIMING_FILE, the resalloc_timing
+    callback plugin (shipped with this package) records the task durations
+    there.  Variables set by the caller are respected.
+
+    Args:
+        control_path: ControlPath of the SSH master connection, or None
+        timing_file: Path to the JSON file for the task timing, or None
+    """
+    env = os.environ.copy()
+    env.setdefault("ANSIBLE_PIPELINING", "True")
+    if control_path:
+        env.setdefault("ANSIBLE_SSH_ARGS",
+                       "-C -o ControlMaster=auto -o ControlPersist=60s")
+        # ansible expands %(directory)s in the path, escape the ssh tokens
+        env.setdefault("ANSIBLE_SSH_CONTROL_PATH", control_path.replace("%", "%%"))
+    if timing_file:
+        plugins = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "ansible_callbacks")
+        _append_env(env, "ANSIBLE_CALLBACK_PLUGINS", plugins, ":")
+        _append_env(env, "ANSIBLE_CALLBACKS_ENABLED", "resalloc_timing", ",")
+        env["RESALLOC_IBM_CLOUD_TIMING_FILE"] = timing_file
+    return env
+
+
+def log_playbook_timing(timing_file: str, count: int = PLAYBOOK_TIMING_SUMMARY) -> None:
+    """
+    Log the COUNT slowest tasks recorded in TIMING_FILE by the resalloc_timing
+    callback plugin (the others on the debug level).
+
+    Args:
+        timing_file: Path to the JSON file with the task timing
+        count: Number of tasks to report
+    """
+    try:
+        with open(timing_file, "r", encoding="utf-8") as fd:
+            data = json.load(fd)
+    except (OSError, ValueError):
+        log.warning("No playbook task timing in %s", timing_file)
+        return
+
+    log.info("Playbook took %.1fs, the slowest tasks (details in %s):",
+             data["duration"], timing_file)
+    tasks = sorted(data["tasks"], key=lambda task: task["duration"], reverse=True)
+    for index, task in enumerate(tasks):
+        statuses = sorted({host["status"] for host in task["hosts"].values()})
+        log.log(logging.INFO if index < count else logging.DEBUG,
+                "  %7.1fs  %s (%s)", task["duration"], task["name"],
+                ", ".join(statuses))
+
+
+def prune_playbook_timing(directory: str, keep: int = PLAYBOOK_TIMING_KEEP) -> None:
+    """
+    Remove all but the KEEP most recently modified timing files from
+    DIRECTORY, there is one per provisioned instance.
+
+    Args:
+        directory: The playbook-timing directory in the state dir
+        keep: Number of files to keep
+    """
+    files = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".json"):
+                    continue
+                # a concurrent provisioning may be pruning the same files
+                with suppress(FileNotFoundError):
+                    files.append((entry.stat().st_mtime, entry.path))
+    except FileNotFoundError:
+        return
+
+    files.sort(reverse=True)
+    for _, path in files[keep:]:
+        with suppress(FileNotFoundError):
+            os.unlink(path)
+
+
+def run_playbook(host: str, playbook_path: str, control_path: str = None,
+                 timing_file: str = None) -> None:
     """
     Run ansible-playbook against the given hostname
     
     Args:
         host: IP address or hostname of the instance
         playbook_path: Path to the Ansible playbook
+        control_path: ControlPath of the SSH master connection to re-use
+        timing_file: Path to the JSON file for the task timing
     """
     cmd = ["ansible-playbook", playbook_path, "--inventory", f"{host},"]
-    subprocess.check_call(cmd, stdout=sys.stderr, stdin=subprocess.DEVNULL)
+    if timing_file and os.path.exists(timing_file):
+        # don't report a previous run if this one fails early
+        os.unlink(timing_file)
+    try:
+        subprocess.check_call(cmd, stdout=sys.stderr, stdin=subprocess.DEVNULL,
+                              env=playbook_environment(control_path, timing_file),
+                              timeout=current_deadline().timeout())
+    finally:
+        if timing_file:
+            log_playbook_timing(timing_file)
+            prune_playbook_timing(os.path.dirname(timing_file))
+
+
+def playbook_timing_file(state_dir: str, name: str) -> str:
+    """
+    Path to the task timing file for the instance NAME provisioning
+    """
+    return os.path.join(state_dir, "playbook-timing", f"{name}.json")
+
+
+def provision(host: str, playbook_path: str, timing_file: str = None) -> None:
+    """
+    Run the provisioning playbook against the (SSH-ready) HOST, all the
+    ansible connections multiplexed through one SSH master connection.
+
+    Args:
+        host: IP address or hostname of the instance
+        playbook_path: Path to the Ansible playbook
+        timing_file: Path to the JSON file for the task timing
+    """
+    with ssh_master(host, playbook_remote_user(playbook_path)) as control_path:
+        run_playbook(host, playbook_path, control_path=control_path,
+                     timing_file=timing_file)
+
+
+def spawn_background(module: str, args: list[str], log_path: str) -> None:
+    """
+    Start the main() function of MODULE with ARGS in a detached process (new
+    session, survives our exit), its output is appended to LOG_PATH.
+
+    Args:
+        module: Python module with the main() function
+        args: Command-line arguments
+        log_path: File for the stdout and stderr output
+    """
+    cmd = [sys.executable, "-c", f"from {module} import main; main()"] + args
+    with open(log_path, "a", encoding="utf-8") as log_file:
+        subprocess.Popen(  # pylint: disable=consider-using-with
+            cmd, stdin=subprocess.DEVNULL, stdout=log_file, stderr=log_file,
+            start_new_session=True,
+        )
+
+
+def log_json(logger, level, message, data, limit=LOG_PAYLOAD_LIMIT):
+    """
+    Log the MESSAGE followed by DATA rendered as indented JSON.  The (possibly
+    expensive) rendering only happens when the LEVEL is enabled, and the output
+    is capped to LIMIT characters.
+
+    Args:
+        logger: The logger to use
+        level: Logging level, e.g. logging.DEBUG
+        message: Message prefix
+        data: JSON serializable data
+        limit: Maximum number of printed payload characters
+    """
+    if not logger.isEnabledFor(level):
+        return
+    text = json.dumps(data, indent=4)
+    if len(text) > limit:
+        text = f"{text[:limit]}\n... ({len(text) - limit} more characters)"
+    logger.log(level, "%s%s", message, text)
 
 
 def setup_logging(log_level="info"):
@@ -2,19 +2,26 @@
 List all IBM Cloud instances that are in Deleting state
 """
 
-from resalloc_ibm_cloud.helpers import get_service
+from resalloc_ibm_cloud.helpers import get_api_key, get_region_service
 from resalloc_ibm_cloud.argparsers import list_deleting_vms_parser
 from resalloc_ibm_cloud.constants import LIMIT
+from resalloc_ibm_cloud.hedging import hedging_policy
+from resalloc_ibm_cloud.ibm_cloud_list_vms import instance_record
+from resalloc_ibm_cloud.listing import print_records
 
 
 def main():
     """Entrypoint to the script."""
 
     opts = list_deleting_vms_parser().parse_args()
-    service = get_service(opts)
+    api_key = get_api_key(opts.token_file)
+    hedging = hedging_policy(opts)
 
-    instances = service.list_instances(limit=LIMIT).result["instances"]
-    for server in instances:
-        # Resalloc works with underscores, which is not allowed in IBM Cloud
-        if server["status"] == "deleting":
-            print(f"{server['id']} {server['name']}")
+    def _list_region(region):
+        service = get_region_service(api_key, region, hedging)
+        instances = service.list_instances(limit=LIMIT).result["instances"]
+        return [instance_record(server, region) for server in instances
+                if server["status"] == "deleting"]
+
+    print_records(opts, opts.region, _list_region,
+                  lambda record: f"{record.id} {record.cloud_name}")
@@ -3,11 +3,92 @@ List all IBM Cloud instances.
 """
 
 import os
+import re
 import sys
+from typing import Optional
 
-from resalloc_ibm_cloud.helpers import get_service
+from resalloc_ibm_cloud.helpers import (
+    get_api_key,
+    get_region_service,
+    run_queries,
+    setup_logging,
+)
 from resalloc_ibm_cloud.argparsers import list_vms_parser
 from resalloc_ibm_cloud.constants import LIMIT
+from resalloc_ibm_cloud.hedging import hedging_policy
+from resalloc_ibm_cloud.listing import InventoryWatcher, ResourceRecord, print_records
+
+
+def _zone(resource):
+    return (resource.get("zone") or {}).get("name")
+
+
+def instance_record(server: dict, origin: Optional[str] = None) -> ResourceRecord:
+    """
+    ResourceRecord for an item of the /instances listing
+    """
+    return ResourceRecord(
+        # Resalloc works with underscores, which is not allowed in IBM Cloud
+        "instance", server["id"], server["name"].replace("-", "_"),
+        server["name"], server["status"], server.get("created_at"),
+        _zone(server), None, origin,
+    )
+
+
+def volume_record(volume: dict, origin: Optional[str] = None) -> ResourceRecord:
+    """
+    ResourceRecord for an item of the /volumes listing, the resalloc name is
+    the volume name without the suffix
+    """
+    attachments = volume.get("volume_attachments") or []
+    return ResourceRecord(
+        "volume", volume["id"],
+        volume["name"].replace("-", "_").rsplit("_", 1)[0], volume["name"],
+        volume["status"], volume.get("created_at"), _zone(volume),
+        attachments[0]["instance"]["id"] if attachments else None, origin,
+    )
+
+
+def floating_ip_record(f_ip: dict, origin: Optional[str] = None) -> ResourceRecord:
+    """
+    ResourceRecord for an item of the /floating_ips listing
+    """
+    # The target is the network interface, its href points to the instance
+    match = re.search(r"/instances/([^/]+)/",
+                      (f_ip.get("target") or {}).get("href", ""))
+    return ResourceRecord(
+        "floating_ip", f_ip["id"], f_ip["name"].replace("-", "_"),
+        f_ip["name"], f_ip["status"], f_ip.get("created_at"), _zone(f_ip),
+        match.group(1) if match else None, origin,
+    )
+
+
+def list_pool_records(service, pool_id, origin=None):
+    """
+    Gather the list of ResourceRecords for instances, volumes and floating IPs
+    belonging to the resalloc pool, found in the region the SERVICE talks to.
+    """
+    instances, volumes, f_ips = run_queries(
+        lambda: service.list_instances(limit=LIMIT).result["instances"],
+        lambda: service.list_volumes(limit=LIMIT).result["volumes"],
+        lambda: service.list_floating_ips().get_result()["floating_ips"],
+    )
+
+    records = []
+    records.extend(instance_record(server, origin) for server in instances)
+    records.extend(volume_record(volume, origin) for volume in volumes)
+    records.extend(floating_ip_record(f_ip, origin) for f_ip in f_ips)
+
+    return [record for record in records
+            if record.cloud_name.replace("-", "_").startswith(pool_id)]
+
+
+def list_pool_resources(service, pool_id):
+    """
+    Gather the set of resalloc resource names in the pool, from instances,
+    volumes and floating IPs found in the region the SERVICE talks to.
+    """
+    return {record.name for record in list_pool_records(service, pool_id)}
 
 
 def main():
@@ -20,32 +101,22 @@ def main():
         sys.stderr.write("Specify pool ID by --pool or $RESALLOC_POOL_ID\n")
         sys.exit(1)
 
-    service = get_service(opts)
+    api_key = get_api_key(opts.token_file)
+    hedging = hedging_policy(opts)
 
-    # Gather the list of all resources here
-    resources = set()
-    instances = service.list_instances(limit=LIMIT).result["instances"]
-    for server in instances:
-        # Resalloc works with underscores, which is not allowed in IBM Cloud
-        name = server["name"].replace("-", "_")
-        if name.startswith(pool_id):
-            resources.add(name)
+    # Re-used by the --watch refreshes, so the IAM tokens are re-used, too
+    services = {}
 
-    volumes = service.list_volumes(limit=LIMIT).result["volumes"]
-    for volume in volumes:
-        # Resalloc works with underscores, which is not allowed in IBM Cloud
-        name = volume["name"].replace("-", "_")
-        if name.startswith(pool_id):
-            name = name.rsplit("_", 1)[0]
-            resources.add(name)
-
-    f_ips = service.list_floating_ips().get_result()["floating_ips"]
-    for f_ip in f_ips:
-        name = f_ip["name"].replace("-", "_")
-        if name.startswith(pool_id):
-            resources.add(name)
-
-    # Print them out, so upper level tooling can work with the list
-    for name in resources:
-        # The only stdout output comes here!
-        print(name)
+    def _list_region(region):
+        if region not in services:
+            services[region] = get_region_service(api_key, region, hedging)
+        return list_pool_records(services[region], pool_id, region)
+
+    if opts.watch:
+        setup_logging(opts.log_level)
+        InventoryWatcher(opts, opts.region, _list_region).run()
+        return
+
+    # Gather the list of all resources here, all the regions at once, and
+    # print them out, so upper level tooling can work with the list
+    print_records(opts, opts.region, _list_region, lambda record: record.name)
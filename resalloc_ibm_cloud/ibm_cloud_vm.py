@@ -6,15 +6,36 @@ Start a new VM in IBM Cloud under the copr-team account.
 import json
 import logging
 import os
-import random
 import sys
-from time import sleep
+import time
 
 import requests
-
-from resalloc_ibm_cloud.helpers import get_service, setup_logging, wait_for_ssh, run_playbook
+from ibm_cloud_sdk_core import ApiException
+
+from resalloc_ibm_cloud.helpers import (
+    get_service,
+    playbook_timing_file,
+    provision,
+    run_queries,
+    setup_logging,
+    wait_for_ssh,
+)
 from resalloc_ibm_cloud.argparsers import vm_arg_parser
-from resalloc_ibm_cloud.constants import LIMIT
+from resalloc_ibm_cloud.baking import BakedImages, playbook_hash
+from resalloc_ibm_cloud.catalog import Catalog
+from resalloc_ibm_cloud.codec import response_json
+from resalloc_ibm_cloud.constants import (
+    CAPACITY_ERROR_CODES,
+    LIMIT,
+    REQUEST_TIMEOUT,
+    TAGGING_FLUSH_DEADLINE,
+    TAGGING_LINGER,
+)
+from resalloc_ibm_cloud.deadline import current_deadline, install_deadline
+from resalloc_ibm_cloud.exceptions import ResallocIBMCloudException
+from resalloc_ibm_cloud.placement import SubnetPlacement
+from resalloc_ibm_cloud.tagging import TaggingQueue
+from resalloc_ibm_cloud.transport import get_transport
 
 
 log = logging.getLogger(__name__)
@@ -70,19 +91,33 @@ def allocate_and_assign_ip(service, opts):
             "id": opts.instance_created["primary_network_interface"]["id"],
         },
     }
-    response = requests.post(url, headers=headers, json=data, params=params)
+    response = get_transport().send(
+        "POST", url, headers=headers, json=data, params=params,
+        timeout=current_deadline().request_timeout(REQUEST_TIMEOUT))
     assert response.status_code == 201
-    opts.allocated_floating_ip_id = response.json()["id"]
-    return response.json()["address"]
+    floating_ip = response_json(response)
+    opts.allocated_floating_ip_id = floating_ip["id"]
+    return floating_ip["address"]
 
 
-def get_zone_and_subnet_id(opts):
+def get_zone_and_subnet_id(service, opts):
     """
     From command-line opts, assign opts.zone and opts.subnet_id.
-    The zone (lab/location) must be a valid choice within --region.
+    The zone (lab/location) must be a valid choice within --region.  The
+    best-scored candidate (see SubnetPlacement) is selected.
     """
-    random_subnet = random.choice(opts.subnets_ids)
-    opts.zone, opts.subnet_id = random_subnet.split(":")
+    opts.placement = SubnetPlacement(service, opts.state_dir, opts.region)
+    opts.subnet_candidates = [
+        (zone, subnet_id)
+        for zone, subnet_id in opts.placement.rank(opts.subnets_ids, opts.instance_name)
+        # we wouldn't have a Floating IP for the instance elsewhere
+        if not opts.floating_ip_per_subnet_map
+        or subnet_id in opts.floating_ip_per_subnet_map
+    ]
+    if not opts.subnet_candidates:
+        raise RuntimeError("No --subnets-ids candidate has a Floating IP configured")
+    opts.zone, opts.subnet_id = opts.subnet_candidates[0]
+    log.info("Selected zone %s, subnet %s", opts.zone, opts.subnet_id)
 
 
 def _get_private_ip_of_instance(instance_id, service):
@@ -93,7 +128,7 @@ def _get_private_ip_of_instance(instance_id, service):
         if private_ip != "0.0.0.0":
             return private_ip
 
-        sleep(5)
+        current_deadline().sleep(5)
 
     raise TimeoutError("Instance creation took too much time")
 
@@ -109,13 +144,86 @@ def check_field_len(config, itemspec, max_length):
     if len(to_check) <= max_length:
         return
     log.error("Field %s is longer than %s characters: %s",
-              ".".join(itemspec), max_length, to_check)
-    sys.exit(1)
+              ".".join(map(str, itemspec)), max_length, to_check)
+    raise ResallocIBMCloudException(f"Field {to_check} is too long")
+
+
+def is_capacity_error(error):
+    """
+    Return True if the ApiException ERROR says that the zone is out of
+    capacity for the requested profile, or that we hit a quota.
+    """
+    codes = []
+    response = getattr(error, "http_response", None)
+    if response is not None:
+        try:
+            codes = [item.get("code")
+                     for item in response_json(response).get("errors", [])]
+        except (ValueError, AttributeError):
+            pass
+    if any(code in CAPACITY_ERROR_CODES for code in codes):
+        return True
+    message = str(getattr(error, "message", "") or "").lower()
+    return "capacity" in message or "quota" in message
+
+
+def _failover_candidates(opts):
+    """
+    Generate (instance_type, zone, subnet_id) triples to try, in order.  The
+    requested --instance-type is tried in all the ranked zones/subnets first,
+    then the --fallback-instance-types.
+    """
+    for instance_type in [opts.instance_type] + list(opts.fallback_instance_types or []):
+        for zone, subnet_id in opts.subnet_candidates:
+            yield instance_type, zone, subnet_id
+
+
+def create_instance_with_failover(service, instance_prototype_model, opts):
+    """
+    Send the instance create request.  If IBM Cloud responds that the zone is
+    out of capacity (or we are over quota), immediately retry in the next
+    candidate zone/subnet, or with a fallback profile.  Give up after
+    --failover-timeout seconds (or at the --deadline).  Return the
+    create_instance() response.
+    """
+    deadline = time.monotonic() + current_deadline().timeout(opts.failover_timeout)
+    last_error = None
+    for instance_type, zone, subnet_id in _failover_candidates(opts):
+        if last_error and time.monotonic() > deadline:
+            log.error("Failover timeout %ss exceeded", opts.failover_timeout)
+            break
+
+        if (zone, subnet_id) != (opts.zone, opts.subnet_id):
+            opts.zone, opts.subnet_id = zone, subnet_id
+            if opts.floating_ip_per_subnet_map:
+                select_floating_ip_for_subnet(opts)
+        opts.instance_type = instance_type
+
+        instance_prototype_model["profile"]["name"] = instance_type
+        instance_prototype_model["zone"]["name"] = zone
+        instance_prototype_model["primary_network_interface"]["subnet"]["id"] = subnet_id
+
+        log.info("Create instance request:\n%s",
+                 json.dumps(instance_prototype_model, indent=4))
+        try:
+            response = service.create_instance(instance_prototype_model)
+        except ApiException as error:
+            log.error("Instance creation in zone %s failed: %s", zone, error)
+            if not is_capacity_error(error):
+                raise
+            opts.placement.record_failure(zone)
+            last_error = error
+            continue
+
+        opts.placement.record_success(zone)
+        return response
+
+    raise last_error
 
 
 def create_instance(service, instance_name, opts):
     """
-    Start the VM, name it "instance_name"
+    Start the VM, name it "instance_name", return its IP address
     """
 
     instance_prototype_model = {
@@ -173,11 +281,9 @@ def create_instance(service, instance_name, opts):
     instance_created = None
     opts.allocated_floating_ip_id = None
 
-    log.info("Create instance request:\n%s",
-             json.dumps(instance_prototype_model, indent=4))
+    response = create_instance_with_failover(service, instance_prototype_model, opts)
 
     try:
-        response = service.create_instance(instance_prototype_model)
         instance_created = instance_name
         opts.instance_created = response.get_result()
         log.debug("Instance response: %s", response)
@@ -185,8 +291,13 @@ def create_instance(service, instance_name, opts):
         instance_id = opts.instance_created["id"]
         log.info("Instance ID: %s", instance_id)
 
+        tagging = ticket = flusher = None
         if opts.tags:
-            assign_user_tags(opts.instance_created["crn"], service, opts)
+            # attached in background (batched with the concurrent creates),
+            # while we wait for the instance
+            tagging = TaggingQueue(opts.state_dir, service.authenticator)
+            ticket = tagging.enqueue(opts.instance_created["crn"], list(opts.tags))
+            flusher = tagging.flush_in_background(TAGGING_LINGER)
 
         if opts.no_floating_ip:
             # assuming you have access through to private IP address
@@ -197,35 +308,21 @@ def create_instance(service, instance_name, opts):
             ip_address = allocate_and_assign_ip(service, opts)
 
         wait_for_ssh(ip_address)
-        run_playbook(ip_address, opts.playbook)
-        # Tell the Resalloc clients how to connect to this instance.
-        print(ip_address)
+        if opts.provisioning_playbook:
+            provision(ip_address, opts.provisioning_playbook,
+                      timing_file=playbook_timing_file(opts.state_dir, instance_name))
+        if tagging:
+            flusher.join(current_deadline().timeout(TAGGING_FLUSH_DEADLINE))
+            tagging.settle(ticket)
+        return ip_address
     except:
         if instance_created:
             log.info("Removing the failed machine")
-            delete_instance(service, instance_name, opts)
+            with current_deadline().cleanup():
+                delete_instance(service, instance_name, opts)
         raise
 
 
-def assign_user_tags(crn, service, opts):
-    """
-    Assign tags to the resource according to the CRN within the region.
-    """
-    service_url = "https://tags.global-search-tagging.cloud.ibm.com/v3"
-    url = service_url + "/tags/attach?tag_type=user"
-    headers = {
-        "Accept": "application/json",
-        "Authorization": f"Bearer {service.authenticator.token_manager.get_token()}",
-        "Content-Type": "application/json",
-    }
-    data = {
-        "resources": [{"resource_id": crn}],
-        "tag_names": list(opts.tags),
-    }
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
-
-
 def delete_all_ips(service):
     """
     Go through all reserved IPs, and remove all which are not assigned
@@ -255,16 +352,19 @@ def delete_instance_attempt(service, instance_name, opts):
     """one attempt to delete instance by it's name"""
     log.info("Deleting instance %s", instance_name)
 
+    instances, floating_ips = run_queries(
+        lambda: service.list_instances().get_result()["instances"],
+        lambda: service.list_floating_ips().get_result()["floating_ips"],
+    )
+
     delete_instance_id = None
-    response_list = service.list_instances().get_result()["instances"]
-    for item in response_list:
+    for item in instances:
         log.debug("Available: %s %s %s", item["id"], item["name"], item["status"])
         if instance_name == item["name"]:
             delete_instance_id = item["id"]
 
     floating_ip_id = None
-    response_list = service.list_floating_ips().get_result()["floating_ips"]
-    for floating_ip in response_list:
+    for floating_ip in floating_ips:
         if floating_ip["name"].startswith(instance_name):
             floating_ip_id = floating_ip["id"]
 
@@ -333,17 +433,25 @@ def detect_floating_ip_uuid(service, opts):
                                "not found")
 
     if opts.floating_ip_per_subnet_map:
-        id_in_pool = int(os.environ.get("RESALLOC_ID_IN_POOL", -1))
-        if id_in_pool == -1:
-            raise RuntimeError("--floating-ip-uuid-in-pool requires "
-                               "$RESALLOC_ID_IN_POOL var in environment")
-
-        opts.floating_ip_uuid = opts.floating_ip_per_subnet_map[opts.subnet_id][id_in_pool]
-        log.info("Selected %s-th Floating IP UUID: %s", id_in_pool,
-                 opts.floating_ip_uuid)
+        select_floating_ip_for_subnet(opts)
         return
 
 
+def select_floating_ip_for_subnet(opts):
+    """
+    Select the $RESALLOC_ID_IN_POOL-th Floating IP UUID configured for
+    opts.subnet_id.
+    """
+    id_in_pool = int(os.environ.get("RESALLOC_ID_IN_POOL", -1))
+    if id_in_pool == -1:
+        raise RuntimeError("--floating-ip-uuid-in-pool requires "
+                           "$RESALLOC_ID_IN_POOL var in environment")
+
+    opts.floating_ip_uuid = opts.floating_ip_per_subnet_map[opts.subnet_id][id_in_pool]
+    log.info("Selected %s-th Floating IP UUID: %s", id_in_pool,
+             opts.floating_ip_uuid)
+
+
 def prepare_opts_floating_ip_uuid_map(opts):
     """
     Construct opts.floating_ip_uuid_in_subnet map from
@@ -357,33 +465,208 @@ def prepare_opts_floating_ip_uuid_map(opts):
             opts.floating_ip_per_subnet_map[subnet_id].append(ip_id)
 
 
+def prepare_instance_name(opts):
+    """
+    Set opts.instance_name (IBM Cloud compatible variant of opts.name)
+    """
+    name = resalloc_to_ibmcloud_name(opts.name)
+    opts.instance_name = name
+    opts.instance = "production" if "-prod-" in name else "devel"
+
+
+def _vpc_catalog(service, opts):
+    return Catalog(opts.state_dir, f"vpc-{opts.region}", {
+        "images": lambda: {
+            image["id"]: {"name": image["name"], "status": image["status"]}
+            for image in service.list_all("/images", "images")
+        },
+        "profiles": lambda: {
+            profile["name"]: {}
+            for profile in service.list_all("/instance/profiles", "profiles",
+                                            limit=None)
+        },
+        "keys": lambda: {
+            key["id"]: {"name": key["name"]}
+            for key in service.list_all("/keys", "keys")
+        },
+        "security_groups": lambda: {
+            group["id"]: {"vpc": group["vpc"]["id"]}
+            for group in service.list_all("/security_groups", "security_groups")
+        },
+        "vpcs": lambda: {
+            vpc["id"]: {"name": vpc["name"]}
+            for vpc in service.list_all("/vpcs", "vpcs")
+        },
+    })
+
+
+def _existing_fallback_profiles(catalog, opts):
+    fallbacks = []
+    for instance_type in opts.fallback_instance_types or []:
+        if catalog.find("profiles", instance_type) is None:
+            log.warning("Fallback profile %s not found, skipped", instance_type)
+            continue
+        fallbacks.append(instance_type)
+    return fallbacks
+
+
+def preflight_check(service, opts):
+    """
+    Validate the image, profiles, SSH key, security group and VPC requested
+    by the create command options against the (cached) catalog of the region,
+    before anything is allocated.  Unknown --fallback-instance-types are
+    dropped.  Raise ResallocIBMCloudException for invalid requests.
+    """
+    catalog = _vpc_catalog(service, opts)
+    problems = []
+    try:
+        image = catalog.find("images", opts.image_uuid)
+        if image is None:
+            problems.append(f"image {opts.image_uuid} not found")
+        elif image["status"] == "deprecated":
+            log.warning("Image %s (%s) is deprecated", image["name"], opts.image_uuid)
+        elif image["status"] != "available":
+            problems.append(f"image {image['name']} is {image['status']}")
+
+        if catalog.find("profiles", opts.instance_type) is None:
+            problems.append(f"instance profile {opts.instance_type} not found")
+        opts.fallback_instance_types = _existing_fallback_profiles(catalog, opts)
+
+        if catalog.find("keys", opts.ssh_key_id) is None:
+            problems.append(f"SSH key {opts.ssh_key_id} not found")
+        if catalog.find("vpcs", opts.vpc_id) is None:
+            problems.append(f"VPC {opts.vpc_id} not found")
+        group = catalog.find("security_groups", opts.security_group_id)
+        if group is None:
+            problems.append(f"security group {opts.security_group_id} not found")
+        elif group["vpc"] != opts.vpc_id:
+            problems.append(f"security group {opts.security_group_id} is not in "
+                            f"VPC {opts.vpc_id}")
+    except (ApiException, requests.RequestException):
+        # don't block the instance creation only because we can't check
+        log.exception("Can not download the catalog, skipping preflight checks")
+        return
+
+    if problems:
+        for problem in problems:
+            log.error("Preflight check failed: %s", problem)
+        raise ResallocIBMCloudException("Preflight check failed: " + ", ".join(problems))
+
+
+def create_vm(service, opts):
+    """
+    Start the VM opts.name according to the create command options, provision
+    it with playbook, and return its IP address.
+    """
+    prepare_instance_name(opts)
+    # Perform these steps *before* starting the machine allocation.  These
+    # methods performs some offline checks and may also query the cloud
+    # (generating additional API traffic).  These checks could result in
+    # various failures, and if that happens, the instance allocation would
+    # have been unnecessary (triggering subsequent deallocation).  The offline
+    # ones go first, while the token is still being fetched in background.
+    # construct a subnet_id → list_of_ips map for later convenience
+    prepare_opts_floating_ip_uuid_map(opts)
+    opts.provisioning_playbook = BakedImages(
+        opts.state_dir, f"vpc-{opts.region}").provisioning_playbook(opts)
+    preflight_check(service, opts)
+    get_zone_and_subnet_id(service, opts)
+    detect_floating_ip_uuid(service, opts)
+    # High chance the machine will start fine, let's try now.
+    return create_instance(service, opts.instance_name, opts)
+
+
+def _wait_for_status(get_status, wanted, what, timeout):
+    """
+    Poll GET_STATUS() till it returns WANTED, give up after TIMEOUT seconds.
+    """
+    deadline = time.monotonic() + current_deadline().timeout(timeout)
+    while True:
+        status = get_status()
+        log.debug("%s is %s", what, status)
+        if status == wanted:
+            return
+        if status == "failed" or time.monotonic() > deadline:
+            raise ResallocIBMCloudException(f"{what} is {status}, not {wanted}")
+        current_deadline().sleep(10)
+
+
+def bake_image(service, opts):
+    """
+    Start a temporary instance from opts.image_uuid, provision it with
+    opts.playbook, stop it, and capture its boot volume as a new custom image
+    opts.image_name.  The temporary instance is removed afterwards.  Return
+    the new image ID.
+    """
+    content_hash = playbook_hash(opts.playbook)
+    opts.name = opts.image_name + "-bake"
+    create_vm(service, opts)
+    try:
+        instance_id = opts.instance_created["id"]
+        log.info("Stopping instance %s", opts.instance_name)
+        service.create_instance_action(instance_id, "stop")
+        _wait_for_status(
+            lambda: service.get_instance(instance_id).get_result()["status"],
+            "stopped", f"Instance {opts.instance_name}", timeout=600)
+
+        image_prototype = {
+            "name": opts.image_name,
+            "source_volume": {
+                "id": opts.instance_created["boot_volume_attachment"]["volume"]["id"],
+            },
+        }
+        if opts.resource_group_id:
+            image_prototype["resource_group"] = {"id": opts.resource_group_id}
+        check_field_len(image_prototype, ["name"], 63)
+        log.info("Capturing image %s", opts.image_name)
+        image_id = service.create_image(image_prototype).get_result()["id"]
+        _wait_for_status(
+            lambda: service.get_image(image_id).get_result()["status"],
+            "available", f"Image {opts.image_name}", timeout=3600)
+    finally:
+        with current_deadline().cleanup():
+            delete_instance(service, opts.instance_name, opts)
+
+    BakedImages(opts.state_dir, f"vpc-{opts.region}").record(
+        image_id, opts.playbook, content_hash)
+    log.info("Image %s (%s) baked", opts.image_name, image_id)
+    return image_id
+
+
+def delete_vm(service, opts):
+    """
+    Delete the VM opts.name, and all its resources.
+    """
+    prepare_instance_name(opts)
+    delete_instance(service, opts.instance_name, opts)
+
+
 def main():
     """Entrypoint to the script."""
 
     opts = vm_arg_parser().parse_args()
 
     setup_logging(opts.log_level)
+    install_deadline(getattr(opts, "deadline", None))
 
     service = get_service(opts)
 
-    if hasattr(opts, "name"):
-        name = resalloc_to_ibmcloud_name(opts.name)
-        opts.instance_name = name
-        opts.instance = "production" if "-prod-" in name else "devel"
-
     if opts.subparser == "create":
-        # Perform these steps *before* starting the machine allocation.  These
-        # methods performs some offline checks and may also query the cloud
-        # (generating additional API traffic).  These checks could result in
-        # various failures, and if that happens, the instance allocation would
-        # have been unnecessary (triggering subsequent deallocation).
-        # construct a subnet_id → list_of_ips map for later convenience
-        prepare_opts_floating_ip_uuid_map(opts)
-        get_zone_and_subnet_id(opts)
-        detect_floating_ip_uuid(service, opts)
-        # High chance the machine will start fine, let's try now.
-        create_instance(service, name, opts)
+        try:
+            ip_address = create_vm(service, opts)
+        except ResallocIBMCloudException as exc:
+            log.error("%s", exc)
+            sys.exit(1)
+        # Tell the Resalloc clients how to connect to this instance.
+        print(ip_address)
+    elif opts.subparser == "bake":
+        try:
+            image_id = bake_image(service, opts)
+        except ResallocIBMCloudException as exc:
+            log.error("%s", exc)
+            sys.exit(1)
+        print(image_id)
     elif opts.subparser == "delete":
-        delete_instance(service, name, opts)
+        delete_vm(service, opts)
     elif opts.subparser == "delete-free-floating-ips":
         delete_all_ips(service)
@@ -0,0 +1,110 @@
+"""
+Incremental parsing of large JSON listings, like
+
+    {"pvmInstances": [{...}, {...}, ...], "other": "fields"}
+
+The array items are yielded one by one while the response is still being
+downloaded, so we never keep the whole document (nor the whole parsed
+structure) in memory.
+"""
+
+import codecs
+import json
+
+_WHITESPACE = " \t\n\r"
+
+
+class _Buffer:
+    """
+    Text buffer filled from an iterator of (byte) chunks on demand
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read the next chunk, return False at EOF"""
+        if self.eof:
+            return False
+        # drop the already processed part
+        self.text = self.text[self.pos:]
+        self.pos = 0
+        for chunk in self.chunks:
+            if isinstance(chunk, bytes):
+                chunk = self.decoder.decode(chunk)
+            if chunk:
+                self.text += chunk
+                return True
+        self.text += self.decoder.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """Skip whitespace, and return the next character ("" at EOF)"""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, character):
+        """Consume the expected CHARACTER"""
+        found = self.peek()
+        if found != character:
+            raise ValueError(f"Expected '{character}' in JSON stream, found '{found}'")
+        self.pos += 1
+
+    def decode(self, decoder):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+                # a number (or literal) might continue in the next chunk
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_json_array(chunks, key):
+    """
+    Yield the items of the array stored under KEY in the top-level JSON object
+    read from CHUNKS (iterable of bytes or str, e.g. response.iter_content()).
+    Other top-level members are parsed and dropped.
+    """
+    decoder = json.JSONDecoder()
+    buf = _Buffer(chunks)
+    buf.expect("{")
+    if buf.peek() == "}":
+        return
+
+    while True:
+        member = buf.decode(decoder)
+        buf.expect(":")
+        if member == key and buf.peek() == "[":
+            buf.expect("[")
+            if buf.peek() == "]":
+                buf.pos += 1
+            else:
+                while True:
+                    yield buf.decode(decoder)
+                    if buf.peek() == "]":
+                        buf.pos += 1
+                        break
+                    buf.expect(",")
+        else:
+            buf.decode(decoder)
+
+        if buf.peek() == "}":
+            return
+        buf.expect(",")
@@ -3,9 +3,12 @@ List all IBM Cloud volumes that are in Deleting state.  This helps with
 support-case reporting to IBM folks.
 """
 
-from resalloc_ibm_cloud.helpers import get_service
+from resalloc_ibm_cloud.helpers import get_api_key, get_region_service
 from resalloc_ibm_cloud.argparsers import list_deleting_volumes_parser
 from resalloc_ibm_cloud.constants import LIMIT
+from resalloc_ibm_cloud.hedging import hedging_policy
+from resalloc_ibm_cloud.ibm_cloud_list_vms import volume_record
+from resalloc_ibm_cloud.listing import print_records
 
 
 def main():
@@ -14,12 +17,19 @@ def main():
     """
 
     opts = list_deleting_volumes_parser().parse_args()
-    service = get_service(opts)
-    volumes = service.list_volumes(limit=LIMIT).result["volumes"]
-    for volume in volumes:
-        if volume["status"] in ["available"]:
-            continue
-        print(f"{volume['id']} (name={volume['name']}) -> {volume['status']}")
+    api_key = get_api_key(opts.token_file)
+    hedging = hedging_policy(opts)
+
+    def _list_region(region):
+        service = get_region_service(api_key, region, hedging)
+        volumes = service.list_volumes(limit=LIMIT).result["volumes"]
+        return [volume_record(volume, region) for volume in volumes
+                if volume["status"] not in ["available"]]
+
+    print_records(
+        opts, opts.region, _list_region,
+        lambda record: f"{record.id} (name={record.cloud_name}) -> {record.status}",
+    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,164 @@
+"""
+Output of the list utilities.  Each listing pass produces ResourceRecords;
+these are either printed as the traditional one-name-per-line output, or
+streamed as JSON lines (--format=jsonl) for the upper level tooling.  With
+--watch, only the changes between the listing passes are printed.
+"""
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional
+
+from resalloc_ibm_cloud.helpers import print_listing, run_concurrently
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ResourceRecord:  # pylint: disable=too-many-instance-attributes
+    """
+    One cloud resource (instance, volume, floating IP) found by a listing
+    """
+
+    type: str
+    id: str
+    # resalloc resource name this cloud resource belongs to
+    name: str
+    # the name as seen in the cloud
+    cloud_name: str
+    status: str
+    created: Optional[str]
+    zone: Optional[str]
+    # ID of the instance this resource is attached to (volumes, IPs)
+    instance: Optional[str]
+    # region or CRN of the end-point the resource was found in
+    origin: str
+
+    def to_json(self) -> str:
+        """One-line JSON representation"""
+        return json.dumps(asdict(self), sort_keys=True)
+
+
+def print_records(opts, endpoints: list, list_endpoint: Callable,
+                  text_line: Callable) -> None:
+    """
+    Call LIST_ENDPOINT(endpoint) for all ENDPOINTS concurrently, each call
+    returns a list of ResourceRecords.  Print them according to opts.format;
+    in the "text" format TEXT_LINE(record) gives the printed line.
+    """
+    if opts.format == "jsonl":
+        # Stream the records as soon as each end-point is listed
+        with ThreadPoolExecutor(max_workers=max(len(endpoints), 1)) as executor:
+            futures = [executor.submit(list_endpoint, endpoint)
+                       for endpoint in endpoints]
+            for future in as_completed(futures):
+                for record in future.result():
+                    print(record.to_json(), flush=True)
+        return
+
+    lines = []
+    for records in run_concurrently(list_endpoint, endpoints):
+        lines.extend((text_line(record), record.origin) for record in records)
+    print_listing(lines, opts.print_origin)
+
+
+class InventoryWatcher:
+    """
+    Keep the inventory of resalloc resources in memory, refresh it
+    periodically, and print only the changes (see the --watch option).
+    """
+
+    def __init__(self, opts, endpoints: list, list_endpoint: Callable):
+        self.opts = opts
+        self.endpoints = endpoints
+        self.list_endpoint = list_endpoint
+        # endpoint -> {key: ResourceRecord}
+        self.inventory = {}
+        self.interval = opts.watch_min_interval
+
+    def _key(self, record: ResourceRecord):
+        if self.opts.print_origin:
+            return (record.name, record.origin)
+        return record.name
+
+    def _list_endpoint(self, endpoint):
+        try:
+            records = self.list_endpoint(endpoint)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Keep the last known state, so we don't print fake changes
+            log.exception("Can not list %s, keeping the previous state", endpoint)
+            return self.inventory.get(endpoint, {})
+
+        resources = {}
+        for record in records:
+            key = self._key(record)
+            # The instance status wins over its volumes and IPs
+            if key not in resources or record.type == "instance":
+                resources[key] = record
+        return resources
+
+    def _merged(self) -> dict:
+        merged = {}
+        for endpoint in self.endpoints:
+            for key, record in self.inventory.get(endpoint, {}).items():
+                merged.setdefault(key, record)
+        return merged
+
+    def _print(self, event: str, record: ResourceRecord) -> None:
+        if self.opts.format == "jsonl":
+            data = asdict(record)
+            data["event"] = event
+            line = json.dumps(data, sort_keys=True)
+        else:
+            line = event + record.name
+            if event == "~":
+                line += " " + record.status
+            if self.opts.print_origin:
+                line += " " + record.origin
+        print(line, flush=True)
+
+    def refresh(self) -> int:
+        """
+        Re-list all the end-points, print the differences against the previous
+        state and return their number
+        """
+        old = self._merged()
+        results = run_concurrently(self._list_endpoint, self.endpoints)
+        self.inventory = dict(zip(self.endpoints, results))
+        new = self._merged()
+
+        changes = 0
+        for key, record in new.items():
+            if key not in old:
+                self._print("+", record)
+            elif old[key].status != record.status:
+                self._print("~", record)
+            else:
+                continue
+            changes += 1
+        for key, record in old.items():
+            if key not in new:
+                self._print("-", record)
+                changes += 1
+        return changes
+
+    def run(self) -> None:
+        """
+        Refresh forever.  The interval is reset to the minimum when something
+        changes (more changes are likely to follow), and doubled up to the
+        maximum while nothing happens.
+        """
+        try:
+            while True:
+                if self.refresh():
+                    self.interval = self.opts.watch_min_interval
+                else:
+                    self.interval = min(self.interval * 2,
+                                        self.opts.watch_max_interval)
+                log.debug("Next refresh in %ss", self.interval)
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
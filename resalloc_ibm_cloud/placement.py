@@ -0,0 +1,140 @@
+"""
+Choose the ZONE:SUBNET_ID pair for a new VPC instance.
+"""
+
+import logging
+import os
+import time
+import zlib
+
+from resalloc_ibm_cloud.constants import (
+    LIMIT,
+    SUBNET_CACHE_TTL,
+    ZONE_FAILURE_HALF_LIFE,
+)
+from resalloc_ibm_cloud.state import StateFile
+
+log = logging.getLogger(__name__)
+
+# Subnets with this many free addresses (or more) are considered equal.
+FREE_IPS_SATURATION = 32
+# Score penalty for every pool instance already running in the zone, and for
+# every (decayed) recent failure in the zone.
+POOL_INSTANCE_PENALTY = 0.1
+ZONE_FAILURE_PENALTY = 1.0
+
+
+def _decayed(value, timestamp, now):
+    """Exponentially decay VALUE recorded at TIMESTAMP"""
+    return value * 0.5 ** ((now - timestamp) / ZONE_FAILURE_HALF_LIFE)
+
+
+class SubnetPlacement:
+    """
+    Score the --subnets-ids candidates by (a) the number of available IP
+    addresses in the subnet (cached in a local state file), (b) the number of
+    pool instances already started in the zone, and (c) the decaying rate of
+    recent instance-creation failures in the zone (kept in the state file, too).
+    """
+
+    def __init__(self, service, state_dir, region):
+        self.service = service
+        self.state = StateFile(state_dir, f"placement-{region}")
+
+    def _available_ips(self, subnet_ids, now):
+        subnets = self.state.read().get("subnets", {})
+        fetched = {}
+        for subnet_id in subnet_ids:
+            cached = subnets.get(subnet_id)
+            if cached and now - cached["timestamp"] < SUBNET_CACHE_TTL:
+                continue
+            # don't block the concurrent creates by the lock while waiting
+            # for the API
+            subnet = self.service.get_subnet(subnet_id).get_result()
+            fetched[subnet_id] = {
+                "available": subnet["available_ipv4_address_count"],
+                "timestamp": now,
+            }
+
+        if fetched:
+            with self.state.update() as data:
+                data.setdefault("subnets", {}).update(fetched)
+            subnets.update(fetched)
+
+        return {subnet_id: subnets[subnet_id]["available"]
+                for subnet_id in subnet_ids}
+
+    def _pool_instances_per_zone(self):
+        pool_id = os.environ.get("RESALLOC_POOL_ID")
+        if not pool_id:
+            return {}
+        prefix = pool_id.replace("_", "-")
+        counts = {}
+        instances = self.service.list_instances(limit=LIMIT).result["instances"]
+        for instance in instances:
+            if not instance["name"].startswith(prefix):
+                continue
+            zone = instance["zone"]["name"]
+            counts[zone] = counts.get(zone, 0) + 1
+        return counts
+
+    def _zone_failures(self, now):
+        zones = self.state.read().get("zones", {})
+        return {zone: _decayed(info["failures"], info["timestamp"], now)
+                for zone, info in zones.items()}
+
+    def rank(self, candidates, instance_name):
+        """
+        Return the list of (zone, subnet_id) pairs parsed from CANDIDATES (the
+        ZONE:SUBNET_ID strings), the best candidate first.  The order is
+        deterministic; candidates with equal score are ordered by a hash of
+        the INSTANCE_NAME so the instances spread evenly.
+        """
+        now = time.time()
+        pairs = [tuple(candidate.split(":")) for candidate in candidates]
+        free_ips = self._available_ips([subnet for _, subnet in pairs], now)
+        instances = self._pool_instances_per_zone()
+        failures = self._zone_failures(now)
+
+        scored = []
+        for zone, subnet_id in pairs:
+            available = free_ips[subnet_id]
+            if available <= 0:
+                score = float("-inf")
+            else:
+                score = min(available, FREE_IPS_SATURATION) / FREE_IPS_SATURATION
+                score -= POOL_INSTANCE_PENALTY * instances.get(zone, 0)
+                score -= ZONE_FAILURE_PENALTY * failures.get(zone, 0)
+            log.debug("Placement candidate %s:%s, free IPs %s, pool instances %s, "
+                      "failure rate %.2f, score %.2f", zone, subnet_id, available,
+                      instances.get(zone, 0), failures.get(zone, 0), score)
+            tie_breaker = zlib.crc32(f"{instance_name}:{subnet_id}".encode("utf-8"))
+            scored.append((-score, tie_breaker, zone, subnet_id))
+
+        return [(zone, subnet_id) for _, _, zone, subnet_id in sorted(scored)]
+
+    def record_failure(self, zone):
+        """
+        Remember that the instance creation in ZONE failed just now.
+        """
+        now = time.time()
+        with self.state.update() as data:
+            zones = data.setdefault("zones", {})
+            info = zones.get(zone, {"failures": 0, "timestamp": now})
+            zones[zone] = {
+                "failures": _decayed(info["failures"], info["timestamp"], now) + 1,
+                "timestamp": now,
+            }
+
+    def record_success(self, zone):
+        """
+        The instance creation in ZONE succeeded, so the capacity problems (if
+        any) are likely resolved.  Halve the failure rate.
+        """
+        now = time.time()
+        with self.state.update() as data:
+            info = data.get("zones", {}).get(zone)
+            if not info:
+                return
+            info["failures"] = _decayed(info["failures"], info["timestamp"], now) / 2
+            info["timestamp"] = now
@@ -2,25 +2,61 @@
 PowerVS API client implementation (at least what we need).
 """
 
-import json
 import logging
+from typing import Optional
 
 import backoff
 import requests
 
+from resalloc_ibm_cloud.codec import response_json
+from resalloc_ibm_cloud.constants import REQUEST_TIMEOUT
+from resalloc_ibm_cloud.deadline import current_deadline
+from resalloc_ibm_cloud.hedging import HedgingPolicy
+from resalloc_ibm_cloud.helpers import log_json
+from resalloc_ibm_cloud.jsonstream import iter_json_array
 from resalloc_ibm_cloud.powervs.credentials import PowerVSCredentials
+from resalloc_ibm_cloud.powervs.records import PowerVSInstance, PowerVSVolume
+from resalloc_ibm_cloud.transport import get_transport
+
+# Download (and parse) large listings in chunks of this size
+STREAM_CHUNK_SIZE = 64 * 1024
 
 logger = logging.getLogger(__name__)
 
 
+# Retry on server errors (5xx) and connection issues, for up to 5 minutes (or
+# till the --deadline)
+_retry_on_server_errors = backoff.on_exception(
+    backoff.expo,
+    requests.RequestException,
+    max_time=lambda: current_deadline().timeout(300),
+    # only retry on server errors
+    giveup=lambda e: not PowerVSClient._is_server_error(PowerVSClient, e),
+    # 2, 4, 8, 16, ...
+    factor=2,
+    jitter=backoff.full_jitter,
+    # custom warning log on backoff for more informative retries
+    on_backoff=lambda details: logger.warning(
+        "Retrying request due to %s: %s. Retry %d in %.1fs. Total elapsed time: %.1fs",
+        details["exception"].__class__.__name__,
+        str(details["exception"]),
+        details["tries"],
+        details["wait"],
+        details["elapsed"],
+    ),
+)
+
+
 class PowerVSClient:
     """
     Client for interacting with the IBM Cloud PowerVS API
     """
 
-    def __init__(self, credentials: PowerVSCredentials) -> None:
+    def __init__(self, credentials: PowerVSCredentials,
+                 hedging: Optional[HedgingPolicy] = None) -> None:
         self.credentials = credentials
         self.cloud_instance_id = credentials.cloud_instance_id
+        self.hedging = hedging
 
     def _is_server_error(self, exception):
         """
@@ -37,25 +73,62 @@ class PowerVSClient:
             return 500 <= exception.response.status_code < 600
         return isinstance(exception, (requests.ConnectionError, requests.Timeout))
 
-    @backoff.on_exception(
-        backoff.expo,
-        requests.RequestException,
-        max_time=300,
-        # only retry on server errors
-        giveup=lambda e: not PowerVSClient._is_server_error(PowerVSClient, e),
-        # 2, 4, 8, 16, ...
-        factor=2,
-        jitter=backoff.full_jitter,
-        # custom warning log on backoff for more informative retries
-        on_backoff=lambda details: logger.warning(
-            "Retrying request due to %s: %s. Retry %d in %.1fs. Total elapsed time: %.1fs",
-            details["exception"].__class__.__name__,
-            str(details["exception"]),
-            details["tries"],
-            details["wait"],
-            details["elapsed"],
-        ),
-    )
+    def _http(self, method: str, url: str, **kwargs) -> requests.Response:
+        timeout = current_deadline().request_timeout(REQUEST_TIMEOUT)
+
+        def _request():
+            return get_transport().send(method, url, headers=self.credentials.headers,
+                                        timeout=timeout, **kwargs)
+        if self.hedging:
+            return self.hedging.send(method, url, _request)
+        return _request()
+
+    def _send(
+        self,
+        method: str,
+        path: str,
+        params: dict = None,
+        json_data: dict = None,
+        broker: bool = False,
+        stream: bool = False,
+    ) -> requests.Response:
+        base_url = (
+            self.credentials.broker_url if broker else self.credentials.service_url
+        )
+
+        # set prefix path for powervs API workspace (tenant-level paths are
+        # not workspace-specific)
+        if not broker and not path.startswith(
+            (f"/cloud-instances/{self.cloud_instance_id}", "/tenants/")
+        ):
+            path = f"/cloud-instances/{self.cloud_instance_id}{path}"
+
+        url = f"{base_url}{path}"
+        logger.debug("Request %s %s", method, url)
+
+        if json_data:
+            log_json(logger, logging.DEBUG, "Request body: ", json_data)
+
+        response = self._http(method, url, params=params, json=json_data,
+                              stream=stream)
+        if response.status_code == 401:
+            # the token may have been revoked or expired in the meantime,
+            # refresh it and replay the request (once)
+            logger.warning("Request unauthorized, refreshing the token: %s %s",
+                           method, url)
+            self.credentials.refresh()
+            response = self._http(method, url, params=params, json=json_data,
+                                  stream=stream)
+
+        try:
+            response.raise_for_status()
+        except requests.HTTPError:
+            logger.error("API request failed: %s %s - %s", method, url, response.text)
+            raise
+
+        return response
+
+    @_retry_on_server_errors
     def request(
         self,
         method: str,
@@ -70,7 +143,8 @@ class PowerVSClient:
         The method will automatically retry on server errors (5xx) and connection issues
         for up to 5 minutes using an exponential backoff strategy with jitter.
         Client errors (4xx) are not retried as they typically indicate a problem with
-        the request that won't be resolved by retrying.
+        the request that won't be resolved by retrying.  The only exception is
+        401, the token is refreshed and the request replayed once.
 
         Args:
             method: HTTP method
@@ -88,38 +162,37 @@ class PowerVSClient:
             requests.RequestException: For other request-related errors after
                 retries are exhausted
         """
-        base_url = (
-            self.credentials.broker_url if broker else self.credentials.service_url
-        )
+        response = self._send(method, path, params=params, json_data=json_data,
+                              broker=broker)
 
-        # set prefix path for powervs API workspace
-        if not broker and not path.startswith(
-            f"/cloud-instances/{self.cloud_instance_id}"
-        ):
-            path = f"/cloud-instances/{self.cloud_instance_id}{path}"
+        resp = response_json(response)
+        if resp is None:
+            return {}
 
-        url = f"{base_url}{path}"
-        logger.debug("Request %s %s", method, url)
+        log_json(logger, logging.DEBUG, "Received response: ", resp)
+        return resp
 
-        if json_data:
-            logger.debug("Request body: %s", json.dumps(json_data, indent=4))
-
-        response = requests.request(
-            method, url, headers=self.credentials.headers, params=params, json=json_data
-        )
-
-        try:
-            response.raise_for_status()
-        except requests.HTTPError:
-            logger.error("API request failed: %s %s - %s", method, url, response.text)
-            raise
+    @_retry_on_server_errors
+    def list_items(self, path: str, key: str, record_class: type) -> list:
+        """
+        GET a (potentially large) listing, and parse it incrementally while
+        downloading.  Retried the same way as request().
 
-        if response.content:
-            resp = response.json()
-            logger.debug("Received response: %s", json.dumps(resp, indent=4))
-            return resp
+        Args:
+            path: API path
+            key: The response JSON field containing the list of items
+            record_class: Class to convert the item dicts to
 
-        return {}
+        Returns:
+            List of RECORD_CLASS objects
+        """
+        with self._send("GET", path, stream=True) as response:
+            items = [
+                record_class(item)
+                for item in iter_json_array(response.iter_content(STREAM_CHUNK_SIZE), key)
+            ]
+        logger.debug("Received %d items from %s", len(items), path)
+        return items
 
     def create_instance(self, instance_data: dict) -> dict:
         """
@@ -131,10 +204,8 @@ class PowerVSClient:
         Returns:
             Created instance details
         """
-        logger.info(
-            "Creating PowerVS instance with body: %s",
-            json.dumps(instance_data, indent=4),
-        )
+        log_json(logger, logging.INFO, "Creating PowerVS instance with body: ",
+                 instance_data)
 
         return self.request(
             "POST",
@@ -154,6 +225,24 @@ class PowerVSClient:
         """
         return self.request("GET", f"/pvm-instances/{instance_id}")
 
+    def update_instance(self, instance_id: str, json_data: dict) -> dict:
+        """
+        Update a PowerVS instance (e.g. rename it)
+
+        Args:
+            instance_id: Instance ID
+            json_data: Updated instance data
+
+        Returns:
+            Update response
+        """
+        logger.info("Updating PowerVS instance with ID: %s", instance_id)
+        return self.request(
+            "PUT",
+            f"/pvm-instances/{instance_id}",
+            json_data=json_data,
+        )
+
     def delete_instance(
         self,
         instance_id: str,
@@ -172,15 +261,49 @@ class PowerVSClient:
             json_data={"delete_data_volumes": delete_data_volumes},
         )
 
-    def list_instances(self) -> list[dict]:
+    def instance_action(self, instance_id: str, action: str) -> None:
+        """
+        Perform an action (start, stop, hard-reboot, ...) on a PowerVS instance
+
+        Args:
+            instance_id: Instance ID
+            action: Name of the action
+        """
+        logger.info("Requesting %s of PowerVS instance %s", action, instance_id)
+        self.request(
+            "POST",
+            f"/pvm-instances/{instance_id}/action",
+            json_data={"action": action},
+        )
+
+    def capture_instance(self, instance_id: str, image_name: str) -> None:
+        """
+        Capture a PowerVS instance as a new image in the workspace image
+        catalog (asynchronously)
+
+        Args:
+            instance_id: Instance ID
+            image_name: Name of the new image
+        """
+        logger.info("Capturing PowerVS instance %s as image %s", instance_id,
+                    image_name)
+        self.request(
+            "POST",
+            f"/pvm-instances/{instance_id}/capture",
+            json_data={
+                "captureName": image_name,
+                "captureDestination": "image-catalog",
+            },
+        )
+
+    def list_instances(self) -> list[PowerVSInstance]:
         """
         List all PowerVS instances
 
         Returns:
             List of instances
         """
-        response = self.request("GET", "/pvm-instances")
-        return response.get("pvmInstances", [])
+        return self.list_items("/pvm-instances", "pvmInstances", PowerVSInstance)
 
     def create_volume(self, volume_data: dict) -> dict:
         """
@@ -192,9 +315,8 @@ class PowerVSClient:
         Returns:
             Created volume details
         """
-        logger.info(
-            "Creating PowerVS volume with body: %s", json.dumps(volume_data, indent=4)
-        )
+        log_json(logger, logging.INFO, "Creating PowerVS volume with body: ",
+                 volume_data)
         return self.request(
             "POST",
             "/volumes",
@@ -256,11 +378,11 @@ class PowerVSClient:
             f"/pvm-instances/{instance_id}/volumes/{volume_id}",
         )
 
-    def list_volumes(self) -> list[dict]:
+    def list_volumes(self) -> list[PowerVSVolume]:
         """
         List all PowerVS volumes
 
         Returns:
             List of volumes
         """
-        return self.request("GET", "/volumes").get("volumes", [])
+        return self.list_items("/volumes", "volumes", PowerVSVolume)
@@ -2,24 +2,53 @@
 PowerVS credentials management.
 """
 
-import subprocess
 from dataclasses import dataclass
+from typing import Optional
 
 from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
 
+from resalloc_ibm_cloud.bootstrap import Bootstrap
+from resalloc_ibm_cloud.helpers import get_api_key
+from resalloc_ibm_cloud.transport import iam_authenticator
+
 
 @dataclass
 class PowerVSCredentials:
-    """For storing PowerVS authentication credentials"""
+    """
+    For storing PowerVS authentication credentials.  The authenticator is
+    kept, so the token is renewed before it expires (PowerVS operations can
+    take tens of minutes).
+    """
 
-    token: str
     crn: str
+    authenticator: IAMAuthenticator
+    bootstrap: Optional[Bootstrap] = None
+
+    @property
+    def token(self) -> str:
+        """Bearer token, refreshed by the authenticator if needed"""
+        if self.bootstrap:
+            return self.bootstrap.token()
+        return self.authenticator.token_manager.get_token()
+
+    def refresh(self) -> None:
+        """Unconditionally request a new token, e.g. after a 401 response"""
+        token_manager = self.authenticator.token_manager
+        # the rejected token may still look valid, make it expired so it is
+        # really replaced (only once for concurrent callers, they wait)
+        token_manager.expire_time = 0
+        token_manager.paced_request_token()
 
     @property
     def cloud_instance_id(self) -> str:
         """PowerVS cloud instance ID"""
         return self.crn.split(":")[7]
 
+    @property
+    def tenant_id(self) -> str:
+        """IBM Cloud account (PowerVS tenant) ID from the CRN"""
+        return self.crn.split(":")[6].split("/")[-1]
+
     @property
     def region(self) -> str:
         """PowerVS region from the CRN"""
@@ -51,20 +80,33 @@ class PowerVSCredentials:
         }
 
 
+def create_powervs_credentials(api_key: str, crn: str) -> PowerVSCredentials:
+    """
+    Create the credentials object for the PowerVS instance (workspace)
+    identified by CRN.  The API key is exchanged for a token, and the
+    connection to the regional API end-point is opened, in background.
+
+    Args:
+        api_key: IBM Cloud API key
+        crn: CRN of the PowerVS instance
+
+    Returns:
+        PowerVS credentials
+    """
+    credentials = PowerVSCredentials(crn=crn, authenticator=iam_authenticator(api_key))
+    credentials.bootstrap = Bootstrap(credentials.authenticator, [credentials.iaas_url])
+    return credentials
+
+
 def get_powervs_credentials(token_file: str, crn: str) -> PowerVSCredentials:
     """
     Get PowerVS credentials from a token file
 
     Args:
         token_file: Path to the token (API key) file
+        crn: CRN of the PowerVS instance
 
     Returns:
         PowerVS credentials
     """
-    cmd = f"source {token_file} ; echo $IBMCLOUD_API_KEY"
-    output = subprocess.check_output(cmd, shell=True)
-    api_key = output.decode("utf-8").strip().rsplit("\n", maxsplit=1)[-1]
-
-    authenticator = IAMAuthenticator(api_key)
-
-    return PowerVSCredentials(token=authenticator.token_manager.get_token(), crn=crn)
+    return create_powervs_credentials(get_api_key(token_file), crn)
@@ -0,0 +1,170 @@
+"""
+Choose the storage pool and networks for a new PowerVS instance, before
+anything is allocated.
+"""
+
+import logging
+import time
+from typing import Any, Optional
+
+import requests
+
+from resalloc_ibm_cloud.constants import POWERVS_CAPACITY_CACHE_TTL
+from resalloc_ibm_cloud.exceptions import PowerVSCapacityException
+from resalloc_ibm_cloud.state import StateFile
+
+logger = logging.getLogger(__name__)
+
+
+class PowerVSPlanner:
+    """
+    Check the storage pool capacity and the number of available IP addresses
+    in the networks (both cached in a local state file).  What we plan to
+    allocate is subtracted from the cached numbers, so concurrently started
+    instances don't all count with the same free space.
+    """
+
+    def __init__(self, client, state_dir: str) -> None:
+        self.client = client
+        self.state = StateFile(state_dir,
+                               f"powervs-capacity-{client.cloud_instance_id}")
+
+    @staticmethod
+    def _fresh(cached: dict, now: float) -> bool:
+        return bool(cached) and now - cached["timestamp"] < POWERVS_CAPACITY_CACHE_TTL
+
+    def _fetch_storage_pools(self, snapshot: dict, now: float) -> Optional[dict]:
+        """
+        Query the storage pools if the cached entry is missing or stale, the
+        new cache entry or None
+        """
+        if self._fresh(snapshot.get("storage_pools"), now):
+            return None
+        response = self.client.request("GET", "/storage-capacity/storage-pools")
+        pools = {
+            pool["poolName"]: {
+                "max_allocation": pool.get("maxAllocationSize", 0),
+                "storage_type": pool.get("storageType"),
+            }
+            for pool in response.get("storagePoolsCapacity", [])
+        }
+        return {"pools": pools, "timestamp": now}
+
+    def _fetch_networks(self, snapshot: dict, network_ids: set, now: float) -> dict:
+        """
+        Query the networks that are missing in the cache or stale, the new
+        cache entries
+        """
+        cached = snapshot.get("networks", {})
+        fetched = {}
+        for network_id in network_ids:
+            if self._fresh(cached.get(network_id), now):
+                continue
+            network = self.client.request("GET", f"/networks/{network_id}")
+            # None if PowerVS doesn't report the metrics (unknown, no limit)
+            fetched[network_id] = {
+                "available": network.get("ipAddressMetrics", {}).get("available"),
+                "timestamp": now,
+            }
+        return fetched
+
+    @staticmethod
+    def _merge(entries: dict, key: str, fetched: dict, snapshot: dict) -> None:
+        # if a concurrent process refreshed the entry in the meantime, keep
+        # its value, it already counts with the reservations made since then
+        current = entries.get(key)
+        seen = snapshot.get(key)
+        if current is None or \
+                (seen is not None and current["timestamp"] <= seen["timestamp"]):
+            entries[key] = fetched
+
+    @staticmethod
+    def _pick_storage_pool(pools: dict, options: Any, needed: float) -> str:
+        if options.storage_pool:
+            candidates = [options.storage_pool]
+        else:
+            candidates = [name for name, pool in pools.items()
+                          if pool["storage_type"] == options.storage_type]
+
+        fitting = [name for name in candidates
+                   if name in pools and pools[name]["max_allocation"] >= needed]
+        if not fitting:
+            raise PowerVSCapacityException(
+                f"No storage pool out of {candidates} can allocate {needed} GB")
+        # the most free space first
+        return max(fitting, key=lambda name: pools[name]["max_allocation"])
+
+    @staticmethod
+    def _pick_networks(alternatives: list[list[str]], free_ips: dict) -> list[str]:
+        def _free(network_id):
+            available = free_ips[network_id]
+            return float("inf") if available is None else available
+
+        networks = []
+        for choices in alternatives:
+            best = max(choices, key=_free)
+            if _free(best) <= 0:
+                raise PowerVSCapacityException(
+                    f"No available IP address in the networks {choices}")
+            networks.append(best)
+        return networks
+
+    def plan(self, options: Any, volumes: list[dict]) -> tuple[str, list[str]]:
+        """
+        Pick the storage pool (options.storage_pool if specified, or the
+        pool with the most free space of options.storage_type) that fits the
+        VOLUMES, and the network with the most available IP addresses out of
+        each options.network_id item ("ID1|ID2" alternatives allowed).
+
+        Args:
+            options: Options with the VM configuration
+            volumes: The volume creation bodies
+
+        Returns:
+            Tuple of (storage pool name, list of network IDs)
+
+        Raises:
+            PowerVSCapacityException: If the request can not fit
+        """
+        alternatives = [
+            network_id.split("|") for network_id in options.network_id or []
+            if network_id and network_id.strip()
+        ]
+        needed = max((volume["size"] for volume in volumes), default=0)
+        total = sum(volume["size"] for volume in volumes)
+
+        network_ids = {n for choices in alternatives for n in choices}
+        now = time.time()
+        try:
+            # query the API without the lock, concurrent processes would wait
+            snapshot = self.state.read()
+            storage_pools = self._fetch_storage_pools(snapshot, now)
+            fetched_networks = self._fetch_networks(snapshot, network_ids, now)
+        except requests.RequestException:
+            # don't block the instance creation only because we can't plan
+            logger.exception("Can not query the PowerVS capacity, not planning")
+            return options.storage_pool, [choices[0] for choices in alternatives]
+
+        with self.state.update() as data:
+            if storage_pools:
+                self._merge(data, "storage_pools", storage_pools, snapshot)
+            networks_data = data.setdefault("networks", {})
+            for network_id, fetched in fetched_networks.items():
+                self._merge(networks_data, network_id, fetched,
+                            snapshot.get("networks", {}))
+
+            pools = data["storage_pools"]["pools"]
+            free_ips = {network_id: networks_data[network_id]["available"]
+                        for network_id in network_ids}
+            storage_pool = self._pick_storage_pool(pools, options, needed)
+            networks = self._pick_networks(alternatives, free_ips)
+
+            # count with what we are going to allocate
+            pools[storage_pool]["max_allocation"] -= total
+            for network_id in networks:
+                if free_ips[network_id] is not None:
+                    networks_data[network_id]["available"] -= 1
+
+        logger.info("Planned storage pool %s and networks %s", storage_pool,
+                    ", ".join(networks))
+        return storage_pool, networks
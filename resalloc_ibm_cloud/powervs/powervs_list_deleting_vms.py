@@ -2,33 +2,48 @@
 List all IBM Cloud PowerVS instances that are in deleting-like state.
 """
 
-from resalloc_ibm_cloud.powervs.credentials import get_powervs_credentials
+from resalloc_ibm_cloud.hedging import hedging_policy
+from resalloc_ibm_cloud.helpers import get_api_key
+from resalloc_ibm_cloud.listing import ResourceRecord, print_records
+from resalloc_ibm_cloud.powervs.credentials import create_powervs_credentials
 from resalloc_ibm_cloud.powervs.client import PowerVSClient
+from resalloc_ibm_cloud.powervs.powervs_list_vms import instance_record
 from resalloc_ibm_cloud.argparsers import powervs_list_deleting_vms_parser
 
 
-def list_deleting_vms(client: PowerVSClient):
+def list_deleting_vm_records(client: PowerVSClient) -> list[ResourceRecord]:
     """
     List all PowerVS instances that are in a deleting-like state.
 
     Args:
         client: PowerVS client
+
+    Returns:
+        List of ResourceRecords for the deleting instances
     """
+    records = []
     for instance in client.list_instances():
         # check if the instance is being deleted
         # PowerVS instances can have states like: SHUTTING-DOWN, DELETING
-        status = instance.get("status", "").upper()
+        status = instance.status.upper()
         if "DELET" in status or "SHUTTING" in status:
-            print(
-                f"{instance['pvmInstanceID']} {instance.get('serverName', 'unknown')}"
-            )
+            records.append(instance_record(client, instance))
+    return records
+
+
+def _text_line(record: ResourceRecord) -> str:
+    return f"{record.id} {record.cloud_name or 'unknown'}"
 
 
 def main():
     """Entrypoint to the script."""
     opts = powervs_list_deleting_vms_parser().parse_args()
 
-    credentials = get_powervs_credentials(opts.token_file, opts.crn)
-    client = PowerVSClient(credentials)
+    api_key = get_api_key(opts.token_file)
+    hedging = hedging_policy(opts)
+
+    def _list_workspace(crn):
+        client = PowerVSClient(create_powervs_credentials(api_key, crn), hedging)
+        return list_deleting_vm_records(client)
 
-    list_deleting_vms(client)
+    print_records(opts, opts.crn, _list_workspace, _text_line)
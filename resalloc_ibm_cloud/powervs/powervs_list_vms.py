@@ -5,11 +5,88 @@ List all IBM Cloud PowerVS instances.
 import os
 import sys
 
-from resalloc_ibm_cloud.powervs.credentials import get_powervs_credentials
+from resalloc_ibm_cloud.hedging import hedging_policy
+from resalloc_ibm_cloud.helpers import get_api_key, run_queries, setup_logging
+from resalloc_ibm_cloud.listing import InventoryWatcher, ResourceRecord, print_records
+from resalloc_ibm_cloud.powervs.credentials import create_powervs_credentials
 from resalloc_ibm_cloud.powervs.client import PowerVSClient
+from resalloc_ibm_cloud.powervs.records import PowerVSInstance, PowerVSVolume
 from resalloc_ibm_cloud.argparsers import powervs_list_vms_parser
 
 
+def instance_record(client: PowerVSClient,
+                    instance: PowerVSInstance) -> ResourceRecord:
+    """
+    Convert the PowerVS instance to a ResourceRecord.
+
+    Args:
+        client: PowerVS client the instance was listed by
+        instance: The listed instance
+
+    Returns:
+        ResourceRecord for the instance
+    """
+    # the listing doesn't tell the zone, and the CRN location is the region
+    return ResourceRecord(
+        "instance", instance.id, instance.name, instance.name, instance.status,
+        instance.created, None, None,
+        client.credentials.crn,
+    )
+
+
+def volume_record(client: PowerVSClient, volume: PowerVSVolume) -> ResourceRecord:
+    """
+    Convert the PowerVS volume to a ResourceRecord.
+
+    Args:
+        client: PowerVS client the volume was listed by
+        volume: The listed volume
+
+    Returns:
+        ResourceRecord for the volume, named by the associated VM
+    """
+    return ResourceRecord(
+        # the dropped suffix is underscore something (_volume)
+        "volume", volume.id, volume.name.rsplit("_volume", 1)[0], volume.name,
+        volume.state, volume.created, None,
+        volume.instance_ids[0] if volume.instance_ids else None,
+        client.credentials.crn,
+    )
+
+
+def list_vm_records(client: PowerVSClient, pool_id: str) -> list[ResourceRecord]:
+    """
+    List all PowerVS instances for the specified pool.
+
+    Args:
+        client: PowerVS client
+        pool_id: Pool ID to filter instances
+
+    Returns:
+        List of ResourceRecords for the matching instances
+    """
+    return [instance_record(client, instance)
+            for instance in client.list_instances()
+            if instance.name.startswith(pool_id)]
+
+
+def list_volume_records(client: PowerVSClient,
+                        pool_id: str) -> list[ResourceRecord]:
+    """
+    List all PowerVS volumes for the specified pool.
+
+    Args:
+        client: PowerVS client
+        pool_id: Pool ID to filter volumes
+
+    Returns:
+        List of ResourceRecords for the matching volumes
+    """
+    return [volume_record(client, volume)
+            for volume in client.list_volumes()
+            if volume.name.startswith(pool_id)]
+
+
 def list_vms(client: PowerVSClient, pool_id: str) -> set[str]:
     """
     List all PowerVS instances for the specified pool.
@@ -21,13 +98,7 @@ def list_vms(client: PowerVSClient, pool_id: str) -> set[str]:
     Returns:
         Set of resource names that match the pool ID
     """
-    resources = set()
-    for instance in client.list_instances():
-        instance_name = instance["serverName"]
-        if instance_name.startswith(pool_id):
-            resources.add(instance_name)
-
-    return resources
+    return {record.name for record in list_vm_records(client, pool_id)}
 
 
 def list_volumes_associated_vms(client: PowerVSClient, pool_id: str) -> set[str]:
@@ -41,14 +112,26 @@ def list_volumes_associated_vms(client: PowerVSClient, pool_id: str) -> set[str]
     Returns:
         Set of VMs names associated with the specified volumes
     """
-    vms = set()
-    for volume in client.list_volumes():
-        volume_name = volume["name"]
-        if volume_name.startswith(pool_id):
-            # the dropped suffix is underscore something (_volume)
-            vms.add(volume_name.rsplit("_volume", 1)[0])
+    return {record.name for record in list_volume_records(client, pool_id)}
+
+
+def list_pool_resources(client: PowerVSClient, pool_id: str) -> set[str]:
+    """
+    List all the resource names (instances, and instances associated with
+    volumes) in the pool.
+
+    Args:
+        client: PowerVS client
+        pool_id: Pool ID to filter resources
 
-    return vms
+    Returns:
+        Set of resource names
+    """
+    vms, volume_vms = run_queries(
+        lambda: list_vms(client, pool_id),
+        lambda: list_volumes_associated_vms(client, pool_id),
+    )
+    return vms | volume_vms
 
 
 def main():
@@ -60,9 +143,25 @@ def main():
         sys.stderr.write("Specify pool ID by --pool or $RESALLOC_POOL_ID\n")
         sys.exit(1)
 
-    credentials = get_powervs_credentials(opts.token_file, opts.crn)
-    client = PowerVSClient(credentials)
+    api_key = get_api_key(opts.token_file)
+    hedging = hedging_policy(opts)
+
+    # Re-used by the --watch refreshes, so the IAM tokens are re-used, too
+    clients = {}
+
+    def _list_workspace(crn):
+        if crn not in clients:
+            clients[crn] = PowerVSClient(create_powervs_credentials(api_key, crn),
+                                         hedging)
+        vm_records, volume_records = run_queries(
+            lambda: list_vm_records(clients[crn], pool_id),
+            lambda: list_volume_records(clients[crn], pool_id),
+        )
+        return vm_records + volume_records
+
+    if opts.watch:
+        setup_logging(opts.log_level)
+        InventoryWatcher(opts, opts.crn, _list_workspace).run()
+        return
 
-    resources = list_vms(client, pool_id) | list_volumes_associated_vms(client, pool_id)
-    for name in resources:
-        print(name)
+    print_records(opts, opts.crn, _list_workspace, lambda record: record.name)
@@ -3,9 +3,9 @@ Start a new VM in IBM Cloud Power Virtual Server.
 """
 
 import logging
-import subprocess
 import sys
 import time
+from dataclasses import dataclass
 from time import sleep
 from typing import Any, Optional
 
@@ -14,18 +14,48 @@ from requests import HTTPError
 import requests
 
 from resalloc_ibm_cloud.argparsers import powervs_arg_parser
-from resalloc_ibm_cloud.exceptions import PowerVSInvalidNameException, PowerVSNotFoundException
-from resalloc_ibm_cloud.helpers import run_playbook, setup_logging, wait_for_ssh
+from resalloc_ibm_cloud.baking import BakedImages, playbook_hash
+from resalloc_ibm_cloud.catalog import Catalog
+from resalloc_ibm_cloud.deadline import current_deadline, install_deadline
+from resalloc_ibm_cloud.exceptions import (
+    PowerVSException,
+    PowerVSInvalidNameException,
+    PowerVSNotFoundException,
+    PowerVSPreflightException,
+)
+from resalloc_ibm_cloud.hedging import hedging_policy
+from resalloc_ibm_cloud.helpers import (
+    playbook_timing_file,
+    provision,
+    setup_logging,
+    wait_for_ssh,
+)
 from resalloc_ibm_cloud.powervs.credentials import get_powervs_credentials
 from resalloc_ibm_cloud.powervs.client import PowerVSClient
+from resalloc_ibm_cloud.powervs.planner import PowerVSPlanner
+from resalloc_ibm_cloud.powervs.readiness import ReadinessWatcher, parse_ready_when
+from resalloc_ibm_cloud.powervs.standby import StandbyPool
+from resalloc_ibm_cloud.powervs.volume_pool import VolumePool
 
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class CreationPlan:
+    """What PowerVSVMManager.create_vm() allocates, see plan_vm()"""
+
+    volumes: list[dict]
+    playbook: Optional[str]
+    storage_pool: str
+    network_ids: list[str]
+
+
 class PowerVSVMManager:
-    def __init__(self, client: PowerVSClient) -> None:
+    def __init__(self, client: PowerVSClient,
+                 volume_pool: Optional[VolumePool] = None) -> None:
         self.client = client
+        self.volume_pool = volume_pool
 
     @staticmethod
     def _build_instance_base_body(name: str, options: Any) -> dict:
@@ -68,14 +98,16 @@ class PowerVSVMManager:
 
         ids = []
         for volume in volumes:
-            resp = self.client.create_volume(volume)
-            volume_id = resp.get("volumeID")
-            logger.debug("Created volume %s with ID %s", volume["name"], volume_id)
+            volume_id = self.volume_pool.claim(volume) if self.volume_pool else None
+            if not volume_id:
+                resp = self.client.create_volume(volume)
+                volume_id = resp.get("volumeID")
+                logger.debug("Created volume %s with ID %s", volume["name"], volume_id)
             ids.append(volume_id)
 
         return ids
 
-    def _create_instance(self, instance_body: dict, no_rmc: bool) -> dict:
+    def _create_instance(self, instance_body: dict, options: Any) -> dict:
         instance = self.client.create_instance(instance_body)
         # they say it's dict in the docs, but it's actually a list of one element lol xd
         instance_id = instance[0]["pvmInstanceID"]
@@ -84,10 +116,13 @@ class PowerVSVMManager:
         # wait for the instance to be active, in powervs this may be even 5 or 10 minutes
         # before the instance is even _listed_ in the cloud as ready. After that part, the
         # subnet will be attached and the IP address will be available.
-        return self._wait_for_instance_active(instance_id=instance_id, no_rmc=no_rmc)
+        return self._wait_for_instance_active(instance_id=instance_id, options=options)
 
     @staticmethod
-    def _extract_ip_address(instance: dict) -> str:
+    def extract_ip_address(instance: dict) -> str:
+        """
+        Get the IP address of the first network attached to the INSTANCE
+        """
         networks = instance.get("networks", [])
         if not networks:
             raise PowerVSNotFoundException("Instance does not have any networks attached")
@@ -99,63 +134,213 @@ class PowerVSVMManager:
         logger.info("Instance IP address: %s", ip_address)
         return ip_address
 
-    def create_vm(self, name: str, options: Any) -> str:
+    def _catalog(self, options: Any) -> Catalog:
+        credentials = self.client.credentials
+        return Catalog(options.state_dir, f"powervs-{self.client.cloud_instance_id}", {
+            "images": lambda: {
+                image["imageID"]: {"name": image["name"], "state": image.get("state")}
+                for image in self.client.request("GET", "/images").get("images", [])
+            },
+            "system_types": lambda: {
+                system_type: {}
+                for system_type in self.client.request("GET", "/system-pools")
+            },
+            "keys": lambda: {
+                key["name"]: {}
+                for key in self.client.request(
+                    "GET", f"/tenants/{credentials.tenant_id}").get("sshKeys", [])
+            },
+        })
+
+    def preflight_check(self, options: Any) -> None:
+        """
+        Validate the image, system type and SSH key requested by OPTIONS
+        against the (cached) catalog of the workspace, before anything is
+        allocated.
+
+        Args:
+            options: Options with VM configuration
+
+        Raises:
+            PowerVSPreflightException: If the request is invalid
         """
-        Create a new VM instance in PowerVS
+        catalog = self._catalog(options)
+        problems = []
+        try:
+            image = catalog.find("images", options.image_uuid)
+            if image is None:
+                problems.append(f"image {options.image_uuid} not found")
+            elif image["state"] not in [None, "active"]:
+                problems.append(f"image {image['name']} is {image['state']}")
+            if catalog.find("system_types", options.system_type) is None:
+                problems.append(f"system type {options.system_type} not available")
+            if catalog.find("keys", options.ssh_key_name) is None:
+                problems.append(f"SSH key {options.ssh_key_name} not found")
+        except requests.RequestException:
+            # don't block the instance creation only because we can't check
+            logger.exception("Can not download the catalog, skipping preflight checks")
+            return
+
+        if problems:
+            raise PowerVSPreflightException("Preflight check failed: " + ", ".join(problems))
+
+    def plan_vm(self, name: str, options: Any) -> CreationPlan:
+        """
+        Decide what will be allocated for the VM instance NAME, before
+        anything is allocated.
 
         Args:
             name: Instance name
             options: Options with VM configuration
 
         Returns:
-            IP address of the created instance
+            The plan for create_vm()
+
+        Raises:
+            PowerVSCapacityException: If the request can not fit
         """
-        instance_body = self._build_instance_base_body(name, options)
+        # offline checks first, while the token is still being fetched in
+        # background
+        volumes = self._parse_volumes(getattr(options, "volumes", None) or [], name)
+        playbook = self._baked_images(options).provisioning_playbook(options)
 
-        volumes = self._parse_volumes(getattr(options, "volumes", []))
+        storage_pool, network_ids = PowerVSPlanner(
+            self.client, options.state_dir).plan(options, volumes)
 
-        if options.storage_pool:
+        if storage_pool:
             for volume in volumes:
-                volume["volumePool"] = options.storage_pool
+                volume["volumePool"] = storage_pool
         else:
             raise ValueError(
                 "Storage pool must be specified with --storage-pool for volumes, otherwise " \
                 "the VM and volumes may end up in different pools causing errors."
             )
 
-        volume_ids = self._create_volumes_with_tags(volumes, getattr(options, "tags", None))
+        return CreationPlan(volumes, playbook, storage_pool, network_ids)
+
+    def create_vm(self, name: str, options: Any, plan: CreationPlan) -> str:
+        """
+        Create a new VM instance in PowerVS.  The caller is responsible for
+        the preflight_check() and plan_vm() before, and for the cleanup if
+        this fails.
+
+        Args:
+            name: Instance name
+            options: Options with VM configuration
+            plan: What to allocate, from plan_vm()
+
+        Returns:
+            IP address of the created instance
+        """
+        volume_ids = self._create_volumes_with_tags(plan.volumes,
+                                                    getattr(options, "tags", None))
 
+        instance_body = self._build_instance_base_body(name, options)
+        instance_body["networks"] = [{"networkID": network_id}
+                                     for network_id in plan.network_ids]
         instance_body["volumeIDs"] = volume_ids
-        if options.storage_pool:
-            instance_body["storagePool"] = options.storage_pool
+        instance_body["storagePool"] = plan.storage_pool
 
         try:
-            instance = self._create_instance(instance_body, options.no_rmc)
+            instance = self._create_instance(instance_body, options)
         except Exception:
             logger.error("Instance creation failed, cleaning up allocated volumes...")
-            sleep(20)  # give IBM Cloud a while to process the volumes
-            for volume_id in volume_ids:
-                try:
-                    self._delete_volume_with_backoff(volume_id)
-                    logger.info("Cleaned up orphaned volume with ID %s", volume_id)
-                except Exception as e:
-                    logger.error("Failed to clean up volume %s: %s", volume_id, str(e))
+            with current_deadline().cleanup():
+                sleep(20)  # give IBM Cloud a while to process the volumes
+                for volume_id in volume_ids:
+                    try:
+                        self._delete_volume_with_backoff(volume_id)
+                        logger.info("Cleaned up orphaned volume with ID %s", volume_id)
+                    except Exception as e:
+                        logger.error("Failed to clean up volume %s: %s", volume_id, str(e))
             raise
 
-        ip_address = self._extract_ip_address(instance)
+        ip_address = self.extract_ip_address(instance)
         wait_for_ssh(ip_address)
 
-        run_playbook(host=ip_address, playbook_path=options.playbook)
+        if plan.playbook:
+            provision(host=ip_address, playbook_path=plan.playbook,
+                      timing_file=playbook_timing_file(options.state_dir, name))
 
         return ip_address
 
+    def _baked_images(self, options: Any) -> BakedImages:
+        return BakedImages(options.state_dir,
+                           f"powervs-{self.client.cloud_instance_id}")
+
+    def _wait_for_instance_status(self, instance_id: str, wanted: str,
+                                  timeout: int = 600, interval: int = 10) -> None:
+        deadline = time.time() + current_deadline().timeout(timeout)
+        while True:
+            status = self.client.get_instance(instance_id).get("status")
+            if status == wanted:
+                return
+            if status == "ERROR" or time.time() > deadline:
+                raise PowerVSException(f"Instance {instance_id} is {status}, not {wanted}")
+            current_deadline().sleep(interval)
+
+    def _wait_for_image(self, image_name: str, timeout: int = 3600,
+                        interval: int = 30) -> str:
+        deadline = time.time() + current_deadline().timeout(timeout)
+        while True:
+            state = None
+            for image in self.client.request("GET", "/images").get("images", []):
+                if image["name"] != image_name:
+                    continue
+                state = image.get("state")
+                if state == "active":
+                    return image["imageID"]
+            if state in ["failed", "error"] or time.time() > deadline:
+                raise PowerVSException(f"Image {image_name} is {state}, not active")
+            current_deadline().sleep(interval)
+
+    def bake_image(self, options: Any) -> str:
+        """
+        Start a temporary instance from options.image_uuid, provision it with
+        options.playbook, stop it and capture it as a new image
+        options.image_name into the workspace image catalog.  The temporary
+        instance is removed afterwards.  The image name must not exist yet.
+
+        Args:
+            options: Options with VM configuration
+
+        Returns:
+            ID of the new image
+        """
+        content_hash = playbook_hash(options.playbook)
+        name = options.image_name + "-bake"
+        check_name(name)
+        # fail early, before anything is allocated
+        self.preflight_check(options)
+        # the new image is recognized by its name
+        images = self.client.request("GET", "/images").get("images", [])
+        if any(image["name"] == options.image_name for image in images):
+            raise PowerVSPreflightException(
+                f"Image {options.image_name} already exists, pick another name")
+        plan = self.plan_vm(name, options)
+        try:
+            self.create_vm(name, options, plan)
+            instance_id = next(instance.id for instance in self.client.list_instances()
+                               if instance.name == name)
+            self.client.instance_action(instance_id, "stop")
+            self._wait_for_instance_status(instance_id, "SHUTOFF")
+            self.client.capture_instance(instance_id, options.image_name)
+            image_id = self._wait_for_image(options.image_name)
+        finally:
+            with current_deadline().cleanup():
+                self.delete_vm(name)
+
+        self._baked_images(options).record(image_id, options.playbook, content_hash)
+        logger.info("Image %s (%s) baked", options.image_name, image_id)
+        return image_id
+
     # this is just a simple retry wrapper, because IBM Cloud freaks out for a while
     # once the volume is deleted, returning random errors when trying to delete it...
     # it should work after a few retries (up to 30 seconds)
     @backoff.on_exception(
         backoff.constant,
         requests.RequestException,
-        max_time=120,
+        max_time=lambda: current_deadline().timeout(120),
         interval=10,
     )
     def _delete_volume_with_backoff(self, volume_id: str) -> None:
@@ -169,8 +354,29 @@ class PowerVSVMManager:
         # give us presents in the form of dangling volumes
         volumes = self.client.list_volumes()
         for volume in volumes:
-            if volume["name"].startswith(instance_name):
-                self._delete_volume_with_backoff(volume["volumeID"])
+            if volume.name.startswith(instance_name):
+                self._delete_volume_with_backoff(volume.id)
+
+    def _poolable_volumes(self, instance: dict, volume_ids: list[str]) -> dict:
+        """
+        Return {ID: PowerVSVolume} of the INSTANCE data volumes that should be
+        moved to the volume pool instead of being deleted
+        """
+        if not self.volume_pool:
+            return {}
+
+        try:
+            ip_address = self.extract_ip_address(instance)
+        except PowerVSNotFoundException:
+            logger.warning("Can not wipe the volumes, not pooling them")
+            return {}
+        if not self.volume_pool.wipe(ip_address):
+            return {}
+
+        return {
+            volume.id: volume for volume in self.client.list_volumes()
+            if volume.id in volume_ids and not volume.bootable
+        }
 
     def delete_vm(self, name: str) -> None:
         """
@@ -185,8 +391,8 @@ class PowerVSVMManager:
         instance_id = None
 
         for instance in instances:
-            if instance["serverName"] == name:
-                instance_id = instance["pvmInstanceID"]
+            if instance.name == name:
+                instance_id = instance.id
                 break
 
         if not instance_id:
@@ -197,6 +403,7 @@ class PowerVSVMManager:
 
         instance_information = self.client.get_instance(instance_id)
         volume_ids = instance_information.get("volumeIDs", [])
+        poolable = self._poolable_volumes(instance_information, volume_ids)
 
         # the data volumes tends to remain undeleted even if the delete_instance
         # call is with delete_data_volumes, so this needs to be assured manually
@@ -204,10 +411,22 @@ class PowerVSVMManager:
             try:
                 self.client.detach_volume(instance_id, volume_id)
                 logger.info("Detached volume with ID %s from instance %s", volume_id, instance_id)
+                if volume_id in poolable:
+                    continue
                 self._delete_volume_with_backoff(volume_id)
             except HTTPError as e:
+                poolable.pop(volume_id, None)
                 logger.error("Failed to delete volume %s: %s", volume_id, str(e))
 
+        # the pooled volumes must be fully detached before the instance is
+        # deleted, otherwise they would be deleted with it
+        if poolable:
+            for volume_id in self.volume_pool.release_detached(list(poolable.values())):
+                try:
+                    self._delete_volume_with_backoff(volume_id)
+                except HTTPError as e:
+                    logger.error("Failed to delete volume %s: %s", volume_id, str(e))
+
         self.client.delete_instance(
             instance_id,
             delete_data_volumes=True,
@@ -218,11 +437,12 @@ class PowerVSVMManager:
             instance_id,
         )
 
-    def _parse_volumes(self, volumes_list: list[str]) -> list[dict]:
+    def _parse_volumes(self, volumes_list: list[str], instance_name: str) -> list[dict]:
         """
         Parse volume specifications from a list of strings.
 
-        Each string should be in the format "name:size[:diskType]".
+        Each string should be in the format "name:size[:diskType]", the
+        "{name}" placeholder in name is replaced with the INSTANCE_NAME.
         """
         result = []
         for vol_spec in volumes_list:
@@ -232,7 +452,7 @@ class PowerVSVMManager:
                 continue
 
             volume = {
-                "name": parts[0],
+                "name": parts[0].replace("{name}", instance_name),
                 "size": float(parts[1]),
             }
 
@@ -244,50 +464,89 @@ class PowerVSVMManager:
         return result
 
     def _wait_for_instance_active(
-        self, instance_id: str, no_rmc: bool, timeout: int = 1200, interval: int = 10,
+        self, instance_id: str, options: Any, timeout: int = 1200, interval: int = 10,
     ) -> dict:
-        start_time = time.time()
-        while True:
-            if time.time() - start_time > timeout:
-                raise TimeoutError(
-                    f"Instance did not become active within {timeout} seconds"
-                )
-
-            instance = self.client.get_instance(instance_id)
-            status = instance.get("status")
-
-            logger.info("Instance status: %s", status)
-
-            if status == "ACTIVE" and self._wait_for_health_or_ssh(instance, no_rmc, timeout):
-                logger.info("Instance is active and healthy")
-                return instance
-            elif status in ["ERROR", "FAILED"]:
-                raise RuntimeError(f"Instance creation failed with status: {status}")
-
-            sleep(interval)
-
-    # Wait for the instance to be healthy and ready... even after it is active, the ssh often
-    # does not work immediately for some reason. In my experience, it takes about 10 minutes.
-    # But sometimes this will hang forever if the instance network is configured
-    # via some hacks that break RMC
-    # https://www.ibm.com/docs/en/powervc/2.0.3?topic=solutions-newly-deployed-virtual-machine-status-shows-warning
-    @classmethod
-    def _wait_for_health_or_ssh(cls, instance: dict, no_rmc: bool, timeout: int) -> bool:
-        if no_rmc:
-            # check at least if we can ssh
-            try:
-                ip_address = cls._extract_ip_address(instance)
-                wait_for_ssh(ip_address, timeout)
-                return True
-            except PowerVSNotFoundException:
-                logger.warning("IP address not found (yet?) for instance %s", instance.get("id"))
-                return False
-            except subprocess.CalledProcessError as e:
-                raise TimeoutError("SSH did not become available in time") from e
+        # Even after the instance is active, the ssh often does not work
+        # immediately, and the RMC health takes about 10 minutes in my
+        # experience.  Sometimes RMC never gets OK if the instance network is
+        # configured via some hacks that break it
+        # https://www.ibm.com/docs/en/powervc/2.0.3?topic=solutions-newly-deployed-virtual-machine-status-shows-warning
+        # so we watch all the signals at once, the first --ready-when
+        # combination wins.
+        ready_when = "active+ssh" if options.no_rmc else options.ready_when
+        watcher = ReadinessWatcher(
+            self.client, self, parse_ready_when(ready_when), options.state_dir,
+        )
+        return watcher.wait(instance_id, timeout=timeout, interval=interval)
+
+
+def check_name(name: str) -> None:
+    """
+    PowerVS has a limit for the instance name length.
+    """
+    if len(name) > 46:
+        raise PowerVSInvalidNameException("Instance name must be 47 characters or fewer")
 
-        health_status = instance.get("health", {}).get("status")
-        logger.debug("Waiting for instance health status: %s", health_status)
-        return health_status == "OK"
+
+def start_vm(vm_manager: PowerVSVMManager, options: Any) -> str:
+    """
+    Claim a warm standby instance (with --standby-prefix), or create a new
+    instance options.name.  Return its IP address.  If the creation fails,
+    the allocated resources are removed.
+    """
+    check_name(options.name)
+
+    if options.standby_prefix:
+        standby = StandbyPool(vm_manager, options.state_dir, options)
+        ip_address = standby.claim(options.name)
+        if ip_address:
+            return ip_address
+
+    # fail early, before anything is allocated (and would need a cleanup)
+    vm_manager.preflight_check(options)
+    plan = vm_manager.plan_vm(options.name, options)
+    try:
+        return vm_manager.create_vm(options.name, options, plan)
+    except Exception as e:
+        # this mainly handles the post VM creation cleanup
+        logger.error(
+            "Failed to create VM: %s; trying to remove allocated resources...",
+            str(e)
+        )
+        with current_deadline().cleanup():
+            sleep(20)  # give IBM Cloud a while
+            vm_manager.delete_vm(options.name)
+        raise
+
+
+def run_subcommand(vm_manager: PowerVSVMManager,
+                   volume_pool: Optional[VolumePool], opts: Any) -> None:
+    """
+    Perform the opts.subparser command, exit the program on invalid options.
+    """
+    if opts.subparser == "create":
+        print(start_vm(vm_manager, opts))
+        if opts.standby_prefix:
+            StandbyPool(vm_manager, opts.state_dir, opts).replenish_in_background()
+    elif opts.subparser == "prewarm":
+        if not opts.standby_prefix:
+            logger.error("The prewarm command requires --standby-prefix")
+            sys.exit(1)
+        StandbyPool(vm_manager, opts.state_dir, opts).prewarm()
+    elif opts.subparser == "bake":
+        print(vm_manager.bake_image(opts))
+    elif opts.subparser == "delete":
+        vm_manager.delete_vm(opts.name)
+        if volume_pool:
+            volume_pool.trim_in_background()
+    elif opts.subparser == "trim-volume-pool":
+        if not volume_pool:
+            logger.error("The trim-volume-pool command requires --volume-pool-prefix")
+            sys.exit(1)
+        volume_pool.trim()
+    else:
+        logger.error("Unknown subcommand: %s", opts.subparser)
+        sys.exit(1)
 
 
 def main() -> int:
@@ -298,35 +557,21 @@ def main() -> int:
         Exit code
     """
     opts = powervs_arg_parser().parse_args()
-    if len(opts.name) > 46:
-        raise PowerVSInvalidNameException("Instance name must be 47 characters or fewer")
+    if hasattr(opts, "name"):
+        check_name(opts.name)
 
     setup_logging(opts.log_level)
+    install_deadline(getattr(opts, "deadline", None))
 
     try:
         credentials = get_powervs_credentials(opts.token_file, opts.crn)
-        client = PowerVSClient(credentials)
-        vm_manager = PowerVSVMManager(client)
-
-        if opts.subparser == "create":
-            try:
-                ip_address = vm_manager.create_vm(opts.name, opts)
-                print(ip_address)
-            except Exception as e:
-                # this mainly handles the post VM creation cleanup
-                logger.error(
-                    "Failed to create VM: %s; trying to remove allocated resources...",
-                    str(e)
-                )
-                sleep(20)  # give IBM Cloud a while
-                vm_manager.delete_vm(opts.name)
-                raise
-        elif opts.subparser == "delete":
-            vm_manager.delete_vm(opts.name)
-        else:
-            logger.error("Unknown subcommand: %s", opts.subparser)
-            sys.exit(1)
+        client = PowerVSClient(credentials, hedging_policy(opts))
+        volume_pool = None
+        if getattr(opts, "volume_pool_prefix", None):
+            volume_pool = VolumePool(client, opts.state_dir, opts)
+        vm_manager = PowerVSVMManager(client, volume_pool)
 
+        run_subcommand(vm_manager, volume_pool, opts)
         sys.exit(0)
 
     except Exception as e:
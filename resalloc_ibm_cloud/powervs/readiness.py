@@ -0,0 +1,130 @@
+"""
+Decide when a freshly started PowerVS instance is ready.  We watch several
+signals at the same time (instance status, RMC health, SSH reachability) and
+the first satisfied combination wins.
+"""
+
+import logging
+import threading
+import time
+
+from resalloc_ibm_cloud.deadline import current_deadline
+from resalloc_ibm_cloud.exceptions import PowerVSException, PowerVSNotFoundException
+from resalloc_ibm_cloud.helpers import ssh_banner_received
+from resalloc_ibm_cloud.state import StateFile
+
+logger = logging.getLogger(__name__)
+
+SIGNALS = ("active", "rmc", "ssh")
+
+# how often we try to connect to the SSH port
+SSH_PROBE_INTERVAL = 5
+
+
+def parse_ready_when(spec: str) -> list[frozenset]:
+    """
+    Parse the --ready-when specification, a comma separated list of
+    alternatives.  Each alternative is a "+" separated list of signals that all
+    need to be satisfied, e.g. "active+rmc,active+ssh".
+    """
+    combinations = []
+    for alternative in spec.split(","):
+        signals = frozenset(s.strip() for s in alternative.split("+") if s.strip())
+        unknown = signals - set(SIGNALS)
+        if not signals or unknown:
+            raise PowerVSException(f"Invalid --ready-when alternative '{alternative}'")
+        combinations.append(signals)
+    return combinations
+
+
+def _combination_name(combination: frozenset) -> str:
+    return "+".join(sorted(combination))
+
+
+class ReadinessWatcher:
+    """
+    Poll the instance status (and RMC health) from the API, while probing the
+    SSH port in a background thread.
+    """
+
+    def __init__(self, client, vm_manager, combinations: list[frozenset],
+                 state_dir: str) -> None:
+        self.client = client
+        self.vm_manager = vm_manager
+        self.combinations = combinations
+        self.state = StateFile(state_dir, f"readiness-{client.cloud_instance_id}")
+        self._ip_address = None
+        self._ssh_ready = threading.Event()
+        self._stop = threading.Event()
+
+    def _probe_ssh(self) -> None:
+        while not self._stop.is_set():
+            if self._ip_address and ssh_banner_received(self._ip_address):
+                logger.info("SSH is reachable on %s", self._ip_address)
+                self._ssh_ready.set()
+                return
+            self._stop.wait(SSH_PROBE_INTERVAL)
+
+    def _satisfied_signals(self, instance: dict) -> set:
+        signals = set()
+        if instance.get("status") == "ACTIVE":
+            signals.add("active")
+        if instance.get("health", {}).get("status") == "OK":
+            signals.add("rmc")
+        if self._ssh_ready.is_set():
+            signals.add("ssh")
+        return signals
+
+    def _record_win(self, combination: frozenset, elapsed: float) -> None:
+        name = _combination_name(combination)
+        logger.info("Instance is ready (%s) after %.0fs", name, elapsed)
+        with self.state.update() as data:
+            stats = data.setdefault(name, {"wins": 0, "seconds": 0})
+            stats["wins"] += 1
+            stats["seconds"] += elapsed
+
+    def wait(self, instance_id: str, timeout: int, interval: int) -> dict:
+        """
+        Wait till one of the combinations of signals is satisfied, and return
+        the last instance information obtained from the API.  The TIMEOUT
+        is limited by the --deadline budget.
+        """
+        timeout = current_deadline().timeout(timeout)
+        need_ssh = any("ssh" in combination for combination in self.combinations)
+        prober = threading.Thread(target=self._probe_ssh, daemon=True)
+        start_time = time.time()
+        try:
+            while True:
+                if time.time() - start_time > timeout:
+                    raise TimeoutError(
+                        f"Instance did not become ready within {timeout} seconds"
+                    )
+
+                instance = self.client.get_instance(instance_id)
+                status = instance.get("status")
+                logger.info("Instance status: %s, health: %s", status,
+                            instance.get("health", {}).get("status"))
+                if status in ["ERROR", "FAILED"]:
+                    raise RuntimeError(f"Instance creation failed with status: {status}")
+
+                if need_ssh and not self._ip_address:
+                    try:
+                        self._ip_address = self.vm_manager.extract_ip_address(instance)
+                        prober.start()
+                    except PowerVSNotFoundException:
+                        logger.debug("IP address not found (yet?) for instance %s",
+                                     instance_id)
+
+                satisfied = self._satisfied_signals(instance)
+                for combination in self.combinations:
+                    if combination <= satisfied:
+                        self._record_win(combination, time.time() - start_time)
+                        return instance
+
+                if self._ssh_ready.is_set():
+                    current_deadline().sleep(interval)
+                else:
+                    # wake up as soon as SSH becomes reachable
+                    self._ssh_ready.wait(current_deadline().timeout(interval))
+        finally:
+            self._stop.set()
@@ -0,0 +1,45 @@
+"""
+Compact representation of the PowerVS listing items.  We only keep the fields
+we actually use, so large workspaces don't cost us much memory.
+"""
+
+
+class PowerVSInstance:
+    """An item of the /pvm-instances listing"""
+
+    __slots__ = ("id", "name", "status", "created", "volume_ids", "ips")
+
+    def __init__(self, data: dict) -> None:
+        self.id = data["pvmInstanceID"]
+        self.name = data["serverName"]
+        self.status = data.get("status", "")
+        self.created = data.get("creationDate")
+        self.volume_ids = tuple(data.get("volumeIDs") or ())
+        self.ips = tuple(
+            network["ip"] for network in data.get("networks") or ()
+            if network.get("ip")
+        )
+
+    def __repr__(self) -> str:
+        return f"<PowerVSInstance {self.name} ({self.id}) {self.status}>"
+
+
+class PowerVSVolume:  # pylint: disable=too-many-instance-attributes
+    """An item of the /volumes listing"""
+
+    __slots__ = ("id", "name", "state", "created", "instance_ids", "size",
+                 "disk_type", "pool", "bootable")
+
+    def __init__(self, data: dict) -> None:
+        self.id = data["volumeID"]
+        self.name = data["name"]
+        self.state = data.get("state", "")
+        self.created = data.get("creationDate")
+        self.instance_ids = tuple(data.get("pvmInstanceIDs") or ())
+        self.size = data.get("size")
+        self.disk_type = data.get("diskType")
+        self.pool = data.get("volumePool")
+        self.bootable = data.get("bootable", False)
+
+    def __repr__(self) -> str:
+        return f"<PowerVSVolume {self.name} ({self.id}) {self.state}>"
@@ -0,0 +1,234 @@
+"""
+Warm standby pool of PowerVS instances.  Starting a PowerVS instance takes 10+
+minutes, so we keep a few instances booted and provisioned in advance, and the
+create command just claims (renames) one of them.
+"""
+
+import copy
+import fcntl
+import logging
+import os
+import time
+import uuid
+from typing import Any, Optional
+
+from resalloc_ibm_cloud.argparsers import options_argv, powervs_arg_parser
+from resalloc_ibm_cloud.deadline import current_deadline
+from resalloc_ibm_cloud.exceptions import (
+    PowerVSCapacityException,
+    PowerVSNotFoundException,
+)
+from resalloc_ibm_cloud.helpers import run_concurrently, spawn_background
+from resalloc_ibm_cloud.powervs.records import PowerVSInstance
+from resalloc_ibm_cloud.state import StateFile
+
+logger = logging.getLogger(__name__)
+
+# For how long (seconds) a standby instance picked by the create command is
+# protected from being deleted by prewarm, before it gets renamed
+CLAIM_TIMEOUT = 600
+
+
+class StandbyPool:
+    """
+    The standby instances are named "<standby_prefix>-<random suffix>".  Only
+    the fully provisioned ones are recorded in the local state file, so the
+    create command never claims an instance that is still being prepared,
+    and only these count as standby instances.
+    """
+
+    def __init__(self, vm_manager, state_dir: str, options: Any) -> None:
+        self.vm_manager = vm_manager
+        self.client = vm_manager.client
+        self.options = options
+        self.prefix = options.standby_prefix
+        workspace = self.client.cloud_instance_id
+        self.state = StateFile(state_dir, f"standby-{workspace}-{self.prefix}")
+        self.prewarm_lock_path = self.state.path + ".prewarm.lock"
+        self.log_path = self.state.path + ".log"
+
+    def _list_standby_instances(self) -> list[PowerVSInstance]:
+        return [
+            instance for instance in self.client.list_instances()
+            if instance.name.startswith(self.prefix + "-")
+        ]
+
+    def _rename_instance_with_volumes(self, instance_id: str, old_name: str,
+                                      new_name: str) -> None:
+        self.client.update_instance(instance_id, {"serverName": new_name})
+        for volume in self.client.list_volumes():
+            if not volume.name.startswith(old_name):
+                continue
+            self.client.update_volume(
+                volume.id,
+                json_data={"name": new_name + volume.name[len(old_name):]},
+            )
+
+    def _discard(self, *names: str) -> None:
+        """
+        Delete the (unusable) standby instance known under any of the NAMES,
+        so it doesn't occupy the standby slot forever
+        """
+        with current_deadline().cleanup():
+            for name in names:
+                try:
+                    self.vm_manager.delete_vm(name)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    logger.exception("Failed to delete standby instance %s", name)
+
+    def claim(self, name: str) -> Optional[str]:
+        """
+        Rename one of the ready standby instances to NAME, and return its IP
+        address.  Return None if there's no standby instance available.  The
+        unusable standby instances met on the way are deleted.
+        """
+        while True:
+            with self.state.update() as data:
+                ready = data.setdefault("ready", [])
+                if not ready:
+                    logger.info("No standby instance available")
+                    return None
+                standby_name = ready.pop(0)
+                # not ready anymore, but prewarm must not delete it
+                data.setdefault("claiming", {})[standby_name] = time.time()
+
+            try:
+                ip_address = self._claim_one(standby_name, name)
+            finally:
+                with self.state.update() as data:
+                    data.setdefault("claiming", {}).pop(standby_name, None)
+            if ip_address:
+                return ip_address
+
+    def _claim_one(self, standby_name: str, name: str) -> Optional[str]:
+        instance_id = None
+        for instance in self._list_standby_instances():
+            if instance.name == standby_name:
+                instance_id = instance.id
+                break
+
+        if not instance_id:
+            logger.warning("Standby instance %s disappeared", standby_name)
+            return None
+
+        instance = self.client.get_instance(instance_id)
+        if instance.get("status") != "ACTIVE":
+            logger.warning("Standby instance %s is %s, deleting", standby_name,
+                           instance.get("status"))
+            self._discard(standby_name)
+            return None
+
+        try:
+            ip_address = self.vm_manager.extract_ip_address(instance)
+        except PowerVSNotFoundException:
+            logger.warning("Standby instance %s has no IP address, deleting",
+                           standby_name)
+            self._discard(standby_name)
+            return None
+
+        logger.info("Claiming standby instance %s as %s", standby_name, name)
+        try:
+            self._rename_instance_with_volumes(instance_id, standby_name, name)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Failed to rename standby instance %s to %s",
+                             standby_name, name)
+            # the instance and its volumes may be renamed only partially
+            self._discard(name, standby_name)
+            return None
+        return ip_address
+
+    def _standby_options(self, standby_name: str) -> Any:
+        options = copy.copy(self.options)
+        volumes = []
+        for spec in options.volumes or []:
+            # make sure the volumes are recognizable by the instance name
+            if "{name}" not in spec.split(":")[0]:
+                spec = "{name}_" + spec
+            volumes.append(spec.replace("{name}", standby_name))
+        options.volumes = volumes
+        return options
+
+    def _prepare_one(self, standby_name: str) -> bool:
+        options = self._standby_options(standby_name)
+        try:
+            plan = self.vm_manager.plan_vm(standby_name, options)
+        except PowerVSCapacityException:
+            # nothing allocated yet, nothing to delete
+            logger.exception("No capacity for standby instance %s", standby_name)
+            return False
+
+        try:
+            self.vm_manager.create_vm(standby_name, options, plan)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Failed to prepare standby instance %s", standby_name)
+            with current_deadline().cleanup():
+                self.vm_manager.delete_vm(standby_name)
+            return False
+
+        with self.state.update() as data:
+            data.setdefault("ready", []).append(standby_name)
+        logger.info("Standby instance %s is ready", standby_name)
+        return True
+
+    def _ready_instances(self) -> list[str]:
+        """
+        Return names of the ready standby instances.  The other standby
+        instances (failed, or abandoned by a crashed prewarm) are deleted,
+        so they don't occupy the standby slots.  Must be called with the
+        prewarm lock held, so none of them is being prepared right now.
+        """
+        data = self.state.read()
+        ready = set(data.get("ready", []))
+        now = time.time()
+        claiming = {standby_name for standby_name, since
+                    in data.get("claiming", {}).items()
+                    if now - since < CLAIM_TIMEOUT}
+
+        existing = []
+        for instance in self._list_standby_instances():
+            if instance.name in ready:
+                existing.append(instance.name)
+            elif instance.name not in claiming:
+                logger.warning("Standby instance %s is %s and not ready, deleting",
+                               instance.name, instance.status)
+                self._discard(instance.name)
+        return existing
+
+    def prewarm(self) -> None:
+        """
+        Start and provision the missing standby instances, so there are
+        options.standby_count of them.  Only one prewarm process per standby
+        pool runs at a time, others exit immediately.
+        """
+        os.makedirs(os.path.dirname(self.prewarm_lock_path), exist_ok=True)
+        with open(self.prewarm_lock_path, "a", encoding="utf-8") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("Standby pool %s is already being replenished", self.prefix)
+                return
+
+            self.vm_manager.preflight_check(self.options)
+            while True:
+                ready = self._ready_instances()
+                missing = self.options.standby_count - len(ready)
+                logger.info("Standby pool %s has %s ready instances, %s missing",
+                            self.prefix, len(ready), max(missing, 0))
+                if missing <= 0:
+                    return
+
+                names = [f"{self.prefix}-{uuid.uuid4().hex[:8]}"
+                         for _ in range(missing)]
+                if not any(run_concurrently(self._prepare_one, names)):
+                    logger.error("No standby instance could be prepared, giving up")
+                    return
+
+    def replenish_in_background(self) -> None:
+        """
+        Start a detached "prewarm" process with the options of this standby
+        pool.
+        """
+        args = options_argv(powervs_arg_parser(), "prewarm", self.options)
+        logger.info("Replenishing the standby pool %s in background", self.prefix)
+        spawn_background("resalloc_ibm_cloud.powervs.powervs_vm", args,
+                         self.log_path)
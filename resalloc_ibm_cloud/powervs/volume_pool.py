@@ -0,0 +1,202 @@
+"""
+Pool of detached PowerVS data volumes kept for re-use.  Creating volumes for a
+new instance, and deleting them together with the old one, is the slowest and
+flakiest part of the instance life-cycle in PowerVS.  So the delete command
+can move the data volumes into the pool (rename them) instead, and the create
+command attaches a matching pooled volume instead of creating a new one.
+"""
+
+import fcntl
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Optional
+
+import requests
+
+from resalloc_ibm_cloud.argparsers import options_argv, powervs_arg_parser
+from resalloc_ibm_cloud.deadline import current_deadline
+from resalloc_ibm_cloud.exceptions import PowerVSException
+from resalloc_ibm_cloud.helpers import spawn_background
+from resalloc_ibm_cloud.powervs.records import PowerVSVolume
+from resalloc_ibm_cloud.state import StateFile
+
+logger = logging.getLogger(__name__)
+
+# For how long (seconds) a volume picked by the create command is hidden from
+# other concurrent create commands, before it gets renamed
+CLAIM_TIMEOUT = 600
+
+
+class VolumePool:
+    """
+    Pooled volumes are named "<volume_pool_prefix>-<random suffix>", and are
+    matched by (storage pool, size, disk type) with the requested volumes.
+    Only the volumes wiped by the --volume-pool-wipe-command are pooled, so
+    it is mandatory.
+    """
+
+    def __init__(self, client, state_dir: str, options: Any) -> None:
+        if not options.volume_pool_wipe_command:
+            raise PowerVSException(
+                "--volume-pool-wipe-command is required with --volume-pool-prefix")
+        self.client = client
+        self.options = options
+        self.prefix = options.volume_pool_prefix
+        self.wipe_command = options.volume_pool_wipe_command
+        workspace = client.cloud_instance_id
+        self.state = StateFile(state_dir, f"volume-pool-{workspace}-{self.prefix}")
+        self.trim_lock_path = self.state.path + ".trim.lock"
+        self.log_path = self.state.path + ".log"
+
+    def _list_pooled_volumes(self) -> list[PowerVSVolume]:
+        return [
+            volume for volume in self.client.list_volumes()
+            if volume.name.startswith(self.prefix + "-")
+        ]
+
+    @staticmethod
+    def _matches(volume: PowerVSVolume, spec: dict) -> bool:
+        if volume.state != "available" or volume.instance_ids:
+            return False
+        if float(volume.size or 0) != float(spec["size"]):
+            return False
+        if spec.get("volumePool") and volume.pool != spec["volumePool"]:
+            return False
+        if spec.get("diskType") and volume.disk_type != spec["diskType"]:
+            return False
+        return True
+
+    def claim(self, spec: dict) -> Optional[str]:
+        """
+        Find a pooled volume matching the volume creation body SPEC, rename it
+        to spec["name"] and return its ID.  Return None if there's none.
+        """
+        # list before locking, not to block the concurrent claims
+        candidates = [volume for volume in self._list_pooled_volumes()
+                      if self._matches(volume, spec)]
+        now = time.time()
+        with self.state.update() as data:
+            claimed = data.setdefault("claimed", {})
+            for volume_id, timestamp in list(claimed.items()):
+                if now - timestamp > CLAIM_TIMEOUT:
+                    del claimed[volume_id]
+
+            for volume in candidates:
+                if volume.id not in claimed:
+                    claimed[volume.id] = now
+                    break
+            else:
+                logger.info("No pooled volume matches %s", spec["name"])
+                return None
+
+        logger.info("Re-using pooled volume %s as %s", volume.name, spec["name"])
+        self.client.update_volume(volume.id, json_data={"name": spec["name"]})
+        return volume.id
+
+    def wipe(self, ip_address: str) -> bool:
+        """
+        Run the --volume-pool-wipe-command on the instance (before its volumes
+        are detached).  Return False if the volumes must not be re-used.
+        """
+        if not self.wipe_command:
+            return False
+        cmd = ["ssh", "-o", "StrictHostKeyChecking=no",
+               "-o", "UserKnownHostsFile=/dev/null",
+               f"root@{ip_address}", self.wipe_command]
+        try:
+            subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=sys.stderr,
+                           check=True, timeout=current_deadline().timeout(300))
+        except (OSError, subprocess.SubprocessError):
+            logger.exception("Can not wipe the volumes on %s", ip_address)
+            return False
+        return True
+
+    def release(self, volume: PowerVSVolume) -> bool:
+        """
+        Move the detached data VOLUME into the pool.  Return False if it can
+        not be pooled (and should be deleted).
+        """
+        new_name = f"{self.prefix}-{uuid.uuid4().hex[:8]}"
+        try:
+            self.client.update_volume(volume.id, json_data={"name": new_name})
+        except requests.RequestException:
+            logger.exception("Can not move volume %s to the pool", volume.name)
+            return False
+        logger.info("Volume %s moved to the pool as %s", volume.name, new_name)
+        return True
+
+    def _wait_for_detached(self, volume_ids: set[str], timeout: int = 180,
+                           interval: int = 10) -> set[str]:
+        detached = set()
+        deadline = time.time() + current_deadline().timeout(timeout)
+        while True:
+            for volume in self.client.list_volumes():
+                if volume.id in volume_ids and not volume.instance_ids \
+                        and volume.state == "available":
+                    detached.add(volume.id)
+            if detached == volume_ids or time.time() > deadline:
+                return detached
+            time.sleep(interval)
+
+    def release_detached(self, volumes: list[PowerVSVolume]) -> list[str]:
+        """
+        Wait till the (detaching) VOLUMES are detached, and move them into the
+        pool.  Return IDs of the volumes that could not be pooled, and should
+        be deleted.
+        """
+        try:
+            detached = self._wait_for_detached({volume.id for volume in volumes})
+        except requests.RequestException:
+            logger.exception("Can not check the volumes are detached")
+            detached = set()
+        return [volume.id for volume in volumes
+                if volume.id not in detached or not self.release(volume)]
+
+    def trim(self) -> None:
+        """
+        Delete the pooled volumes exceeding --volume-pool-size of each (storage
+        pool, size, disk type) kind, the oldest first.  Only one trim process
+        per pool runs at a time, others exit immediately.
+        """
+        os.makedirs(os.path.dirname(self.trim_lock_path), exist_ok=True)
+        with open(self.trim_lock_path, "a", encoding="utf-8") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("Volume pool %s is already being trimmed", self.prefix)
+                return
+
+            claimed = self.state.read().get("claimed", {})
+            kinds = {}
+            for volume in self._list_pooled_volumes():
+                if volume.id in claimed or volume.instance_ids:
+                    continue
+                key = (volume.pool, volume.size, volume.disk_type)
+                kinds.setdefault(key, []).append(volume)
+
+            for key, volumes in kinds.items():
+                volumes.sort(key=lambda volume: volume.created or "")
+                excess = len(volumes) - self.options.volume_pool_size
+                logger.info("Volume pool %s has %s volumes of %s", self.prefix,
+                            len(volumes), key)
+                for volume in volumes[:max(excess, 0)]:
+                    try:
+                        self.client.delete_volume(volume.id)
+                    except requests.RequestException:
+                        # the next trim will try again
+                        logger.exception("Can not delete pooled volume %s",
+                                         volume.name)
+
+    def trim_in_background(self) -> None:
+        """
+        Start a detached "trim-volume-pool" process with the options of this
+        volume pool.
+        """
+        args = options_argv(powervs_arg_parser(), "trim-volume-pool", self.options)
+        logger.info("Trimming the volume pool %s in background", self.prefix)
+        spawn_background("resalloc_ibm_cloud.powervs.powervs_vm", args,
+                         self.log_path)
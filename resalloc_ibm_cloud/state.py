@@ -0,0 +1,76 @@
+"""
+Local state files shared by concurrently running resalloc-ibm-cloud scripts.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+def default_state_dir():
+    """
+    The default directory for keeping the local state files.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "resalloc-ibm-cloud")
+
+
+class StateFile:
+    """
+    A JSON dictionary stored in a file.  Resalloc runs many instances of our
+    scripts in parallel, so every access is protected by a file lock.
+    """
+
+    def __init__(self, state_dir, name):
+        self.path = os.path.join(state_dir, name + ".json")
+        self.lock_path = self.path + ".lock"
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as fd:
+                return json.load(fd)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            log.warning("Corrupted state file %s, starting from scratch", self.path)
+            return {}
+
+    def _save(self, data):
+        directory = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+            json.dump(data, tmp, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def _lock(self, mode):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.lock_path, "a", encoding="utf-8") as lock:
+            fcntl.flock(lock, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read(self):
+        """
+        Return a snapshot of the stored dictionary.
+        """
+        with self._lock(fcntl.LOCK_SH):
+            return self._load()
+
+    @contextmanager
+    def update(self):
+        """
+        Exclusively lock the file, yield the stored dictionary for in-place
+        modification, and store it back.
+        """
+        with self._lock(fcntl.LOCK_EX):
+            data = self._load()
+            yield data
+            self._save(data)
@@ -0,0 +1,217 @@
+"""
+Batched attachment of the user tags to the created VPC resources.  The
+Global Tagging API accepts many resource CRNs per "attach" call, so instead of
+one blocking round trip per instance, the create commands put the CRN into a
+spool directory (shared by the concurrently running processes), and whoever
+flushes the spool first attaches the tags to all the queued resources at once.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+import backoff
+import requests
+
+from resalloc_ibm_cloud.codec import response_json
+from resalloc_ibm_cloud.constants import (
+    REQUEST_TIMEOUT,
+    TAGGING_BATCH_SIZE,
+    TAGGING_FAILED_TTL,
+    TAGGING_FLUSH_DEADLINE,
+)
+from resalloc_ibm_cloud.deadline import current_deadline
+from resalloc_ibm_cloud.exceptions import TaggingException
+from resalloc_ibm_cloud.transport import get_transport
+
+log = logging.getLogger(__name__)
+
+ATTACH_URL = "https://tags.global-search-tagging.cloud.ibm.com/v3/tags/attach?tag_type=user"
+
+
+def _is_permanent_error(exception):
+    response = getattr(exception, "response", None)
+    if response is None:
+        return False
+    return 400 <= response.status_code < 500 and response.status_code != 429
+
+
+class TaggingQueue:
+    """
+    Spool of the (CRN, tags) pairs waiting for the attach call, in the
+    "tagging-spool-<API key hash>" sub-directory of STATE_DIR, so only the
+    processes using the same account (and token) share it.  The
+    AUTHENTICATOR provides the API token.
+    """
+
+    def __init__(self, state_dir: str, authenticator) -> None:
+        self.authenticator = authenticator
+        key_hash = hashlib.sha256(
+            authenticator.token_manager.apikey.encode("utf-8")).hexdigest()[:16]
+        self.spool = os.path.join(state_dir, f"tagging-spool-{key_hash}")
+        self.pending = os.path.join(self.spool, "pending")
+        self.failed = os.path.join(self.spool, "failed")
+        # tickets enqueued by this process
+        self.tickets = set()
+
+    def enqueue(self, crn: str, tags: list[str]) -> str:
+        """
+        Queue the TAGS for the resource CRN, return the ticket for settle()
+        """
+        os.makedirs(self.pending, exist_ok=True)
+        ticket = str(uuid.uuid4())
+        fd, tmp_path = tempfile.mkstemp(dir=self.pending, prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+            json.dump({"crn": crn, "tags": sorted(tags), "queued": time.time()}, tmp)
+        os.replace(tmp_path, os.path.join(self.pending, ticket + ".json"))
+        self.tickets.add(ticket)
+        return ticket
+
+    @contextmanager
+    def _lock(self):
+        os.makedirs(self.spool, exist_ok=True)
+        with open(os.path.join(self.spool, "lock"), "a", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_pending(self) -> dict:
+        entries = {}
+        for filename in os.listdir(self.pending):
+            if filename.startswith(".") or not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.pending, filename), "r",
+                          encoding="utf-8") as fd:
+                    entries[filename[:-5]] = json.load(fd)
+            except (OSError, ValueError):
+                log.warning("Can not read the tagging spool entry %s", filename)
+        return entries
+
+    def _expire(self) -> None:
+        # the failed results, and the entries abandoned by their processes
+        for directory in self.failed, self.pending:
+            for filename in os.listdir(directory):
+                path = os.path.join(directory, filename)
+                if time.time() - os.path.getmtime(path) > TAGGING_FAILED_TTL:
+                    os.unlink(path)
+
+    @backoff.on_exception(
+        backoff.expo,
+        requests.RequestException,
+        max_time=lambda: current_deadline().timeout(TAGGING_FLUSH_DEADLINE),
+        giveup=_is_permanent_error,
+    )
+    def _attach(self, crns: list[str], tags: list[str]) -> set[str]:
+        """
+        Attach TAGS to the resources CRNS in one call, return the CRNs the
+        tags could not be attached to
+        """
+        headers = {
+            "Accept": "application/json",
+            "Authorization": f"Bearer {self.authenticator.token_manager.get_token()}",
+            "Content-Type": "application/json",
+        }
+        data = {
+            "resources": [{"resource_id": crn} for crn in crns],
+            "tag_names": tags,
+        }
+        response = get_transport().send(
+            "POST", ATTACH_URL, headers=headers, json=data,
+            timeout=current_deadline().request_timeout(REQUEST_TIMEOUT))
+        response.raise_for_status()
+        return {result["resource_id"]
+                for result in response_json(response).get("results", [])
+                if result.get("is_error")}
+
+    def flush(self) -> None:
+        """
+        Attach the tags to all the queued resources, in batches of at most
+        TAGGING_BATCH_SIZE resources with the same tags.  Entries failed due
+        to a temporary error stay queued.  When the whole batch is refused,
+        only the entries of this process are marked as failed.
+        """
+        os.makedirs(self.failed, exist_ok=True)
+        with self._lock():
+            self._expire()
+            batches = defaultdict(list)
+            for ticket, entry in self._load_pending().items():
+                batches[tuple(entry["tags"])].append((ticket, entry["crn"]))
+
+            for tags, entries in batches.items():
+                for start in range(0, len(entries), TAGGING_BATCH_SIZE):
+                    self._flush_batch(list(tags), entries[start:start + TAGGING_BATCH_SIZE])
+
+    def _flush_batch(self, tags: list[str], entries: list[tuple[str, str]]) -> None:
+        log.info("Attaching tags %s to %s resources", ", ".join(tags), len(entries))
+        try:
+            failed = self._attach([crn for _, crn in entries], tags)
+        except requests.RequestException as exc:
+            if not _is_permanent_error(exc):
+                log.error("Can not attach the tags, keeping them queued: %s", exc)
+                return
+            if len(entries) > 1:
+                # one bad resource fails the whole batch; retry ours one by
+                # one, and leave the others to their processes
+                log.warning("Can not attach the tags in batch: %s", exc)
+                for entry in entries:
+                    if entry[0] in self.tickets:
+                        self._flush_batch(tags, [entry])
+                return
+            if entries[0][0] not in self.tickets:
+                log.warning("Can not attach the tags to a resource of another "
+                            "process: %s", exc)
+                return
+            log.error("Can not attach the tags: %s", exc)
+            failed = {crn for _, crn in entries}
+
+        for ticket, crn in entries:
+            path = os.path.join(self.pending, ticket + ".json")
+            if crn in failed:
+                log.error("Can not attach the tags to %s", crn)
+                os.replace(path, os.path.join(self.failed, ticket + ".json"))
+            else:
+                os.unlink(path)
+
+    def flush_in_background(self, linger: float) -> threading.Thread:
+        """
+        Flush the queue in a background thread, after LINGER seconds (so the
+        concurrently created resources get queued, too)
+        """
+        def _flush():
+            time.sleep(linger)
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-exception-caught
+                log.exception("Flushing the tagging queue failed")
+
+        thread = threading.Thread(target=_flush, daemon=True)
+        thread.start()
+        return thread
+
+    def settle(self, ticket: str) -> None:
+        """
+        Make sure the tags queued under TICKET are attached, flush the queue
+        if they are still pending.  Raise TaggingException if they can not be
+        attached.
+        """
+        pending = os.path.join(self.pending, ticket + ".json")
+        if os.path.exists(pending):
+            self.flush()
+
+        failed = os.path.join(self.failed, ticket + ".json")
+        with self._lock():
+            for path in pending, failed:
+                if os.path.exists(path):
+                    os.unlink(path)
+                    raise TaggingException("Can not attach the user tags")
@@ -0,0 +1,265 @@
+"""
+The HTTP transport used by VPCClient and PowerVSClient.  For testing and
+tuning of the retry policies and cleanup paths:
+
+- $RESALLOC_IBM_CLOUD_ENDPOINT (e.g. http://127.0.0.1:8080) redirects all the
+  IBM Cloud API (and IAM) requests to a local stand-in, see
+  tools/api-stand-in.py,
+
+- $RESALLOC_IBM_CLOUD_SCENARIO (path to a JSON file) injects faults into the
+  requests, see FaultInjectionTransport.
+"""
+
+import atexit
+import fnmatch
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+
+from resalloc_ibm_cloud.codec import ACCEPT_ENCODING
+from resalloc_ibm_cloud.constants import HTTP_POOL_SIZE, REQUEST_TIMEOUT
+
+log = logging.getLogger(__name__)
+
+ENDPOINT_ENV = "RESALLOC_IBM_CLOUD_ENDPOINT"
+SCENARIO_ENV = "RESALLOC_IBM_CLOUD_SCENARIO"
+
+
+def endpoint_url(url: str) -> str:
+    """
+    Return URL, with the scheme and host replaced by $RESALLOC_IBM_CLOUD_ENDPOINT
+    if set
+    """
+    endpoint = os.environ.get(ENDPOINT_ENV)
+    if not endpoint:
+        return url
+    parts = urlsplit(url)
+    rest = parts.path + ("?" + parts.query if parts.query else "")
+    return endpoint.rstrip("/") + rest
+
+
+def iam_authenticator(api_key: str) -> IAMAuthenticator:
+    """
+    IAMAuthenticator for the API_KEY, talking to the stand-in if
+    $RESALLOC_IBM_CLOUD_ENDPOINT is set
+    """
+    endpoint = os.environ.get(ENDPOINT_ENV)
+    if endpoint:
+        return IAMAuthenticator(api_key, url=endpoint)
+    return IAMAuthenticator(api_key)
+
+
+class RequestsTransport:
+    """
+    Send the requests using the requests library, through one Session (so the
+    connections are re-used)
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def send(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Perform the request, the KWARGS are passed to Session.request()"""
+        kwargs["headers"] = {"Accept-Encoding": ACCEPT_ENCODING,
+                             **(kwargs.get("headers") or {})}
+        # the callers always pass the timeout
+        # pylint: disable=missing-timeout
+        return self.session.request(method, endpoint_url(url), **kwargs)
+
+    def preconnect(self, url: str) -> None:
+        """
+        Open (TLS) connection to the host of URL, and keep it in the pool for
+        the subsequent requests
+        """
+        parts = urlsplit(endpoint_url(url))
+        try:
+            self.session.head(f"{parts.scheme}://{parts.netloc}/",
+                              timeout=REQUEST_TIMEOUT).close()
+        except requests.RequestException as exc:
+            log.debug("Can not pre-connect to %s: %s", parts.netloc, exc)
+
+
+def _injected_response(method: str, url: str, status: int, body) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.url = url
+    response.headers["Content-Type"] = "application/json"
+    # pylint: disable=protected-access
+    response._content = json.dumps(body).encode("utf-8")
+    response._content_consumed = True
+    response.request = requests.Request(method, url).prepare()
+    return response
+
+
+class FaultInjectionTransport:
+    """
+    Wrap the INNER transport, and inject faults described by the SCENARIO
+    dictionary (usually loaded from a JSON file):
+
+        {
+          "seed": 42,
+          "rules": [
+            {"match": "GET */pvm-instances/*", "latency": 3, "jitter": 1},
+            {"match": "DELETE */volumes/*", "status": 500, "count": 3},
+            {"match": "*", "status": 429, "probability": 0.05},
+            {"match": "GET */volumes", "reset": true, "skip": 2, "count": 1},
+            {"match": "GET */volumes*", "stale": 30,
+             "after": "DELETE */pvm-instances/*/volumes/*"}
+          ],
+          "report": "/tmp/faults.json"
+        }
+
+    Each rule applies to the requests matching the "METHOD URL-PATH" glob
+    "match".  "skip" ignores the first N matching requests, "count" limits the
+    number of affected requests, "probability" makes the rule apply randomly.
+    The rule either adds "latency" (+ random "jitter") seconds, responds with
+    an HTTP "status" (the request is not sent), resets the connection
+    ("reset", requests.ConnectionError), or keeps returning the response
+    body seen before the last request matching "after" for "stale" seconds
+    (eventual consistency).  Call counters are logged at exit, and stored to
+    the "report" file.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, inner, scenario: dict):
+        self.inner = inner
+        self.rules = scenario.get("rules", [])
+        self.report_path = scenario.get("report")
+        self.random = random.Random(scenario.get("seed"))
+        self.lock = threading.Lock()
+        self.matched = [0] * len(self.rules)
+        # rule index -> (time of the last "after" request, {url: stale body})
+        self.stale = {}
+        self.last_bodies = {}
+        self.counters = {"calls": 0, "injected": 0}
+        atexit.register(self.report)
+
+    def _applies(self, index: int, rule: dict) -> bool:
+        self.matched[index] += 1
+        seen = self.matched[index] - rule.get("skip", 0)
+        if seen <= 0:
+            return False
+        if "count" in rule and seen > rule["count"]:
+            return False
+        return self.random.random() < rule.get("probability", 1)
+
+    def _stale_body(self, index: int, rule: dict, request: str, url: str):
+        if fnmatch.fnmatchcase(request, rule["after"]):
+            self.stale[index] = (time.monotonic(), dict(self.last_bodies))
+            return None
+        if not fnmatch.fnmatchcase(request, rule["match"]) or index not in self.stale:
+            return None
+        since, bodies = self.stale[index]
+        if time.monotonic() - since > rule["stale"] or url not in bodies:
+            return None
+        self.matched[index] += 1
+        return bodies[url]
+
+    def send(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Perform the request through the inner transport, inject faults"""
+        request = f"{method} {urlsplit(url).path}"
+        latency = 0
+        with self.lock:
+            self.counters["calls"] += 1
+            for index, rule in enumerate(self.rules):
+                if "stale" in rule:
+                    body = self._stale_body(index, rule, request, url)
+                    if body is not None:
+                        self.counters["injected"] += 1
+                        return _injected_response(method, url, 200, body)
+                    continue
+                if not fnmatch.fnmatchcase(request, rule["match"]):
+                    continue
+                if not self._applies(index, rule):
+                    continue
+                self.counters["injected"] += 1
+                if "status" in rule:
+                    log.debug("Injecting %s to %s", rule["status"], request)
+                    return _injected_response(method, url, rule["status"], {
+                        "errors": [{"code": "injected", "message": "Injected fault"}],
+                    })
+                if rule.get("reset"):
+                    log.debug("Injecting connection reset to %s", request)
+                    raise requests.ConnectionError("Connection reset (injected)")
+                latency += rule.get("latency", 0)
+                latency += self.random.uniform(0, rule.get("jitter", 0))
+
+        if latency:
+            time.sleep(latency)
+        response = self.inner.send(method, url, **kwargs)
+        if method == "GET" and response.ok and self._may_go_stale(request):
+            try:
+                # this reads the whole body even for the streamed responses,
+                # the caller then iterates over the already downloaded content
+                body = response.json()
+            except ValueError:
+                return response
+            with self.lock:
+                self.last_bodies[url] = body
+        return response
+
+    def _may_go_stale(self, request: str) -> bool:
+        return any("stale" in rule and fnmatch.fnmatchcase(request, rule["match"])
+                   for rule in self.rules)
+
+    def preconnect(self, url: str) -> None:
+        """Pre-connect the inner transport (if it can)"""
+        if hasattr(self.inner, "preconnect"):
+            self.inner.preconnect(url)
+
+    def report(self) -> dict:
+        """Log (and store) the call counters, and return them"""
+        with self.lock:
+            report = dict(self.counters, rules=[
+                {"match": rule.get("match"), "matched": matched}
+                for rule, matched in zip(self.rules, self.matched)
+            ])
+        log.info("Fault injection: %s calls, %s faults injected",
+                 report["calls"], report["injected"])
+        if self.report_path:
+            with open(self.report_path, "w", encoding="utf-8") as fd:
+                json.dump(report, fd, indent=1)
+        return report
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    The process-wide transport, a RequestsTransport (wrapped by the
+    FaultInjectionTransport if $RESALLOC_IBM_CLOUD_SCENARIO is set)
+    """
+    global _transport  # pylint: disable=global-statement
+    with _transport_lock:
+        if _transport is None:
+            _transport = RequestsTransport()
+            scenario = os.environ.get(SCENARIO_ENV)
+            if scenario:
+                log.warning("Injecting faults according to %s", scenario)
+                with open(scenario, "r", encoding="utf-8") as fd:
+                    _transport = FaultInjectionTransport(_transport, json.load(fd))
+        return _transport
+
+
+def set_transport(transport: Optional[object]) -> None:
+    """
+    Use TRANSPORT (anything with the RequestsTransport.send() method) for
+    all the requests; None restores the default
+    """
+    global _transport  # pylint: disable=global-statement
+    with _transport_lock:
+        _transport = transport
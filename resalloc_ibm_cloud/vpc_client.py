@@ -0,0 +1,173 @@
+"""
+Minimal IBM Cloud VPC API client (the handful of calls we need).  Importing the
+generated ibm_vpc SDK takes a significant part of the start-up time of our
+short-lived utilities, so the SDK is only loaded for calls not covered here.
+"""
+
+import logging
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from ibm_cloud_sdk_core import ApiException
+from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+
+from resalloc_ibm_cloud.codec import response_json
+from resalloc_ibm_cloud.constants import LIMIT, REQUEST_TIMEOUT
+from resalloc_ibm_cloud.deadline import current_deadline
+from resalloc_ibm_cloud.hedging import HedgingPolicy
+from resalloc_ibm_cloud.transport import endpoint_url, get_transport
+
+log = logging.getLogger(__name__)
+
+
+class VPCResponse:
+    """
+    The subset of ibm_cloud_sdk_core.DetailedResponse we use
+    """
+
+    def __init__(self, result, status_code, headers):
+        self.result = result
+        self.status_code = status_code
+        self.headers = headers
+
+    def get_result(self):
+        """Response JSON (dict)"""
+        return self.result
+
+    def get_status_code(self):
+        """HTTP status code"""
+        return self.status_code
+
+    def get_headers(self):
+        """HTTP response headers"""
+        return self.headers
+
+
+class VPCClient:
+    """
+    Drop-in replacement for ibm_vpc.VpcV1, as far as this project is concerned.
+    Methods not implemented here are transparently delegated to the SDK.
+    """
+
+    def __init__(self, version: str, authenticator: IAMAuthenticator,
+                 hedging: Optional[HedgingPolicy] = None):
+        self.version = version
+        self.authenticator = authenticator
+        self.hedging = hedging
+        self.service_url = None
+        # see get_region_service()
+        self.bootstrap = None
+        self._sdk = None
+
+    def set_service_url(self, service_url: str) -> None:
+        """Set the regional API end-point"""
+        self.service_url = service_url
+
+    def __getattr__(self, name):
+        # Not implemented here, load the (large) SDK
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._sdk_service(), name)
+
+    def _token(self) -> str:
+        if self.bootstrap:
+            return self.bootstrap.token()
+        return self.authenticator.token_manager.get_token()
+
+    def _sdk_service(self):
+        if self._sdk is None:
+            # don't let the SDK wait for the background token exchange
+            self._token()
+            # pylint: disable=import-outside-toplevel
+            from ibm_vpc import VpcV1
+            log.debug("Loading the ibm_vpc SDK")
+            self._sdk = VpcV1(self.version, authenticator=self.authenticator)
+            self._sdk.set_service_url(endpoint_url(self.service_url))
+            self._sdk.set_http_config({"timeout": REQUEST_TIMEOUT})
+        return self._sdk
+
+    def _request(self, method: str, path: str, params: dict = None,
+                 json_data: dict = None) -> VPCResponse:
+        url = self.service_url + path
+        query = {"version": self.version, "generation": 2}
+        query.update(params or {})
+        headers = {
+            "Accept": "application/json",
+            "Authorization": f"Bearer {self._token()}",
+        }
+        log.debug("Request %s %s", method, url)
+        timeout = current_deadline().request_timeout(REQUEST_TIMEOUT)
+
+        def _request():
+            return get_transport().send(method, url, headers=headers, params=query,
+                                        json=json_data, timeout=timeout)
+        if self.hedging:
+            response = self.hedging.send(method, url, _request)
+        else:
+            response = _request()
+        if response.status_code >= 400:
+            raise ApiException(response.status_code, http_response=response)
+        result = response_json(response)
+        return VPCResponse(result, response.status_code, dict(response.headers))
+
+    def list_all(self, path: str, key: str, limit: int = LIMIT) -> list[dict]:
+        """
+        GET all the pages of the PATH collection, and return the list of items
+        stored under KEY.  Use LIMIT=None for collections without paging.
+        """
+        items = []
+        params = {"limit": limit}
+        while True:
+            result = self._request("GET", path, params=params).get_result()
+            items.extend(result.get(key, []))
+            next_href = result.get("next", {}).get("href")
+            if not next_href:
+                return items
+            params = {
+                "limit": limit,
+                "start": parse_qs(urlparse(next_href).query)["start"][0],
+            }
+
+    def list_instances(self, limit: int = None) -> VPCResponse:
+        """GET /instances"""
+        return self._request("GET", "/instances", params={"limit": limit})
+
+    def get_instance(self, instance_id: str) -> VPCResponse:
+        """GET /instances/{id}"""
+        return self._request("GET", f"/instances/{instance_id}")
+
+    def create_instance(self, instance_prototype: dict) -> VPCResponse:
+        """POST /instances"""
+        return self._request("POST", "/instances", json_data=instance_prototype)
+
+    def delete_instance(self, instance_id: str) -> VPCResponse:
+        """DELETE /instances/{id}"""
+        return self._request("DELETE", f"/instances/{instance_id}")
+
+    def add_instance_network_interface_floating_ip(
+            self, instance_id: str, network_interface_id: str, floating_ip_id: str,
+    ) -> VPCResponse:
+        """Associate the floating IP with the instance network interface"""
+        path = (f"/instances/{instance_id}/network_interfaces/"
+                f"{network_interface_id}/floating_ips/{floating_ip_id}")
+        return self._request("PUT", path)
+
+    def list_floating_ips(self, limit: int = None) -> VPCResponse:
+        """GET /floating_ips"""
+        return self._request("GET", "/floating_ips", params={"limit": limit})
+
+    def delete_floating_ip(self, floating_ip_id: str) -> VPCResponse:
+        """DELETE /floating_ips/{id}"""
+        return self._request("DELETE", f"/floating_ips/{floating_ip_id}")
+
+    def list_volumes(self, limit: int = None) -> VPCResponse:
+        """GET /volumes"""
+        return self._request("GET", "/volumes", params={"limit": limit})
+
+    def delete_volume(self, volume_id: str) -> VPCResponse:
+        """DELETE /volumes/{id}"""
+        return self._request("DELETE", f"/volumes/{volume_id}")
+
+    def get_subnet(self, subnet_id: str) -> VPCResponse:
+        """GET /subnets/{id}"""
+        return self._request("GET", f"/subnets/{subnet_id}")
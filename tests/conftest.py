@@ -0,0 +1,71 @@
+"""
+Shared fixtures, the tests talk to the tools/api-stand-in.py server
+"""
+
+import importlib.util
+import os
+import threading
+from argparse import Namespace
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from resalloc_ibm_cloud.powervs.client import PowerVSClient
+from resalloc_ibm_cloud.powervs.credentials import create_powervs_credentials
+from resalloc_ibm_cloud.transport import ENDPOINT_ENV, set_transport
+
+STAND_IN_PATH = os.path.join(os.path.dirname(__file__), "..", "tools",
+                             "api-stand-in.py")
+
+CRN = "crn:v1:bluemix:public:power-iaas:dal10:a/tenant:workspace::"
+
+
+def _load_stand_in_module():
+    spec = importlib.util.spec_from_file_location("api_stand_in", STAND_IN_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(name="stand_in")
+def fixture_stand_in(monkeypatch):
+    """
+    Start the API stand-in on a random port, and point the utilities to it.
+    Instances boot, and volumes detach, immediately.
+    """
+    module = _load_stand_in_module()
+    opts = Namespace(boot_seconds=0, detach_seconds=0, ip="127.0.0.1",
+                     ssh_key_name="stand-in", image_id="stand-in-image",
+                     verbose=False)
+    stand_in = module.StandIn(opts)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), module.handler_class(stand_in))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv(ENDPOINT_ENV, f"http://127.0.0.1:{server.server_port}")
+    set_transport(None)
+    yield stand_in
+    set_transport(None)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(name="client")
+def fixture_client(stand_in):  # pylint: disable=unused-argument
+    """PowerVSClient talking to the stand-in"""
+    return PowerVSClient(create_powervs_credentials("api-key", CRN))
+
+
+def add_instance(stand_in, name, volume_names=()):
+    """
+    Create the instance NAME with the data volumes VOLUME_NAMES attached in
+    the STAND_IN, return the instance ID
+    """
+    volume_ids = []
+    for volume_name in volume_names:
+        _, volume = stand_in.handle("POST", "/pcloud/v1/cloud-instances/workspace/volumes",
+                                    {"name": volume_name, "size": 10})
+        volume_ids.append(volume["volumeID"])
+    _, instance = stand_in.handle(
+        "POST", "/pcloud/v1/cloud-instances/workspace/pvm-instances",
+        {"serverName": name, "volumeIDs": volume_ids},
+    )
+    return instance[0]["pvmInstanceID"]
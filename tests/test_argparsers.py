@@ -0,0 +1,14 @@
+"""
+Command-line parsers
+"""
+
+import pytest
+
+from resalloc_ibm_cloud.argparsers import list_vms_parser
+
+
+def test_list_requires_region():
+    parser = list_vms_parser()
+    assert parser.parse_args(["--token-file", "t", "--region", "a", "b"]).region == ["a", "b"]
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--token-file", "t"])
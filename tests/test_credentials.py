@@ -0,0 +1,36 @@
+"""
+Refreshing the PowerVS credentials
+"""
+
+from resalloc_ibm_cloud.transport import (
+    FaultInjectionTransport,
+    get_transport,
+    set_transport,
+)
+
+
+class RecordingTransport:
+    """Remember the Authorization header of every request"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.tokens = []
+
+    def send(self, method, url, **kwargs):
+        """Record and pass to the inner transport"""
+        self.tokens.append((kwargs.get("headers") or {}).get("Authorization"))
+        return self.inner.send(method, url, **kwargs)
+
+
+def test_request_replayed_with_new_token_after_401(stand_in, client):
+    recording = RecordingTransport(FaultInjectionTransport(get_transport(), {"rules": [
+        {"match": "GET */images", "status": 401, "count": 1},
+    ]}))
+    set_transport(recording)
+
+    client.request("GET", "/images")
+
+    rejected, replayed = recording.tokens
+    assert rejected != replayed
+    assert replayed == f"Bearer {client.credentials.token}"
+    assert stand_in.calls["POST /identity/token"] == 2
@@ -0,0 +1,64 @@
+"""
+Recovery of the PowerVS delete path from the faults injected into the API
+"""
+
+import time
+from argparse import Namespace
+from functools import partialmethod
+
+from resalloc_ibm_cloud.powervs.powervs_vm import PowerVSVMManager
+from resalloc_ibm_cloud.powervs.volume_pool import VolumePool
+from resalloc_ibm_cloud.transport import FaultInjectionTransport, get_transport, set_transport
+
+from conftest import add_instance
+
+VOLUMES = "/pcloud/v1/cloud-instances/workspace/volumes"
+
+
+def _inject(rules):
+    transport = FaultInjectionTransport(get_transport(), {"seed": 42, "rules": rules})
+    set_transport(transport)
+    return transport
+
+
+def test_delete_retries_volume_server_errors(stand_in, client):
+    add_instance(stand_in, "copr-1", ["copr-1_data"])
+    transport = _inject([{"match": "DELETE */workspace/volumes/*", "status": 500,
+                         "count": 2}])
+
+    start = time.monotonic()
+    PowerVSVMManager(client).delete_vm("copr-1")
+    elapsed = time.monotonic() - start
+
+    assert not stand_in.instances
+    assert not stand_in.volumes
+    assert transport.report()["rules"][0]["matched"] == 3
+    # only the last attempt reached the API
+    assert stand_in.calls[f"DELETE {VOLUMES}/{{id}}"] == 1
+    # exponential backoff, 2 + 4 seconds at most
+    assert elapsed < 10
+
+
+def test_delete_waits_for_stale_volume_listing(stand_in, client, tmp_path, monkeypatch):
+    add_instance(stand_in, "copr-1", ["copr-1_data"])
+    monkeypatch.setattr(VolumePool, "wipe", lambda self, ip_address: True)
+    monkeypatch.setattr(VolumePool, "_wait_for_detached",
+                        partialmethod(VolumePool._wait_for_detached, interval=0.2))
+    volume_pool = VolumePool(client, str(tmp_path), Namespace(
+        volume_pool_prefix="pool", volume_pool_size=2,
+        volume_pool_wipe_command="wipefs -a /dev/sdb",
+    ))
+    # the volume still looks in-use for 2 seconds after the detach
+    transport = _inject([{"match": "GET */volumes*", "stale": 2,
+                          "after": "DELETE */pvm-instances/*/volumes/*"}])
+
+    start = time.monotonic()
+    PowerVSVMManager(client, volume_pool).delete_vm("copr-1")
+    elapsed = time.monotonic() - start
+
+    assert not stand_in.instances
+    assert [volume["name"][:5] for volume in stand_in.volumes.values()] == ["pool-"]
+    assert transport.report()["rules"][0]["matched"] > 0
+    assert 2 <= elapsed < 5
+    # the listing before the detach, then polling till the volume is detached
+    assert stand_in.calls[f"GET {VOLUMES}"] >= 2
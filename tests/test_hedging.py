@@ -0,0 +1,21 @@
+"""
+Hedged GET requests
+"""
+
+from resalloc_ibm_cloud.hedging import HedgingPolicy
+
+
+def test_budget_counts_previous_processes(tmp_path):
+    policy = HedgingPolicy(str(tmp_path))
+    policy.threshold("GET /volumes")
+    policy.requests = 1
+    # the first request of a fresh process is not hedged
+    assert not policy._take_budget()  # pylint: disable=protected-access
+
+    with policy.state.update() as data:
+        data["counters"] = {"requests": 99, "hedged": 9}
+    policy = HedgingPolicy(str(tmp_path))
+    policy.threshold("GET /volumes")
+    policy.requests = 1
+    assert policy._take_budget()  # pylint: disable=protected-access
+    assert not policy._take_budget()  # pylint: disable=protected-access
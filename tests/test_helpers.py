@@ -0,0 +1,48 @@
+"""
+Provisioning helpers
+"""
+
+import json
+import logging
+import os
+
+from resalloc_ibm_cloud.helpers import (
+    log_playbook_timing,
+    playbook_remote_user,
+    prune_playbook_timing,
+)
+
+
+def test_playbook_remote_user(tmp_path, monkeypatch):
+    playbook = tmp_path / "playbook.yml"
+    playbook.write_text("- hosts: all\n  tasks: []\n"
+                        "- hosts: all\n  remote_user: fedora\n  tasks: []\n")
+    monkeypatch.setenv("ANSIBLE_REMOTE_USER", "builder")
+    assert playbook_remote_user(str(playbook)) == "fedora"
+
+    playbook.write_text("- hosts: all\n  remote_user: '{{ user }}'\n")
+    assert playbook_remote_user(str(playbook)) == "builder"
+
+    monkeypatch.delenv("ANSIBLE_REMOTE_USER")
+    assert playbook_remote_user(str(playbook)) is None
+
+
+def test_playbook_timing_kept_and_pruned(tmp_path, caplog):
+    directory = tmp_path / "playbook-timing"
+    directory.mkdir()
+    for index in range(4):
+        timing_file = directory / f"vm-{index}.json"
+        timing_file.write_text(json.dumps({"duration": 3.0, "tasks": [
+            {"name": "dnf", "duration": 2.0, "hosts": {"h": {"status": "ok"}}},
+        ]}))
+        os.utime(timing_file, (1000 + index, 1000 + index))
+
+    with caplog.at_level(logging.INFO):
+        log_playbook_timing(str(directory / "vm-3.json"))
+    assert "details in" in caplog.text
+    assert (directory / "vm-3.json").exists()
+
+    prune_playbook_timing(str(directory), keep=2)
+    assert sorted(path.name for path in directory.iterdir()) == \
+        ["vm-2.json", "vm-3.json"]
+    prune_playbook_timing(str(tmp_path / "missing"))
@@ -0,0 +1,53 @@
+"""
+Planning the PowerVS storage pool and networks
+"""
+
+import fcntl
+from argparse import Namespace
+
+from resalloc_ibm_cloud.powervs.planner import PowerVSPlanner
+from resalloc_ibm_cloud.transport import get_transport, set_transport
+
+
+class LockCheckingTransport:
+    """Check that the state file lock is free while querying the API"""
+
+    def __init__(self, inner, lock_path):
+        self.inner = inner
+        self.lock_path = lock_path
+        self.locked = []
+
+    def send(self, method, url, **kwargs):
+        """Try to take the lock, and pass to the inner transport"""
+        if "/storage-capacity/" in url or "/networks/" in url:
+            with open(self.lock_path, "a", encoding="utf-8") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+                    self.locked.append(False)
+                except BlockingIOError:
+                    self.locked.append(True)
+        return self.inner.send(method, url, **kwargs)
+
+
+def test_plan_queries_capacity_without_lock(stand_in, client, tmp_path):
+    planner = PowerVSPlanner(client, str(tmp_path))
+    checking = LockCheckingTransport(get_transport(), planner.state.lock_path)
+    set_transport(checking)
+
+    options = Namespace(storage_pool=None, storage_type="tier3",
+                        network_id=["net-1|net-2"])
+    pool, networks = planner.plan(options, [{"size": 100}, {"size": 20}])
+
+    assert checking.locked == [False, False, False]
+    data = planner.state.read()
+    assert data["storage_pools"]["pools"][pool]["max_allocation"] == 100000 - 120
+    assert data["networks"][networks[0]]["available"] == 99
+
+    # the cached numbers are used, and the reservations accumulate
+    planner.plan(options, [{"size": 100}])
+    assert len(checking.locked) == 3
+    data = planner.state.read()
+    assert data["storage_pools"]["pools"][pool]["max_allocation"] == 100000 - 220
+    assert sorted(network["available"] for network in data["networks"].values()) \
+        == [99, 99]
@@ -0,0 +1,57 @@
+"""
+Creating PowerVS instances
+"""
+
+import pytest
+
+from resalloc_ibm_cloud.argparsers import powervs_arg_parser
+from resalloc_ibm_cloud.exceptions import (
+    PowerVSCapacityException,
+    PowerVSPreflightException,
+)
+from resalloc_ibm_cloud.powervs.powervs_vm import PowerVSVMManager, start_vm
+
+from conftest import CRN
+
+
+def _create_options(state_dir, *args):
+    return powervs_arg_parser().parse_args([
+        "--token-file", "-", "--crn", CRN, "--state-dir", str(state_dir),
+        "create", "copr-1", "--playbook", str(state_dir / "playbook.yml"),
+        "--ssh-key-name", "stand-in", "--processors", "1", "--ram", "4",
+        "--network-id", "network", *args,
+    ])
+
+
+def test_preflight_failure_allocates_nothing(stand_in, client, tmp_path):
+    options = _create_options(tmp_path, "--image-uuid", "no-such-image")
+    with pytest.raises(PowerVSPreflightException):
+        start_vm(PowerVSVMManager(client), options)
+
+    # no cleanup attempted, there's nothing to clean up
+    assert not [call for call in stand_in.calls
+                if "/pvm-instances" in call or "/volumes" in call]
+
+
+def test_capacity_failure_allocates_nothing(stand_in, client, tmp_path):
+    options = _create_options(tmp_path, "--image-uuid", "stand-in-image",
+                              "--volumes", "{name}_data:200000")
+    with pytest.raises(PowerVSCapacityException):
+        start_vm(PowerVSVMManager(client), options)
+
+    assert not [call for call in stand_in.calls
+                if "/pvm-instances" in call or "/volumes" in call]
+
+
+def test_bake_refuses_existing_image_name(stand_in, client, tmp_path):
+    options = powervs_arg_parser().parse_args([
+        "--token-file", "-", "--crn", CRN, "--state-dir", str(tmp_path),
+        "bake", "--image-name", "stand-in", "--image-uuid", "stand-in-image",
+        "--playbook", str(tmp_path / "playbook.yml"), "--ssh-key-name", "stand-in",
+        "--processors", "1", "--ram", "4", "--network-id", "network",
+    ])
+    with pytest.raises(PowerVSPreflightException):
+        PowerVSVMManager(client).bake_image(options)
+
+    assert not [call for call in stand_in.calls
+                if "/pvm-instances" in call or "/volumes" in call]
@@ -0,0 +1,75 @@
+"""
+Claiming the PowerVS warm standby instances
+"""
+
+import time
+from argparse import Namespace
+
+from resalloc_ibm_cloud.argparsers import powervs_arg_parser
+from resalloc_ibm_cloud.powervs.powervs_vm import PowerVSVMManager
+from resalloc_ibm_cloud.powervs.standby import StandbyPool
+from resalloc_ibm_cloud.transport import FaultInjectionTransport, get_transport, set_transport
+
+from conftest import CRN, add_instance
+
+
+def _pool(client, state_dir, ready):
+    pool = StandbyPool(PowerVSVMManager(client), str(state_dir),
+                       Namespace(standby_prefix="sb"))
+    with pool.state.update() as data:
+        data["ready"] = ready
+    return pool
+
+
+def _names(stand_in):
+    return sorted(instance["serverName"] for instance in stand_in.instances.values())
+
+
+def test_claim_deletes_unusable_standby(stand_in, client, tmp_path):
+    broken_id = add_instance(stand_in, "sb-broken")
+    stand_in.instances[broken_id]["status"] = "ERROR"
+    add_instance(stand_in, "sb-ok", ["sb-ok_data"])
+
+    pool = _pool(client, tmp_path, ["sb-broken", "sb-ok"])
+    assert pool.claim("copr-1") == "127.0.0.1"
+
+    # the broken instance doesn't occupy the standby slot anymore
+    assert _names(stand_in) == ["copr-1"]
+    assert [volume["name"] for volume in stand_in.volumes.values()] == ["copr-1_data"]
+    assert pool.state.read()["ready"] == []
+
+
+def test_claim_deletes_partially_renamed_standby(stand_in, client, tmp_path):
+    add_instance(stand_in, "sb-one", ["sb-one_data"])
+    set_transport(FaultInjectionTransport(get_transport(), {"rules": [
+        {"match": "PUT */volumes/*", "status": 400},
+    ]}))
+
+    pool = _pool(client, tmp_path, ["sb-one"])
+    assert pool.claim("copr-1") is None
+
+    assert not stand_in.instances
+    assert not stand_in.volumes
+
+
+def test_prewarm_counts_only_ready_standby(stand_in, client, tmp_path):
+    add_instance(stand_in, "sb-ready")
+    add_instance(stand_in, "sb-claimed")
+    broken_id = add_instance(stand_in, "sb-broken")
+    stand_in.instances[broken_id]["status"] = "ERROR"
+
+    options = powervs_arg_parser().parse_args([
+        "--token-file", "-", "--crn", CRN, "--state-dir", str(tmp_path),
+        "prewarm", "--playbook", str(tmp_path / "playbook.yml"),
+        "--image-uuid", "stand-in-image", "--ssh-key-name", "stand-in",
+        "--processors", "1", "--ram", "4", "--network-id", "network",
+        "--standby-prefix", "sb",
+    ])
+    pool = StandbyPool(PowerVSVMManager(client), str(tmp_path), options)
+    with pool.state.update() as data:
+        data["ready"] = ["sb-ready"]
+        data["claiming"] = {"sb-claimed": time.time()}
+    pool.prewarm()
+
+    # nothing new started, the broken instance doesn't take the slot
+    assert _names(stand_in) == ["sb-claimed", "sb-ready"]
@@ -0,0 +1,29 @@
+"""
+Batched user tag attachment
+"""
+
+import os
+
+import pytest
+
+from resalloc_ibm_cloud.exceptions import TaggingException
+from resalloc_ibm_cloud.tagging import TaggingQueue
+from resalloc_ibm_cloud.transport import iam_authenticator
+
+
+def test_refused_batch_fails_only_own_entries(stand_in, tmp_path):  # pylint: disable=unused-argument
+    # the stand-in doesn't know the tagging API, every attach call is refused
+    other = TaggingQueue(str(tmp_path), iam_authenticator("api-key"))
+    ours = TaggingQueue(str(tmp_path), iam_authenticator("api-key"))
+    other_ticket = other.enqueue("crn:other", ["app:copr"])
+    our_ticket = ours.enqueue("crn:ours", ["app:copr"])
+
+    with pytest.raises(TaggingException):
+        ours.settle(our_ticket)
+    assert os.path.exists(os.path.join(other.pending, other_ticket + ".json"))
+
+
+def test_spool_per_api_key(tmp_path):
+    first = TaggingQueue(str(tmp_path), iam_authenticator("api-key"))
+    second = TaggingQueue(str(tmp_path), iam_authenticator("other-api-key"))
+    assert first.spool != second.spool
@@ -0,0 +1,275 @@
+#! /usr/bin/python3
+
+"""
+Local in-memory stand-in for the subset of the IBM Cloud APIs (IAM, PowerVS,
+VPC listings) our utilities use.  Point them to it with
+
+    RESALLOC_IBM_CLOUD_ENDPOINT=http://127.0.0.1:8080
+
+and optionally inject faults with $RESALLOC_IBM_CLOUD_SCENARIO (see
+resalloc_ibm_cloud/transport.py), to measure how the retry policies and
+cleanup paths recover.  The per-route call counters are available at
+GET /stand-in/stats, the counters of the error (>= 400) responses at
+GET /stand-in/errors.
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def fake_token():
+    """A JWT the IAMAuthenticator accepts (it only reads exp and iat)"""
+    now = int(time.time())
+    header = _b64(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+    payload = _b64(json.dumps({"iat": now, "exp": now + 3600,
+                               "jti": str(uuid.uuid4())}).encode())
+    signature = _b64(hmac.new(b"stand-in", f"{header}.{payload}".encode(),
+                              hashlib.sha256).digest())
+    return f"{header}.{payload}.{signature}"
+
+
+class StandIn:
+    """
+    In-memory PowerVS workspace (any cloud instance ID) and VPC region
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.lock = threading.Lock()
+        self.instances = {}
+        self.volumes = {}
+        self.images = {opts.image_id: {"imageID": opts.image_id, "name": "stand-in",
+                                       "state": "active"}}
+        # volume ID -> time when it is really detached
+        self.detaching = {}
+        self.calls = Counter()
+        self.errors = Counter()
+
+    def _instance_view(self, instance):
+        ready = time.time() - instance["created"] > self.opts.boot_seconds
+        if instance["status"] == "BUILD" and ready:
+            instance["status"] = "ACTIVE"
+        view = dict(instance, health={"status": "OK" if ready else "WARNING"},
+                    volumeIDs=[volume_id for volume_id, volume in self.volumes.items()
+                               if instance["pvmInstanceID"] in volume["pvmInstanceIDs"]])
+        view["networks"] = [{"ip": self.opts.ip}] if ready else []
+        del view["created"]
+        return view
+
+    def _volume_view(self, volume):
+        until = self.detaching.get(volume["volumeID"])
+        if until and time.time() > until:
+            del self.detaching[volume["volumeID"]]
+            volume["pvmInstanceIDs"] = []
+            volume["state"] = "available"
+        return dict(volume)
+
+    def pvm_instances(self, method, item, rest, body):
+        """/pvm-instances[/ID[/...]]"""
+        # pylint: disable=too-many-return-statements
+        if not item:
+            if method == "POST":
+                instance_id = str(uuid.uuid4())
+                self.instances[instance_id] = {
+                    "pvmInstanceID": instance_id, "serverName": body["serverName"],
+                    "status": "BUILD", "created": time.time(),
+                    "creationDate": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                }
+                for volume_id in body.get("volumeIDs") or []:
+                    self.volumes[volume_id]["pvmInstanceIDs"] = [instance_id]
+                    self.volumes[volume_id]["state"] = "in-use"
+                return 201, [{"pvmInstanceID": instance_id}]
+            return 200, {"pvmInstances": [self._instance_view(instance)
+                                          for instance in self.instances.values()]}
+
+        instance = self.instances.get(item)
+        if not instance:
+            return 404, {"description": "pvm-instance not found"}
+        if rest.startswith("volumes/"):
+            volume_id = rest.split("/")[1]
+            self.detaching[volume_id] = time.time() + self.opts.detach_seconds
+            return 202, {}
+        if rest == "action":
+            instance["status"] = "SHUTOFF" if body["action"] == "stop" else "ACTIVE"
+            return 200, {}
+        if rest == "capture":
+            image_id = str(uuid.uuid4())
+            self.images[image_id] = {"imageID": image_id, "name": body["captureName"],
+                                     "state": "active"}
+            return 202, {}
+        if method == "PUT":
+            instance["serverName"] = body.get("serverName", instance["serverName"])
+            return 200, {}
+        if method == "DELETE":
+            del self.instances[item]
+            for volume_id, volume in list(self.volumes.items()):
+                if item in volume["pvmInstanceIDs"]:
+                    del self.volumes[volume_id]
+            return 200, {}
+        return 200, self._instance_view(instance)
+
+    def volumes_route(self, method, item, body):
+        """/volumes[/ID]"""
+        # pylint: disable=too-many-return-statements
+        if not item:
+            if method == "POST":
+                volume_id = str(uuid.uuid4())
+                self.volumes[volume_id] = {
+                    "volumeID": volume_id, "name": body["name"], "size": body["size"],
+                    "diskType": body.get("diskType", "tier3"),
+                    "volumePool": body.get("volumePool"), "state": "available",
+                    "pvmInstanceIDs": [], "bootable": False,
+                    "creationDate": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                }
+                return 201, {"volumeID": volume_id}
+            return 200, {"volumes": [self._volume_view(volume)
+                                     for volume in self.volumes.values()]}
+
+        volume = self.volumes.get(item)
+        if not volume:
+            return 404, {"description": "volume not found"}
+        volume = self._volume_view(volume)
+        if method == "DELETE":
+            if volume["pvmInstanceIDs"]:
+                return 400, {"description": "volume is in-use"}
+            del self.volumes[item]
+            return 200, {}
+        if method == "PUT":
+            self.volumes[item]["name"] = body.get("name", volume["name"])
+            return 200, {}
+        return 200, volume
+
+    def powervs(self, method, path, body):
+        """Route the PowerVS API request (PATH without the workspace prefix)"""
+        # pylint: disable=too-many-return-statements
+        collection, item, rest = (path.strip("/").split("/", 2) + ["", ""])[:3]
+        if collection == "pvm-instances":
+            return self.pvm_instances(method, item, rest, body)
+        if collection == "volumes":
+            return self.volumes_route(method, item, body)
+        if collection == "images":
+            return 200, {"images": list(self.images.values())}
+        if collection == "storage-capacity":
+            return 200, {"storagePoolsCapacity": [
+                {"poolName": "Tier3-Flash-1", "storageType": "tier3",
+                 "maxAllocationSize": 100000},
+            ]}
+        if collection == "networks":
+            return 200, {"networkID": item, "ipAddressMetrics": {"available": 100}}
+        if collection == "system-pools":
+            return 200, {"s922": {}, "e980": {}}
+        return 404, {"description": f"unknown path {path}"}
+
+    def handle(self, method, path, body):
+        """Return (status, JSON body) for the request, count the calls"""
+        route = re.sub(r"/[0-9a-f-]{32,}", "/{id}", path)
+        status, response = self._handle(method, path, body)
+        with self.lock:
+            self.calls[f"{method} {route}"] += 1
+            if status >= 400:
+                self.errors[f"{method} {route}"] += 1
+        return status, response
+
+    def _handle(self, method, path, body):
+        # pylint: disable=too-many-return-statements
+        with self.lock:
+            if path == "/identity/token":
+                return 200, {"access_token": fake_token(), "refresh_token": "stand-in",
+                             "token_type": "Bearer", "expires_in": 3600,
+                             "expiration": int(time.time()) + 3600}
+            if path == "/stand-in/stats":
+                return 200, dict(self.calls)
+            if path == "/stand-in/errors":
+                return 200, dict(self.errors)
+            match = re.match(r"/pcloud/v1/cloud-instances/[^/]+(/.*)", path)
+            if match:
+                return self.powervs(method, match.group(1), body)
+            if path.startswith("/pcloud/v1/tenants/"):
+                return 200, {"sshKeys": [{"name": self.opts.ssh_key_name}]}
+            match = re.match(r"/v1/(instances|floating_ips|volumes)$", path)
+            if match:
+                return 200, {match.group(1): [], "limit": 100}
+        return 404, {"description": f"unknown path {path}"}
+
+
+def handler_class(stand_in):
+    """HTTP request handler bound to the STAND_IN"""
+
+    class Handler(BaseHTTPRequestHandler):
+        """Dispatch all methods to StandIn.handle()"""
+
+        def _dispatch(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            data = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(data) if data else {}
+            except ValueError:
+                # IAM token requests are form-encoded
+                body = {}
+            status, response = stand_in.handle(self.command, urlsplit(self.path).path,
+                                               body)
+            payload = json.dumps(response).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+        def do_HEAD(self):  # pylint: disable=invalid-name
+            """Pre-connect probes"""
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            if stand_in.opts.verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+def main():
+    """Entrypoint to the script."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--boot-seconds", type=float, default=5,
+                        help="Instances become ACTIVE (with IP) after this time")
+    parser.add_argument("--detach-seconds", type=float, default=10,
+                        help="Volumes stay in-use this long after detach")
+    parser.add_argument("--ip", default="127.0.0.1",
+                        help="IP address reported for the instances")
+    parser.add_argument("--ssh-key-name", default="stand-in")
+    parser.add_argument("--image-id", default="stand-in-image",
+                        help="ID of the stock image available in the workspace")
+    parser.add_argument("--verbose", action="store_true")
+    opts = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", opts.port), handler_class(StandIn(opts)))
+    print(f"Listening on http://127.0.0.1:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
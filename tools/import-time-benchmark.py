@@ -0,0 +1,84 @@
+#! /usr/bin/python3
+
+"""
+Measure the import time of all the entry-point modules (python3 -X importtime)
+and fail if some of them gets too slow, or imports a module known to be heavy
+(like the generated ibm_vpc SDK).
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+GITROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FORBIDDEN_MODULES = ["ibm_vpc"]
+
+
+def entry_point_modules():
+    """
+    Parse the [project.scripts] section of pyproject.toml
+    """
+    modules = []
+    with open(os.path.join(GITROOT, "pyproject.toml"), encoding="utf-8") as fd:
+        in_scripts = False
+        for line in fd:
+            line = line.strip()
+            if line.startswith("["):
+                in_scripts = line == "[project.scripts]"
+                continue
+            match = re.match(r'^\S+\s*=\s*"([\w.]+):\w+"$', line)
+            if in_scripts and match:
+                modules.append(match.group(1))
+    return modules
+
+
+def measure(module):
+    """
+    Return (cumulative import time in ms, set of imported modules)
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=GITROOT, stderr=subprocess.PIPE, check=True, text=True,
+    ).stderr
+    imported = set()
+    cumulative = 0
+    for line in output.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        imported.add(name)
+        if name == module:
+            cumulative = int(parts[1]) / 1000
+    return cumulative, imported
+
+
+def main():
+    """Entrypoint to the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-ms", type=float, default=150,
+                        help="Fail if an entry point imports longer, default %(default)s")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Take the best time of N runs, default %(default)s")
+    opts = parser.parse_args()
+
+    failed = False
+    for module in entry_point_modules():
+        results = [measure(module) for _ in range(opts.repeat)]
+        best = min(time for time, _ in results)
+        forbidden = [m for m in FORBIDDEN_MODULES if m in results[0][1]]
+        status = "OK"
+        if best > opts.max_ms or forbidden:
+            status = "FAIL"
+            failed = True
+        print(f"{status:4} {best:8.1f} ms  {module}"
+              + (f"  (imports {', '.join(forbidden)})" if forbidden else ""))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
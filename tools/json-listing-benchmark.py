@@ -0,0 +1,149 @@
+#! /usr/bin/python3
+
+"""
+Compare peak RSS and CPU time of parsing a large synthetic /pvm-instances
+response: the whole-document json approach (including the debug re-dump we
+used to do), the incremental parser producing compact records, and the
+whole-document decoding by resalloc_ibm_cloud.codec (orjson if installed),
+from the plain and from the gzip-compressed transfer.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+GITROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GITROOT)
+
+# pylint: disable=wrong-import-position
+from resalloc_ibm_cloud import codec
+from resalloc_ibm_cloud.jsonstream import iter_json_array
+from resalloc_ibm_cloud.powervs.records import PowerVSInstance
+
+CHUNK_SIZE = 64 * 1024
+
+
+def synthetic_instance(i):
+    """One listing item, roughly as large as the real ones"""
+    return {
+        "pvmInstanceID": f"{i:08x}-1c2d-4e5f-8a9b-0c1d2e3f4a5b",
+        "serverName": f"copr_builder_ppc64le_{i}",
+        "status": "ACTIVE",
+        "sysType": "s922",
+        "procType": "shared",
+        "processors": 1,
+        "memory": 16,
+        "creationDate": "2025-10-03T12:34:56.000Z",
+        "updatedDate": "2025-10-03T12:45:56.000Z",
+        "health": {"status": "OK", "lastUpdate": "2025-10-03T12:45:56.000Z"},
+        "networks": [{
+            "ip": f"10.0.{i // 250 % 250}.{i % 250}",
+            "ipAddress": f"10.0.{i // 250 % 250}.{i % 250}",
+            "macAddress": "fa:16:3e:00:00:00",
+            "networkID": "6c8b4f5e-0000-0000-0000-000000000000",
+            "networkName": "copr-private-network",
+            "type": "fixed",
+            "version": 4,
+        }],
+        "volumeIDs": [f"{i:08x}-aaaa-bbbb-cccc-000000000001"],
+        "imageID": "d4f5c2e1-0000-0000-0000-000000000000",
+        "storagePool": "Tier3-Flash-1",
+        "storageType": "tier3",
+        "href": f"/pcloud/v1/cloud-instances/abcdef/pvm-instances/{i:08x}",
+        "pinPolicy": "none",
+        "virtualCores": {"assigned": 1, "max": 4, "min": 1},
+        "maxmem": 32, "minmem": 2, "maxproc": 4, "minproc": 0.25,
+        "userTags": ["app:copr", "arch:ppc64le"],
+    }
+
+
+def bench_legacy(path):
+    """What PowerVSClient.request() used to do, including the debug dump"""
+    with open(path, "rb") as fd:
+        resp = json.loads(fd.read())
+    json.dumps(resp, indent=4)
+    return list(resp.get("pvmInstances", []))
+
+
+def bench_stream(path):
+    """Incremental parsing into compact records"""
+    with open(path, "rb") as fd:
+        chunks = iter(lambda: fd.read(CHUNK_SIZE), b"")
+        return [PowerVSInstance(item)
+                for item in iter_json_array(chunks, "pvmInstances")]
+
+
+def bench_codec(path):
+    """Whole-document decoding by the codec"""
+    with open(path, "rb") as fd:
+        resp = codec.loads(fd.read())
+    return [PowerVSInstance(item) for item in resp.get("pvmInstances", [])]
+
+
+def bench_gzip(path):
+    """The same, including the decompression of the gzip transfer"""
+    with gzip.open(path + ".gz", "rb") as fd:
+        resp = codec.loads(fd.read())
+    return [PowerVSInstance(item) for item in resp.get("pvmInstances", [])]
+
+
+MODES = {
+    "legacy": bench_legacy,
+    "stream": bench_stream,
+    "codec": bench_codec,
+    "gzip": bench_gzip,
+}
+
+
+def run_one(mode, path):
+    """Measure one mode, in this (fresh) process"""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.process_time()
+    items = MODES[mode](path)
+    cpu = time.process_time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "items": len(items), "cpu": cpu,
+                      "rss_delta_mb": (peak - baseline) / 1024}))
+
+
+def main():
+    """Entrypoint to the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--run-one", nargs=2, metavar=("MODE", "FILE"),
+                        help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+
+    if opts.run_one:
+        run_one(*opts.run_one)
+        return
+
+    for count in opts.items:
+        with tempfile.NamedTemporaryFile(suffix=".json") as tmp:
+            tmp.write(json.dumps({
+                "pvmInstances": [synthetic_instance(i) for i in range(count)],
+            }).encode("utf-8"))
+            tmp.flush()
+            with open(tmp.name, "rb") as src, gzip.open(tmp.name + ".gz", "wb") as dst:
+                dst.write(src.read())
+            size = os.path.getsize(tmp.name) / 1024 / 1024
+            compressed = os.path.getsize(tmp.name + ".gz") / 1024 / 1024
+            print(f"{count} items, {size:.1f} MiB response ({compressed:.2f} MiB "
+                  f"gzipped), codec backend {codec.BACKEND}")
+            for mode in MODES:
+                output = subprocess.check_output(
+                    [sys.executable, __file__, "--run-one", mode, tmp.name])
+                result = json.loads(output)
+                print(f"  {mode:7} CPU {result['cpu']:6.3f}s  "
+                      f"peak RSS +{result['rss_delta_mb']:7.1f} MiB")
+            os.unlink(tmp.name + ".gz")
+
+
+if __name__ == "__main__":
+    main()
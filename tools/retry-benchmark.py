@@ -0,0 +1,84 @@
+#! /usr/bin/python3
+
+"""
+Measure how long the PowerVS delete path (detach + delete volumes with retries,
+delete the instance) takes to recover from the injected faults, and how many
+API calls it makes.  Requires a running tools/api-stand-in.py.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+GITROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GITROOT)
+
+CRN = "crn:v1:bluemix:public:power-iaas:dal10:a/stand-in:00000000-0000-0000-0000-000000000000::"
+
+
+def _stats(endpoint):
+    return requests.get(endpoint + "/stand-in/stats", timeout=10).json()
+
+
+def run_once(client, manager, opts, name):
+    """
+    Create an instance with opts.volumes attached volumes, and measure its
+    deletion
+    """
+    volume_ids = [
+        client.create_volume({"name": f"{name}-{i}", "size": 10})["volumeID"]
+        for i in range(opts.volumes)
+    ]
+    client.create_instance({"serverName": name, "volumeIDs": volume_ids})
+
+    before = _stats(opts.endpoint)
+    start = time.monotonic()
+    manager.delete_vm(name)
+    elapsed = time.monotonic() - start
+    after = _stats(opts.endpoint)
+
+    calls = {route: count - before.get(route, 0) for route, count in after.items()
+             if count - before.get(route, 0) and "stand-in" not in route}
+    return {"seconds": round(elapsed, 1), "calls": sum(calls.values()),
+            "routes": calls}
+
+
+def main():
+    """Entrypoint to the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--endpoint", default="http://127.0.0.1:8080")
+    parser.add_argument("--scenario", help="Fault injection scenario (JSON)")
+    parser.add_argument("--volumes", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=1)
+    opts = parser.parse_args()
+
+    os.environ["RESALLOC_IBM_CLOUD_ENDPOINT"] = opts.endpoint
+    if opts.scenario:
+        os.environ["RESALLOC_IBM_CLOUD_SCENARIO"] = opts.scenario
+
+    # pylint: disable=import-outside-toplevel
+    from resalloc_ibm_cloud.helpers import setup_logging
+    from resalloc_ibm_cloud.powervs.client import PowerVSClient
+    from resalloc_ibm_cloud.powervs.credentials import create_powervs_credentials
+    from resalloc_ibm_cloud.powervs.powervs_vm import PowerVSVMManager
+    from resalloc_ibm_cloud.transport import get_transport
+
+    setup_logging("warning")
+    client = PowerVSClient(create_powervs_credentials("stand-in", CRN))
+    manager = PowerVSVMManager(client)
+
+    for i in range(opts.repeat):
+        result = run_once(client, manager, opts, f"bench-{os.getpid()}-{i}")
+        print(json.dumps(dict(run=i, **result)))
+
+    transport = get_transport()
+    if hasattr(transport, "report"):
+        print(json.dumps(transport.report()))
+
+
+if __name__ == "__main__":
+    main()
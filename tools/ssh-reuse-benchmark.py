@@ -0,0 +1,81 @@
+#! /usr/bin/python3
+
+"""
+Compare the wall time of a synthetic playbook (many trivial tasks) run against
+a local sshd, (a) the plain way, and (b) multiplexed through an SSH master
+connection with pipelining, the way the create commands provision instances.
+Requires a running sshd accepting key-based login for --user at --host.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+GITROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GITROOT)
+
+# pylint: disable=wrong-import-position
+from resalloc_ibm_cloud.helpers import playbook_environment, ssh_master
+
+
+def write_playbook(path, user, tasks):
+    """Playbook with TASKS trivial tasks"""
+    with open(path, "w", encoding="utf-8") as fd:
+        fd.write(f"- hosts: all\n  remote_user: {user}\n  gather_facts: false\n"
+                 "  tasks:\n")
+        for i in range(tasks):
+            fd.write(f"    - name: task {i}\n      command: /bin/true\n")
+
+
+def run(host, playbook, env):
+    """Return the wall time of one ansible-playbook run"""
+    cmd = ["ansible-playbook", playbook, "--inventory", f"{host},"]
+    start = time.monotonic()
+    subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, check=True)
+    return time.monotonic() - start
+
+
+def main():
+    """Entrypoint to the script."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--user", default=os.environ.get("USER", "root"))
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    opts = parser.parse_args()
+
+    plain_env = os.environ.copy()
+    plain_env.update({
+        "ANSIBLE_HOST_KEY_CHECKING": "False",
+        "ANSIBLE_PIPELINING": "False",
+        "ANSIBLE_SSH_ARGS": "-o ControlMaster=no",
+    })
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        playbook = os.path.join(tmpdir, "playbook.yml")
+        write_playbook(playbook, opts.user, opts.tasks)
+
+        plain = [run(opts.host, playbook, plain_env) for _ in range(opts.repeat)]
+
+        reused = []
+        for _ in range(opts.repeat):
+            start = time.monotonic()
+            with ssh_master(opts.host, user=opts.user) as control_path:
+                if not control_path:
+                    sys.exit("Can not open the SSH master connection")
+                env = playbook_environment(control_path)
+                env["ANSIBLE_HOST_KEY_CHECKING"] = "False"
+                run(opts.host, playbook, env)
+            # count with the master connection set-up, too
+            reused.append(time.monotonic() - start)
+
+    print(f"{opts.tasks} tasks, best of {opts.repeat} runs")
+    print(f"  plain          {min(plain):6.2f}s")
+    print(f"  master+pipe    {min(reused):6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#! /usr/bin/python3
+
+"""
+Replay a resalloc workload (concurrent create, delete and list-vms processes)
+against tools/api-stand-in.py, at accelerated time, and report the throughput,
+p50/p95/p99 latency and error rate per operation, and the API call rate.  The
+real PowerVS entry points are executed as separate processes (sharing one
+--state-dir, like on the resalloc server); resalloc-wait-for-ssh, ssh and
+ansible-playbook are replaced by stubs sleeping for a while.
+
+The schedule is either synthetic (--instances started during --ramp, each
+living --lifetime seconds on average, list-vms every --list-interval), or
+recorded in a JSONL file (--schedule), one event per line:
+
+    {"at": 12.5, "op": "create", "name": "copr_powervs_00001"}
+    {"at": 30, "op": "list"}
+    {"at": 912.1, "op": "delete", "name": "copr_powervs_00001"}
+
+The "at" times (seconds since the start) are divided by --speedup, and so are
+the simulated durations (instance boot, volume detach, SSH, playbook).  A delete
+never starts before the create of the same name finishes.  Use --save-schedule
+to store the synthetic schedule for later replays.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+GITROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CRN = "crn:v1:bluemix:public:power-iaas:dal10:a/stand-in:00000000-0000-0000-0000-000000000000::"
+
+STUB = """#! /bin/sh
+# {name} stub, see tools/stress-harness.py
+sleep {seconds}
+"""
+
+ENTRY_POINTS = {
+    "powervs-vm": "resalloc_ibm_cloud.powervs.powervs_vm",
+    "powervs-list-vms": "resalloc_ibm_cloud.powervs.powervs_list_vms",
+}
+
+
+def synthetic_schedule(opts):
+    """
+    The create/delete events of opts.instances instances, and the periodic
+    list events, sorted by time
+    """
+    rng = random.Random(opts.seed)
+    events = []
+    for i in range(opts.instances):
+        created = rng.uniform(0, opts.ramp)
+        name = f"{opts.pool}_{i:05d}"
+        events.append({"at": created, "op": "create", "name": name})
+        events.append({"at": created + rng.expovariate(1 / opts.lifetime),
+                       "op": "delete", "name": name})
+    end = max((event["at"] for event in events), default=0)
+    events.extend({"at": at, "op": "list"}
+                  for at in range(0, int(end) + 1, opts.list_interval))
+    return sorted(events, key=lambda event: event["at"])
+
+
+def load_schedule(path):
+    """Read the JSONL schedule at PATH"""
+    with open(path, "r", encoding="utf-8") as fd:
+        events = [json.loads(line) for line in fd if line.strip()]
+    return sorted(events, key=lambda event: event["at"])
+
+
+def write_stubs(bindir, opts):
+    """Create the stubs of the external commands in BINDIR"""
+    os.makedirs(bindir)
+    for name, seconds in [("resalloc-wait-for-ssh", opts.ssh_seconds),
+                          ("ssh", 0),
+                          ("ansible-playbook", opts.playbook_seconds)]:
+        path = os.path.join(bindir, name)
+        with open(path, "w", encoding="utf-8") as fd:
+            fd.write(STUB.format(name=name, seconds=seconds / opts.speedup))
+        os.chmod(path, 0o755)
+
+
+def start_stand_in(opts):
+    """Start tools/api-stand-in.py on a free port, return (process, URL)"""
+    cmd = [sys.executable, os.path.join(GITROOT, "tools", "api-stand-in.py"),
+           "--port", "0",
+           "--boot-seconds", str(opts.boot_seconds / opts.speedup),
+           "--detach-seconds", str(opts.detach_seconds / opts.speedup)]
+    # pylint: disable=consider-using-with
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().split()[-1]
+    return process, url
+
+
+def percentile(values, pct):
+    """The PCT percentile of the sorted VALUES (nearest rank), None if empty"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, len(values) * pct // 100)]
+
+
+class Harness:
+    """
+    Run the schedule events as processes of the real entry points
+    """
+
+    def __init__(self, opts, workdir, endpoint):
+        self.opts = opts
+        self.workdir = workdir
+        self.endpoint = endpoint
+        self.created = defaultdict(threading.Event)
+        self.results = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(opts.max_processes)
+
+        self.env = os.environ.copy()
+        self.env["PATH"] = os.path.join(workdir, "bin") + os.pathsep + self.env["PATH"]
+        self.env["PYTHONPATH"] = GITROOT
+        self.env["RESALLOC_IBM_CLOUD_ENDPOINT"] = endpoint
+        if opts.scenario:
+            self.env["RESALLOC_IBM_CLOUD_SCENARIO"] = os.path.abspath(opts.scenario)
+
+        self.token_file = os.path.join(workdir, "token")
+        with open(self.token_file, "w", encoding="utf-8") as fd:
+            fd.write("IBMCLOUD_API_KEY=stand-in\n")
+        self.playbook = os.path.join(workdir, "playbook", "playbook.yml")
+        os.makedirs(os.path.dirname(self.playbook))
+        with open(self.playbook, "w", encoding="utf-8") as fd:
+            fd.write("- hosts: all\n  tasks: []\n")
+
+    def _entry_point(self, name):
+        if self.opts.installed:
+            return ["resalloc-ibm-cloud-" + name]
+        return [sys.executable, "-c", f"from {ENTRY_POINTS[name]} import main; main()"]
+
+    def command(self, event):
+        """The command line for the schedule EVENT"""
+        common = ["--token-file", self.token_file, "--log-level", "info",
+                  "--state-dir", os.path.join(self.workdir, "state")]
+        if event["op"] == "list":
+            return (self._entry_point("powervs-list-vms") + common
+                    + ["--crn", CRN, "--pool", self.opts.pool])
+        cmd = self._entry_point("powervs-vm") + common + ["--crn", CRN]
+        if event["op"] == "delete":
+            return cmd + ["delete", event["name"]]
+        return cmd + [
+            "create", event["name"], "--playbook", self.playbook,
+            "--image-uuid", "stand-in-image", "--ssh-key-name", "stand-in",
+            "--processors", "0.25", "--ram", "4", "--network-id", "stand-in-net",
+            "--volumes", *[f"{{name}}-data{i}:10" for i in range(self.opts.volumes)],
+        ]
+
+    def run_event(self, event, started):
+        """Run the EVENT process, record its result"""
+        if event["op"] == "delete":
+            self.created[event["name"]].wait()
+
+        due = started + event["at"] / self.opts.speedup
+        log_path = os.path.join(self.workdir, "logs",
+                                f"{event['op']}-{event.get('name', '')}-{due:.3f}.log")
+        with self.slots, open(log_path, "w+", encoding="utf-8") as log_file:
+            start = time.monotonic()
+            try:
+                returncode = subprocess.run(
+                    self.command(event), env=self.env, stdout=subprocess.DEVNULL,
+                    stderr=log_file, timeout=self.opts.timeout, check=False,
+                ).returncode
+            except subprocess.TimeoutExpired:
+                returncode = "timeout"
+            end = time.monotonic()
+            log_file.seek(0)
+            tail = log_file.readlines()[-3:] if returncode != 0 else []
+
+        if event["op"] == "create":
+            self.created[event["name"]].set()
+        with self.lock:
+            self.results.append({
+                "op": event["op"], "seconds": end - start, "lag": start - due,
+                "ok": returncode == 0, "log": log_path, "tail": "".join(tail),
+            })
+
+    def replay(self, schedule):
+        """Run all the SCHEDULE events at their (accelerated) time"""
+        os.makedirs(os.path.join(self.workdir, "logs"))
+        started = time.monotonic()
+        # a thread per event, the deletes wait for the creates, and all wait
+        # for a free process slot
+        with ThreadPoolExecutor(max_workers=max(len(schedule), 1)) as executor:
+            for event in schedule:
+                delay = started + event["at"] / self.opts.speedup - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.run_event, event, started)
+        return time.monotonic() - started
+
+
+def make_report(results, wall, calls, errors):
+    """Summarize the RESULTS of the replay taking WALL seconds"""
+    report = {"seconds": round(wall, 1), "operations": {}}
+    for op in sorted({result["op"] for result in results}):
+        mine = [result for result in results if result["op"] == op]
+        latencies = sorted(result["seconds"] for result in mine)
+        failed = [result for result in mine if not result["ok"]]
+        report["operations"][op] = {
+            "count": len(mine),
+            "per_second": round(len(mine) / wall, 2),
+            "error_rate": round(len(failed) / len(mine), 3),
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max_lag": round(max(result["lag"] for result in mine), 2),
+            "failures": [{"log": result["log"], "tail": result["tail"]}
+                         for result in failed][:3],
+        }
+    calls = {route: count for route, count in calls.items() if "stand-in" not in route}
+    report["api"] = {
+        "calls": sum(calls.values()),
+        "per_second": round(sum(calls.values()) / wall, 1),
+        "error_responses": sum(errors.values()),
+        "routes": dict(sorted(calls.items(), key=lambda item: -item[1])),
+    }
+    return report
+
+
+def print_report(report):
+    """Human readable form of the report"""
+    print(f"{'operation':10} {'count':>6} {'ops/s':>7} {'errors':>7} "
+          f"{'p50':>7} {'p95':>7} {'p99':>7} {'lag':>6}")
+    for op, stats in report["operations"].items():
+        print(f"{op:10} {stats['count']:6} {stats['per_second']:7.2f} "
+              f"{stats['error_rate']:7.1%} {stats['p50']:6.1f}s {stats['p95']:6.1f}s "
+              f"{stats['p99']:6.1f}s {stats['max_lag']:5.1f}s")
+    api = report["api"]
+    print(f"\n{api['calls']} API calls in {report['seconds']}s ({api['per_second']}/s), "
+          f"{api['error_responses']} error responses")
+    for route, count in list(api["routes"].items())[:10]:
+        print(f"  {count:6}  {route}")
+    for op, stats in report["operations"].items():
+        for failure in stats["failures"]:
+            print(f"\nfailed {op} ({failure['log']}):\n{failure['tail']}", end="")
+
+
+def main():
+    """Entrypoint to the script."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schedule", help="Recorded schedule (JSONL) to replay")
+    parser.add_argument("--save-schedule", help="Store the replayed schedule (JSONL)")
+    parser.add_argument("--instances", type=int, default=100)
+    parser.add_argument("--ramp", type=float, default=600,
+                        help="The synthetic instances are created during this time")
+    parser.add_argument("--lifetime", type=float, default=1800,
+                        help="Average lifetime of the synthetic instances")
+    parser.add_argument("--list-interval", type=int, default=30)
+    parser.add_argument("--pool", default="copr_powervs")
+    parser.add_argument("--volumes", type=int, default=1,
+                        help="Data volumes per instance")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--speedup", type=float, default=60,
+                        help="Time acceleration factor")
+    parser.add_argument("--boot-seconds", type=float, default=300)
+    parser.add_argument("--detach-seconds", type=float, default=60)
+    parser.add_argument("--ssh-seconds", type=float, default=60)
+    parser.add_argument("--playbook-seconds", type=float, default=600)
+    parser.add_argument("--max-processes", type=int, default=200,
+                        help="Maximum of concurrently running processes")
+    parser.add_argument("--timeout", type=float, default=1800,
+                        help="Kill the processes running longer (not accelerated)")
+    parser.add_argument("--endpoint",
+                        help="URL of a running stand-in, started automatically if unset")
+    parser.add_argument("--scenario", help="Fault injection scenario (JSON)")
+    parser.add_argument("--installed", action="store_true",
+                        help="Run the installed resalloc-ibm-cloud-* commands")
+    parser.add_argument("--workdir", help="Keep the logs and state here")
+    parser.add_argument("--json", help="Store the report (JSON) to this file")
+    opts = parser.parse_args()
+
+    schedule = load_schedule(opts.schedule) if opts.schedule else synthetic_schedule(opts)
+    if opts.save_schedule:
+        with open(opts.save_schedule, "w", encoding="utf-8") as fd:
+            for event in schedule:
+                fd.write(json.dumps(event) + "\n")
+
+    stand_in = None
+    endpoint = opts.endpoint
+    if not endpoint:
+        stand_in, endpoint = start_stand_in(opts)
+
+    with tempfile.TemporaryDirectory(prefix="stress-") as tmpdir:
+        workdir = opts.workdir or tmpdir
+        try:
+            write_stubs(os.path.join(workdir, "bin"), opts)
+            harness = Harness(opts, workdir, endpoint)
+            before = requests.get(endpoint + "/stand-in/stats", timeout=10).json()
+            errors_before = requests.get(endpoint + "/stand-in/errors", timeout=10).json()
+            wall = harness.replay(schedule)
+            calls = requests.get(endpoint + "/stand-in/stats", timeout=10).json()
+            errors = requests.get(endpoint + "/stand-in/errors", timeout=10).json()
+        finally:
+            if stand_in:
+                stand_in.terminate()
+                stand_in.wait()
+
+    report = make_report(
+        harness.results, wall,
+        {route: count - before.get(route, 0) for route, count in calls.items()},
+        {route: count - errors_before.get(route, 0) for route, count in errors.items()},
+    )
+    print_report(report)
+    if opts.json:
+        with open(opts.json, "w", encoding="utf-8") as fd:
+            json.dump(report, fd, indent=1)
+
+
+if __name__ == "__main__":
+    main()